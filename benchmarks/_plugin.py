@@ -0,0 +1,28 @@
+"""
+加载插件模块（插件目录名含连字符，不能直接import）
+
+benchmarks 下的脚本都从仓库根目录运行，
+插件依赖（nonebot2、nonebot-adapter-onebot、Pillow 等）需已安装。
+"""
+import importlib
+import importlib.util
+import os
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+PLUGIN_DIR = REPO_ROOT / "lanota-song-nonebot-plugin"
+PACKAGE_NAME = "lanota_plugin"
+
+def load(module_name):
+    """导入插件子模块，如 load("function")"""
+    # config 中的路径都相对于仓库根目录
+    os.chdir(REPO_ROOT)
+    if PACKAGE_NAME not in sys.modules:
+        spec = importlib.util.spec_from_file_location(
+            PACKAGE_NAME, PLUGIN_DIR / "__init__.py",
+            submodule_search_locations=[str(PLUGIN_DIR)]
+        )
+        # 只注册包对象，不执行 __init__（其中需要已初始化的 NoneBot 驱动）
+        sys.modules[PACKAGE_NAME] = importlib.util.module_from_spec(spec)
+    return importlib.import_module(f"{PACKAGE_NAME}.{module_name}")
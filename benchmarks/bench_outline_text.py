@@ -0,0 +1,71 @@
+"""
+描边文字渲染基准：la table 输出上对比逐偏移九次绘制与 stroke_width 单次绘制
+
+用法（仓库根目录）：
+    python benchmarks/bench_outline_text.py [--repeat 5]
+"""
+import argparse
+import time
+from PIL import Image, ImageDraw
+from _plugin import load
+
+function = load("function")
+tit = load("text_image_text")
+
+def legacy_draw_text(draw, lines, y, canvas_width):
+    """旧实现：每行两次textbbox + 8次偏移描边 + 1次主文字"""
+    for line in lines:
+        if line == "\n":
+            y += tit.font_size + tit.LINE_SPACING
+            continue
+        bbox = draw.textbbox((0, 0), line, font=tit.font)
+        w, h = bbox[2] - bbox[0], bbox[3] - bbox[1]
+        bbox = draw.textbbox((0, 0), line, font=tit.font)
+        x = tit.PADDING
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                if dx != 0 or dy != 0:
+                    draw.text((x + dx, y + dy), line, font=tit.font, fill=(255, 255, 255, 255))
+        draw.text((x, y), line, font=tit.font, fill=(0, 0, 0, 255))
+        y += h + tit.LINE_SPACING
+    return y
+
+def stroke_draw_text(draw, lines, y, canvas_width):
+    """新实现：测量一次 + stroke_width 单次绘制"""
+    metrics = tit.measure_lines(draw, lines)
+    return tit.draw_text(draw, lines, y, canvas_width, center=False, metrics=metrics)
+
+def best_of(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    text = function.build_table_message(function.load_song_data(), function.load_table_data())
+    lines = tit.wrap_text(text, 100)
+
+    dummy = ImageDraw.Draw(Image.new("RGB", (1, 1)))
+    width, height = tit.calculate_content_size(dummy, lines)
+    width += 2 * tit.PADDING
+    height += 2 * tit.PADDING
+
+    def run(draw_func):
+        layer = Image.new("RGBA", (width, height), (0, 0, 0, 0))
+        draw_func(ImageDraw.Draw(layer), lines, tit.PADDING, width)
+
+    legacy = best_of(lambda: run(legacy_draw_text), args.repeat)
+    stroke = best_of(lambda: run(stroke_draw_text), args.repeat)
+    print(f"la table: {len(lines)} 行, 画布 {width}x{height}")
+    print(f"  旧实现(9次绘制): {legacy * 1000:.1f} ms")
+    print(f"  stroke_width:    {stroke * 1000:.1f} ms")
+    print(f"  加速比: {legacy / stroke:.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+"""
+基准测试套件：用 Data/LanotaSongList 下的真实数据测搜索、别名、格式化、渲染与rating/定数表计算
+
+用法（仓库根目录）：
+    python benchmarks/run.py [--repeat 5] [--filter search] [--output result.json] [--compare base.json]
+
+结果以JSON输出（stdout 或 --output），--compare 时额外打印与上次结果的耗时比。
+"""
+import argparse
+import io
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from PIL import Image, ImageDraw
+import PIL
+from _plugin import load, REPO_ROOT
+
+function = load("function")
+tit = load("text_image_text")
+chart_store = load("chart_store")
+
+BENCHMARKS = {}
+
+def benchmark(name):
+    """注册基准：被装饰函数做准备工作并返回待计时的无参函数"""
+    def decorator(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return decorator
+
+# ---------- 查询语料 ----------
+
+def search_corpus(song_data, alias_data, seed=0):
+    """由真实数据生成的查询：章节号、ID、别名、曲名、曲名片段、无结果的词"""
+    rng = random.Random(seed)
+    queries = []
+    for song in song_data:
+        title = song['title']
+        queries += [song['chapter'], str(song['id']), title, title.lower()]
+        if len(title) > 4:
+            start = rng.randrange(len(title) - 3)
+            queries.append(title[start:start + rng.randint(2, 4)])
+    for aliases in alias_data.values():
+        queries += aliases
+    queries += ["zzzz", "不存在的曲子", "1234567"]
+    return queries
+
+def alias_corpus(song_data, alias_data, seed=0):
+    """别名夹在前后缀中的输入，以及直接是曲名/无法匹配的输入"""
+    rng = random.Random(seed)
+    inputs = []
+    for aliases in alias_data.values():
+        for alias in aliases:
+            inputs.append(f"{rng.choice(['', '来首', 'la '])}{alias}{rng.choice(['', '的谱', ' master'])}")
+    inputs += [song['title'] for song in song_data[:100]]
+    inputs += ["什么都不是", "qwertyuiop"]
+    return inputs
+
+# ---------- 基准 ----------
+
+@benchmark("search.find_song_by_search_term")
+def bench_search():
+    song_data = function.load_song_data()
+    alias_data = function.load_alias_data()
+    queries = search_corpus(song_data, alias_data)
+    function.get_search_index()  # 索引在计时外建好
+    def run():
+        for query in queries:
+            function.find_song_by_search_term(query, song_data, alias_data)
+    return run
+
+@benchmark("search.build_index")
+def bench_search_index():
+    song_data = function.load_song_data()
+    alias_data = function.load_alias_data()
+    return lambda: function.SongSearchIndex(song_data, alias_data)
+
+@benchmark("alias.get_alias_name")
+def bench_alias():
+    song_data = function.load_song_data()
+    alias_data = function.load_alias_data()
+    items = {song['title']: song for song in song_data}
+    inputs = alias_corpus(song_data, alias_data)
+    function.get_alias_matcher()
+    def run():
+        for text in inputs:
+            function.get_alias_name(text, items, alias_data)
+    return run
+
+@benchmark("format.format_song_info_all")
+def bench_format():
+    song_data = function.load_song_data()
+    def run():
+        for song in song_data:
+            function.format_song_info(song)
+    return run
+
+@benchmark("render.generate_frame_short")
+def bench_frame_short():
+    text = function.format_song_info(function.load_song_data()[0])
+    return lambda: tit.generate_frame(text, None, None, False, 30)
+
+@benchmark("render.generate_frame_200_lines")
+def bench_frame_long():
+    song_data = function.load_song_data()
+    text = "\n".join(f"{i}. {song['title']} -|- {song['chapter']} ({song['artist']})"
+                     for i, song in enumerate(song_data[:200], 1))
+    return lambda: tit.generate_frame(text, None, None, False, 100)
+
+@benchmark("render.encode_png_200_lines")
+def bench_encode():
+    song_data = function.load_song_data()
+    text = "\n".join(f"{i}. {song['title']}" for i, song in enumerate(song_data[:200], 1))
+    frame = tit.generate_frame(text, None, None, False, 100)
+    return lambda: frame.save(io.BytesIO(), format="PNG")
+
+@benchmark("render.gif_10_frames")
+def bench_gif():
+    # 合成一个10帧的GIF作为输入
+    frames = []
+    for i in range(10):
+        frame = Image.new("RGB", (240, 240), (20 * i, 120, 255 - 20 * i))
+        ImageDraw.Draw(frame).ellipse((10 * i, 10 * i, 10 * i + 80, 10 * i + 80), fill=(255, 255, 255))
+        frames.append(frame)
+    buffer = io.BytesIO()
+    frames[0].save(buffer, format="GIF", save_all=True, append_images=frames[1:], duration=80, loop=0)
+    data = buffer.getvalue()
+    text = function.format_song_info(function.load_song_data()[0])
+    return lambda: tit._process_gif_sync(text, io.BytesIO(data), "GIF", 30, True, None, None)
+
+@benchmark("rating.chart_store_build")
+def bench_chart_store():
+    song_data = function.load_song_data()
+    table_data = function.load_table_data()
+    return lambda: chart_store.ChartStore(song_data, table_data)
+
+@benchmark("rating.level_groups")
+def bench_rating_groups():
+    song_data = function.load_song_data()
+    function.get_chart_store()
+    return lambda: function.get_rating_level_groups(song_data)
+
+@benchmark("rating.calculate_rating_sweep")
+def bench_rating_sweep():
+    song_data = function.load_song_data()
+    charts = [(int(song['notes'][d]), song['difficulty'][d])
+              for song in song_data for d in chart_store.DIFF_TYPES
+              if str(song['notes'].get(d, '')).isdigit()]
+    def run():
+        for notes, level in charts:
+            function.calculate_rating(notes - 3, 2, 1, notes, level)
+    return run
+
+@benchmark("rating.calculate_ratings_batch")
+def bench_rating_batch():
+    song_data = function.load_song_data()
+    charts = [(int(song['notes'][d]), song['difficulty'][d])
+              for song in song_data for d in chart_store.DIFF_TYPES
+              if str(song['notes'].get(d, '')).isdigit()]
+    notes = [n for n, _ in charts]
+    levels = [str(level) for _, level in charts]
+    harmony = [n - 3 for n in notes]
+    tune = [2] * len(notes)
+    fail = [1] * len(notes)
+    return lambda: function.calculate_ratings(harmony, tune, fail, notes, levels)
+
+@benchmark("table.build_uncached")
+def bench_table():
+    song_data = list(function.load_song_data())  # 非目录对象，绕过按版本的缓存
+    table_data = function.load_table_data()
+    return lambda: function.build_table_message(song_data, table_data)
+
+@benchmark("table.build_cached")
+def bench_table_cached():
+    song_data = function.load_song_data()
+    table_data = function.load_table_data()
+    function.build_table_message(song_data, table_data)
+    return lambda: function.build_table_message(song_data, table_data)
+
+# ---------- 运行 ----------
+
+def measure(run, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        samples.append(time.perf_counter() - start)
+    return {
+        "min": min(samples),
+        "median": statistics.median(samples),
+        "mean": statistics.fmean(samples),
+        "repeat": repeat,
+    }
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                                capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    try:
+        import numpy
+        numpy_version = numpy.__version__
+    except ImportError:
+        numpy_version = None
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "pillow": PIL.__version__,
+        "numpy": numpy_version,
+        "commit": commit,
+        "songs": len(function.load_song_data()),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+def print_comparison(results, baseline_path):
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)["results"]
+    print(f"{'benchmark':40} {'base(ms)':>10} {'now(ms)':>10} {'ratio':>7}", file=sys.stderr)
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        ratio = result["min"] / base["min"] if base["min"] else float("inf")
+        print(f"{name:40} {base['min'] * 1000:10.2f} {result['min'] * 1000:10.2f} {ratio:7.2f}", file=sys.stderr)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--filter", default="", help="只运行名称包含该字符串的基准")
+    parser.add_argument("--output", type=Path, help="结果写入文件（默认输出到stdout）")
+    parser.add_argument("--compare", type=Path, help="与之前的结果文件比较")
+    args = parser.parse_args()
+
+    results = {}
+    for name, setup in BENCHMARKS.items():
+        if args.filter not in name:
+            continue
+        run = setup()
+        run()  # 预热
+        results[name] = measure(run, args.repeat)
+        print(f"{name:40} {results[name]['min'] * 1000:10.2f} ms", file=sys.stderr)
+
+    report = json.dumps({"environment": environment(), "results": results}, ensure_ascii=False, indent=2)
+    if args.output:
+        args.output.write_text(report, encoding="utf-8")
+    else:
+        print(report)
+    if args.compare:
+        print_comparison(results, args.compare)
+
+if __name__ == "__main__":
+    main()
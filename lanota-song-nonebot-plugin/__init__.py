@@ -1,6 +1,12 @@
 from nonebot.log import logger
 from nonebot import get_driver
 from .function import *
+from .catalog import song_catalog
+from .user_store import user_store
+from .random_source import random_source
+from .jobs import job_scheduler
+from .perf import perf
+from .text_image_text import init_render_worker
 from .whitelist import *
 from .config import *
 from .changecolor import *
@@ -14,5 +20,25 @@ driver = get_driver()
 async def _():
     # 初始化创建文件
     init_data()
+    # 预加载乐曲目录，之后在后台检查文件变化
+    song_catalog.load()
+    song_catalog.start()
+    # 启动用户数据后台写回
+    user_store.start(user_flush_interval)
+    # 预取真随机数
+    random_source.start()
+    # 按配置启动渲染进程池（在加载完数据后fork，子进程直接继承）
+    if render_backend == "process":
+        job_scheduler.use_process_pool("render", render_processes, init_render_worker)
+    # 定时写出耗时统计
+    perf.start_dump(perf_dump_path, perf_dump_interval)
     logger.info("LanotaBot已开启")
 
+@driver.on_shutdown
+async def _():
+    # 关闭前写回用户数据
+    await user_store.stop()
+    job_scheduler.shutdown()
+    perf.stop_dump()
+    song_catalog.stop()
+
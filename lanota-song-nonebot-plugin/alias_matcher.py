@@ -0,0 +1,112 @@
+from collections import deque
+
+class _Automaton:
+    """Aho–Corasick 自动机，每个节点记录以该位置结尾的最长模式串"""
+
+    def __init__(self):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [None]   # 恰好在此节点结束的模式 (长度, 值)
+        self._best = [None]  # 以此节点为后缀的最长模式 (长度, 值)
+        self._dirty = False
+
+    def add(self, pattern, value):
+        """插入模式串（已存在时保留原值），失配指针在下次查询前补建"""
+        node = 0
+        for ch in pattern:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(None)
+                self._best.append(None)
+            node = nxt
+        if self._out[node] is None:
+            self._out[node] = (len(pattern), value)
+        self._dirty = True
+
+    def _link(self):
+        queue = deque()
+        for child in self._goto[0].values():
+            self._fail[child] = 0
+            self._best[child] = self._out[child]
+            queue.append(child)
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[child] = self._goto[f].get(ch, 0)
+                self._best[child] = self._out[child] or self._best[self._fail[child]]
+                queue.append(child)
+        self._dirty = False
+
+    def scan(self, text):
+        """逐字符扫描，产出 (结束位置, 最长命中)"""
+        if self._dirty:
+            self._link()
+        node = 0
+        for pos, ch in enumerate(text):
+            while node and ch not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(ch, 0)
+            if self._best[node]:
+                yield pos, self._best[node]
+
+class AliasMatcher:
+    """
+    别名匹配器
+
+    对全部别名建立 Aho–Corasick 自动机，一次扫描即可找到输入中
+    最长（同长取最左）的别名；另建一个标准名自动机用于判断输入中
+    是否已经包含标准名。别名只增加时增量插入，出现删除时整体重建。
+    """
+
+    def __init__(self, alias_dict=None):
+        self.version = None
+        self._aliases = {}
+        self._names = set()
+        self._alias_ac = _Automaton()
+        self._name_ac = _Automaton()
+        if alias_dict:
+            self.sync(alias_dict)
+
+    def sync(self, alias_dict):
+        """与别名字典同步"""
+        aliases = {}
+        for std_name, alias_list in alias_dict.items():
+            for alias in alias_list:
+                if alias and alias not in aliases:
+                    aliases[alias] = std_name
+        names = {name for name in alias_dict if name}
+
+        removed = (self._aliases.keys() - aliases.keys()) or (self._names - names)
+        changed = any(self._aliases[a] != aliases[a] for a in self._aliases.keys() & aliases.keys())
+        if removed or changed:
+            self._aliases = {}
+            self._names = set()
+            self._alias_ac = _Automaton()
+            self._name_ac = _Automaton()
+
+        for alias, std_name in aliases.items():
+            if alias not in self._aliases:
+                self._alias_ac.add(alias, std_name)
+                self._aliases[alias] = std_name
+        for name in names - self._names:
+            self._name_ac.add(name, name)
+            self._names.add(name)
+
+    def contains_name(self, text):
+        """输入中是否包含任一标准名"""
+        return next(self._name_ac.scan(text), None) is not None
+
+    def longest_alias(self, text):
+        """返回最长最左的别名命中 (起始位置, 长度, 标准名)，未命中返回None"""
+        best = None
+        for end, (length, std_name) in self._alias_ac.scan(text):
+            if best is None or length > best[1]:
+                best = (end - length + 1, length, std_name)
+        return best
@@ -6,6 +6,7 @@ from nonebot import get_bot
 import asyncio
 import shutil
 from .config import user_path, backup_path, lanota_group
+from .user_store import user_store
 
 async def delayed_backup(delay: float = 5.0):
     """延迟执行备份"""
@@ -34,13 +35,17 @@ async def backup_user_data(bot: Bot = None, group_id: int = None):
         return False
     
     try:
+        # 先把内存中的修改写回，保证备份是最新的
+        await user_store.flush_async()
         backup_path.mkdir(parents=True, exist_ok=True)
         backup_dir = backup_path / f"Backup_{datetime.datetime.now().strftime('%Y%m%d_%H%M')}"
 
         if backup_dir.exists():
             shutil.rmtree(backup_dir)
 
-        shutil.copytree(user_path, backup_dir)
+        # 数据库文件可能正在被写回线程写入，不直接复制，改由后端在线备份
+        shutil.copytree(user_path, backup_dir, ignore=shutil.ignore_patterns("*.db*"))
+        await asyncio.to_thread(user_store.backup_to, backup_dir)
         logger.success(f"用户数据已备份到：{backup_dir}")
 
         await cleanup_old_backups()
@@ -0,0 +1,201 @@
+import asyncio
+import json
+import threading
+import time
+from .config import lanota_full_path, lanota_alias_full_path, lanota_table_full_path, catalog_check_interval
+from .perf import perf
+
+def _file_stamp(path):
+    """文件的 (mtime, size) 标记，文件不存在时返回None"""
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+def _read_json(path, default):
+    try:
+        if not path.exists():
+            return default
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"加载数据失败({path.name}): {str(e)}")
+        return default
+
+class SongCatalog:
+    """
+    进程内乐曲目录（乐曲/别名/定数表）
+
+    三个JSON文件只在启动时解析一次，之后仅当文件的mtime/size变化
+    或显式调用 reload() 时才重新解析。每次内容变化 version 加一。
+    文件变化最多每 check_interval 秒检查一次。start() 启动后台检查任务后，
+    检查和解析都在线程中进行，访问数据不再触发磁盘操作；未启动时（脚本、
+    基准测试）在访问时同步检查。
+    """
+
+    def __init__(self, check_interval=catalog_check_interval):
+        self._lock = threading.Lock()
+        self._files = {
+            'songs': (lanota_full_path, list),
+            'aliases': (lanota_alias_full_path, dict),
+            'table': (lanota_table_full_path, dict),
+        }
+        self._data = {name: default() for name, (_, default) in self._files.items()}
+        self._stamps = {name: None for name in self._files}
+        self._loaded = False
+        self._derived = {}
+        self._checked = 0.0
+        self._task = None
+        self.check_interval = check_interval
+        self.version = 0
+
+    def load(self):
+        """启动时加载全部数据"""
+        self.reload()
+
+    def reload(self):
+        """强制重新解析全部文件（la update 完成后调用）"""
+        with self._lock:
+            for name in self._files:
+                self._load_file(name)
+            self._loaded = True
+            self._checked = time.monotonic()
+            self.version += 1
+
+    def needs_check(self):
+        """是否需要检查文件变化（尚未加载，或距上次检查已超过check_interval）"""
+        return not self._loaded or time.monotonic() - self._checked >= self.check_interval
+
+    async def refresh_async(self):
+        """到了检查间隔时在线程中检查文件变化，不阻塞事件循环（后台检查运行时由其负责）"""
+        if self._task is None and self.needs_check():
+            await asyncio.to_thread(self.refresh)
+
+    async def _watch_loop(self):
+        while True:
+            await asyncio.sleep(self.check_interval)
+            try:
+                await asyncio.to_thread(self.refresh)
+            except Exception as e:
+                print(f"检查乐曲数据文件失败: {e}")
+
+    def start(self):
+        """启动后台检查任务"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._watch_loop())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _sync_refresh(self):
+        # 后台检查运行时访问数据只读内存
+        if self._task is None:
+            self.refresh()
+
+    def refresh(self):
+        """只重新解析mtime/size发生变化的文件"""
+        if not self.needs_check():
+            return
+        with self._lock:
+            self._checked = time.monotonic()
+            if not self._loaded:
+                for name in self._files:
+                    self._load_file(name)
+                self._loaded = True
+                self.version += 1
+                return
+            changed = False
+            for name, (path, _) in self._files.items():
+                if _file_stamp(path) != self._stamps[name]:
+                    self._load_file(name)
+                    changed = True
+            if changed:
+                self.version += 1
+
+    def _load_file(self, name):
+        path, default = self._files[name]
+        self._stamps[name] = _file_stamp(path)
+        with perf.timer("catalog.parse"):
+            self._data[name] = _read_json(path, default())
+
+    @property
+    def songs(self):
+        self._sync_refresh()
+        return self._data['songs']
+
+    @property
+    def aliases(self):
+        self._sync_refresh()
+        return self._data['aliases']
+
+    @property
+    def table(self):
+        self._sync_refresh()
+        return self._data['table']
+
+    def current_version(self):
+        """检查文件变化后返回当前版本号"""
+        self._sync_refresh()
+        return self.version
+
+    def derived(self, key, factory):
+        """按目录版本缓存派生数据（索引等），版本变化后重新构建"""
+        version = self.current_version()
+        cached = self._derived.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        value = factory()
+        self._derived[key] = (version, value)
+        return value
+
+    def has_derived(self, key):
+        """派生数据是否已按当前版本构建（不检查文件变化）"""
+        cached = self._derived.get(key)
+        return cached is not None and cached[0] == self.version
+
+    def apply_changeset(self, changeset):
+        """
+        按更新器给出的变更集替换受影响的乐曲，不重新解析整个文件
+
+        变更集格式：{'added': [...], 'modified': {章节号: {字段: 新值}}, 'dropped': {章节号: [字段, ...]},
+        'removed': [章节号, ...]}。
+        返回是否应用了变更。
+        """
+        with self._lock:
+            path = self._files['songs'][0]
+            stamp = _file_stamp(path)
+            if not self._loaded or stamp == self._stamps['songs']:
+                # 尚未加载，或文件已被重新解析过：不需要再打补丁
+                return False
+            modified = changeset.get('modified', {})
+            dropped = changeset.get('dropped', {})
+            removed = set(changeset.get('removed', []))
+            songs = []
+            for song in self._data['songs']:
+                chapter = song.get('chapter')
+                if chapter in removed:
+                    continue
+                if chapter in modified or chapter in dropped:
+                    # 换成新的字典，正在使用旧列表的读取方不受影响
+                    song = {**song, **modified.get(chapter, {})}
+                    for key in dropped.get(chapter, ()):
+                        song.pop(key, None)
+                songs.append(song)
+            songs.extend(changeset.get('added', []))
+            self._data['songs'] = songs
+            self._stamps['songs'] = stamp
+            self.version += 1
+            return True
+
+    def set_aliases(self, alias_data):
+        """别名文件写入后同步内存数据，避免下次访问时重新解析"""
+        with self._lock:
+            self._data['aliases'] = alias_data
+            self._stamps['aliases'] = _file_stamp(lanota_alias_full_path)
+            self.version += 1
+
+# 全局唯一的乐曲目录
+song_catalog = SongCatalog()
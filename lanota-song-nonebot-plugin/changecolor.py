@@ -6,6 +6,7 @@ from nonebot import on_command
 import re
 from .config import *
 from .function import *
+from .user_store import user_store
 from .whitelist import whitelist_rule
 from .text_image_text import generate_image_with_text, send_image_or_text
 
@@ -14,15 +15,15 @@ set_bgcolor = on_command('color', aliases={'设置背景色', '自定义背景
 @set_bgcolor.handle()
 async def set_bgcolor_handle(bot: Bot, event: GroupMessageEvent, arg: Message = CommandArg()):
     # 打开用户数据
-    data = open_data(full_path)
     user_id = str(event.get_user_id())
+    user = await get_user_async(user_id)
     
     # 初始化用户数据
-    if user_id not in data:
+    if user is None:
         await send_image_or_text(user_id, set_bgcolor, f"你未注册LanotaBot账号哦！", True, None, 20)
     
     # 检查是否有正在进行的事件（除了nothing和changing_bgcolor）
-    current_event = data[user_id].get('event', 'nothing')
+    current_event = user.get('event', 'nothing')
     if current_event not in ['nothing', 'changing_bgcolor']:
         await send_image_or_text(user_id, set_bgcolor, "你还有正在进行的事件未完成", True, None)
         return
@@ -33,9 +34,9 @@ async def set_bgcolor_handle(bot: Bot, event: GroupMessageEvent, arg: Message =
     # 处理默认颜色设置
     if color_arg == 'default':
         # 设置事件
-        data[user_id]['event'] = 'changing_bgcolor'
-        data[user_id]['temp_bgcolor'] = 'default'  # 特殊标记
-        save_data(full_path, data)
+        user['event'] = 'changing_bgcolor'
+        user['temp_bgcolor'] = 'default'  # 特殊标记
+        user_store.mark_dirty(user_id)
         
         
         await send_image_or_text(user_id, set_bgcolor, 
@@ -56,13 +57,13 @@ async def set_bgcolor_handle(bot: Bot, event: GroupMessageEvent, arg: Message =
     color_code = color_arg.lstrip('#').lower()
     
     # 设置事件和临时存储色号
-    data[user_id]['event'] = 'changing_bgcolor'
-    data[user_id]['temp_bgcolor'] = color_code
+    user['event'] = 'changing_bgcolor'
+    user['temp_bgcolor'] = color_code
     # 保存当前颜色以便deny时回退
-    if 'previous_bgcolor' not in data[user_id]:
-        data[user_id]['previous_bgcolor'] = data[user_id].get('bg_color', "f7dbff")
-    data[user_id]['bg_color'] = color_code
-    save_data(full_path, data)
+    if 'previous_bgcolor' not in user:
+        user['previous_bgcolor'] = user.get('bg_color', "f7dbff")
+    user['bg_color'] = color_code
+    user_store.mark_dirty(user_id)
     
     # 发送确认提示（此时消息背景已经是新色号）
     await send_image_or_text(user_id, set_bgcolor, 
@@ -0,0 +1,241 @@
+import math
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# 难度类型（列中按下标存储）
+DIFF_TYPES = ('whisper', 'acoustic', 'ultra', 'master')
+
+# 加号难度的rating加成（与 calculate_rating 一致）
+PLUS_BONUS = {'13+': 0.5, '14+': 0.5, '15+': 0.75, '16+': 1.25}
+
+def parse_level(level_str):
+    """解析 '15+' 形式的难度，返回 (标级, 是否带加号)，无法解析时标级为nan"""
+    level_str = str(level_str)
+    plus = level_str.endswith('+')
+    try:
+        return float(level_str[:-1] if plus else level_str), plus
+    except ValueError:
+        return math.nan, plus
+
+def rating_factor(level_str):
+    """满分时的rating（标级+1+加成），难度无效时返回nan"""
+    base, plus = parse_level(level_str)
+    if not (1 <= base <= 16):
+        return math.nan
+    if plus:
+        bonus = PLUS_BONUS.get(str(level_str), 0)
+    else:
+        bonus = 0.5 if base == 16 else 0
+    return base + 1 + bonus
+
+def _rating_one(harmony, tune, fail, notes, factor):
+    """单个谱面的 (rating, 调整后fail, 调整量, 超出物量, 含负数)"""
+    if harmony < 0 or tune < 0 or fail < 0 or notes < 0:
+        return 0.0, fail, 0, False, True
+    if notes <= 0:
+        return 0.0, fail, 0, False, False
+    total = harmony + tune + fail
+    if total > notes:
+        return 0.0, fail, 0, True, False
+    if math.isnan(factor):
+        return 0.0, fail, 0, False, False
+    adjustment = notes - total
+    return round((harmony + tune / 3) / notes * factor, 5), fail + adjustment, adjustment, False, False
+
+def batch_ratings(harmony, tune, fail, notes, factors):
+    """
+    批量计算rating，规则与 function.calculate_rating 相同
+
+    参数为等长序列，factors 为 rating_factor 的结果（难度无效为nan）。
+    返回字典：rating / adjusted_fail / adjustment / exceeded / negative，
+    安装了NumPy时各项为ndarray，否则为list。
+    """
+    if np is not None:
+        h = np.asarray(harmony, dtype=np.int64)
+        t = np.asarray(tune, dtype=np.int64)
+        f = np.asarray(fail, dtype=np.int64)
+        n = np.asarray(notes, dtype=np.int64)
+        factor = np.asarray(factors, dtype=np.float64)
+        negative = (h < 0) | (t < 0) | (f < 0) | (n < 0)
+        total = h + t + f
+        counted = ~negative & (n > 0)
+        exceeded = counted & (total > n)
+        valid = counted & ~exceeded & ~np.isnan(factor)
+        safe_notes = np.where(valid, n, 1)
+        rating = np.where(valid, (h + t / 3) / safe_notes * np.nan_to_num(factor), 0.0)
+        adjustment = np.where(valid, n - total, 0)
+        return {
+            # np.round 先乘10^5再取整，在恰好进位的边界上会与内置round差一位，这里保持与单个计算一致
+            'rating': np.array([round(v, 5) for v in rating.tolist()], dtype=np.float64),
+            'adjusted_fail': f + adjustment,
+            'adjustment': adjustment,
+            'exceeded': exceeded,
+            'negative': negative,
+        }
+    results = list(zip(*map(_rating_one, harmony, tune, fail, notes, factors))) or [()] * 5
+    return {
+        'rating': list(results[0]),
+        'adjusted_fail': list(results[1]),
+        'adjustment': list(results[2]),
+        'exceeded': list(results[3]),
+        'negative': list(results[4]),
+    }
+
+def _parse_constant(value):
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return math.nan
+
+class ChartStore:
+    """
+    谱面列存储
+
+    每个谱面一行，按列保存：乐曲下标、难度类型、难度字符串编号、标级、
+    是否带加号、精确定数、物量、满分rating。只收录难度不是"未知"的谱面。
+    安装了NumPy时查询走向量化运算，否则退回逐行遍历。
+    """
+
+    def __init__(self, song_data, table_data=None):
+        self.songs = song_data
+        self.level_strs = []
+        self._level_codes = {}
+
+        self.song_idx = array('i')
+        self.diff_idx = array('b')
+        self.level_code = array('i')
+        self.level_base = array('d')
+        self.plus = array('b')
+        self.constant = array('d')
+        self.notes = array('i')
+        self.factor = array('d')
+
+        table_data = table_data or {}
+        for pos, song in enumerate(song_data):
+            difficulty = song.get('difficulty', {})
+            notes = song.get('notes', {})
+            exact = {name.lower(): value for name, value in table_data.get(song.get('chapter'), {}).items()}
+            for d, diff_type in enumerate(DIFF_TYPES):
+                level_str = difficulty.get(diff_type, "未知")
+                if level_str == "未知":
+                    continue
+                level_str = str(level_str)
+                code = self._level_codes.get(level_str)
+                if code is None:
+                    code = self._level_codes[level_str] = len(self.level_strs)
+                    self.level_strs.append(level_str)
+                base, plus = parse_level(level_str)
+                try:
+                    note_count = int(notes.get(diff_type, 0) or 0)
+                except (ValueError, TypeError):
+                    note_count = 0
+
+                self.song_idx.append(pos)
+                self.diff_idx.append(d)
+                self.level_code.append(code)
+                self.level_base.append(base)
+                self.plus.append(plus)
+                self.constant.append(_parse_constant(exact.get(diff_type)))
+                self.notes.append(note_count)
+                self.factor.append(rating_factor(level_str))
+
+        self._chart_rows = None
+        self._np = None
+        if np is not None:
+            # 直接共享array的缓冲区，不复制
+            self._np = {
+                'song_idx': np.frombuffer(self.song_idx, dtype=np.int32),
+                'diff_idx': np.frombuffer(self.diff_idx, dtype=np.int8),
+                'level_code': np.frombuffer(self.level_code, dtype=np.int32),
+                'level_base': np.frombuffer(self.level_base, dtype=np.float64),
+                'notes': np.frombuffer(self.notes, dtype=np.int32),
+                'factor': np.frombuffer(self.factor, dtype=np.float64),
+            } if len(self.song_idx) else None
+
+    def __len__(self):
+        return len(self.song_idx)
+
+    def row(self, i):
+        """第i行的谱面信息字典"""
+        song = self.songs[self.song_idx[i]]
+        return {
+            'song': song,
+            'difficulty_type': DIFF_TYPES[self.diff_idx[i]],
+            'difficulty_value': self.level_strs[self.level_code[i]],
+            'level_base': self.level_base[i],
+            'has_plus': bool(self.plus[i]),
+            'constant': self.constant[i],
+            'notes': self.notes[i],
+        }
+
+    def top_by_notes(self, n):
+        """物量最高的n个谱面的行号（物量相同时保持原顺序）"""
+        if self._np is not None:
+            notes = self._np['notes']
+            rows = np.flatnonzero(notes > 0)
+            order = np.argsort(-notes[rows], kind='stable')
+            return rows[order[:n]].tolist()
+        rows = [i for i, v in enumerate(self.notes) if v > 0]
+        rows.sort(key=lambda i: -self.notes[i])
+        return rows[:n]
+
+    def songs_with_level(self, level_str):
+        """任一难度等于level_str的乐曲（按乐曲原顺序去重）"""
+        code = self._level_codes.get(str(level_str))
+        if code is None:
+            return []
+        if self._np is not None:
+            positions = np.unique(self._np['song_idx'][self._np['level_code'] == code]).tolist()
+        else:
+            positions = sorted({self.song_idx[i] for i, c in enumerate(self.level_code) if c == code})
+        return [self.songs[pos] for pos in positions]
+
+    def select(self, diff_types=None, min_level=None, with_notes=False):
+        """按难度类型/最低标级/是否有物量筛选，返回行号列表"""
+        diff_ids = [DIFF_TYPES.index(d) for d in diff_types] if diff_types else None
+        if self._np is not None:
+            mask = np.ones(len(self), dtype=bool)
+            if diff_ids is not None:
+                mask &= np.isin(self._np['diff_idx'], diff_ids)
+            if min_level is not None:
+                mask &= self._np['level_base'] >= min_level
+            if with_notes:
+                mask &= self._np['notes'] > 0
+            return np.flatnonzero(mask).tolist()
+        rows = []
+        for i in range(len(self)):
+            if diff_ids is not None and self.diff_idx[i] not in diff_ids:
+                continue
+            if min_level is not None and not self.level_base[i] >= min_level:
+                continue
+            if with_notes and self.notes[i] <= 0:
+                continue
+            rows.append(i)
+        return rows
+
+    def find(self, chapter, diff_type):
+        """按 (章节号, 难度类型) 查找行号，找不到返回-1"""
+        if self._chart_rows is None:
+            self._chart_rows = {
+                (self.songs[self.song_idx[i]].get('chapter'), DIFF_TYPES[self.diff_idx[i]]): i
+                for i in range(len(self))
+            }
+        return self._chart_rows.get((chapter, str(diff_type).lower()), -1)
+
+    def rate(self, rows, harmony, tune, fail):
+        """按行号批量计算成绩的rating，行号为-1（谱面不存在）时视为无效"""
+        notes = [self.notes[i] if i >= 0 else 0 for i in rows]
+        factors = [self.factor[i] if i >= 0 else math.nan for i in rows]
+        return batch_ratings(harmony, tune, fail, notes, factors)
+
+    def max_ratings(self, rows):
+        """各谱面满分时的rating（保留5位小数，难度无效为0）"""
+        if self._np is not None:
+            factors = np.nan_to_num(self._np['factor'][rows], nan=0.0).tolist()
+        else:
+            factors = [0.0 if math.isnan(self.factor[i]) else self.factor[i] for i in rows]
+        return [round(v, 5) for v in factors]
@@ -4,10 +4,15 @@ lanota_group = 114514  # 这里不用管，已然废弃，填什么都行
 allowed_groups = {1037559220, 551374760, 565752728, 1006108282, 1034528298}  # 白名单群组，只有这些群才会触发
 allowed_users = {"121096913","2946244126","3631828847","2976143542"}  # 添加允许的私聊用户QQ号
 save_dir = Path("Data") / "generate_image" 
+image_delivery = "memory"  # 图片发送方式：memory（内存编码后直接发送）/ file（写入save_dir，调试用）
+render_cache_bytes = 32 * 1024 * 1024  # 固定输出命令的渲染结果缓存上限（字节）
 backup_path = Path("Data") / "UserList_Backup"
 user_path = Path("Data") / "UserList"
 file_name = "UserData.json"
 full_path = user_path / file_name
+user_flush_interval = 10  # 用户数据写回间隔（秒）
+user_backend = "json"  # 用户数据存储后端：json / sqlite（首次切换到sqlite时自动从json迁移）
+user_db_path = user_path / "UserData.db"
 font_path = Path("Data") / "fonts.ttf"
 lanota_data_path = Path("Data") / "LanotaSongList"
 lanota_file_name = "song_list.json"
@@ -15,4 +20,17 @@ lanota_alias_name = "song_alias.json"
 lanota_table_name = "song_table.json"
 lanota_table_full_path = lanota_data_path / lanota_table_name
 lanota_alias_full_path = lanota_data_path / lanota_alias_name
-lanota_full_path = lanota_data_path / lanota_file_name
\ No newline at end of file
+lanota_full_path = lanota_data_path / lanota_file_name
+catalog_check_interval = 2  # 检查乐曲/别名/定数表文件是否变化的间隔（秒）
+random_org_timeout = 5  # random.org 请求超时（秒）
+random_pool_batch = 100  # 每次从 random.org 预取的随机数个数
+random_pool_low = 20  # 随机数池低于该数量时在后台补充
+random_breaker_failures = 3  # 连续失败多少次后暂停访问 random.org
+random_breaker_cooldown = 300  # 暂停访问的时长（秒）
+job_io_workers = 2  # 爬虫等网络任务的线程数
+job_cpu_workers = 2  # 图片渲染任务的线程数
+render_backend = "thread"  # 图片渲染后端：thread（线程池）/ process（进程池，多核并行，需支持fork的系统）
+render_processes = 2  # 进程池渲染时的进程数
+render_queue_limit = 8  # 同时排队和进行中的渲染任务上限，超出的请求等待空位
+perf_dump_path = Path("Data") / "perf_metrics.prom"  # 耗时统计的Prometheus文本文件
+perf_dump_interval = 60  # 写入耗时统计文件的间隔（秒），0为不写入
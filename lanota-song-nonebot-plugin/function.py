@@ -1,16 +1,19 @@
 from nonebot.adapters.onebot.v11 import Bot
 from nonebot.adapters.onebot.v11 import MessageSegment, Message
 from .config import *
+from .catalog import song_catalog
+from .search_index import SongSearchIndex
+from .alias_matcher import AliasMatcher
+from .chart_store import ChartStore, batch_ratings, rating_factor
+from .random_source import random_source
+from .user_store import user_store
 from pathlib import Path
+import asyncio
 import random
 import datetime
 import json
-import threading
 import json
 
-# 创建同步锁
-lock = threading.Lock()
-
 def init_data():
     """初始化全部数据文件"""
     user_path.mkdir(parents=True, exist_ok=True)
@@ -58,50 +61,43 @@ async def get_nickname(bot: Bot, user_id: str) -> str:
     except:
         return f"玩家{user_id}"
 
+# 目录别名对应的匹配器（按目录版本增量同步）
+_alias_matcher = AliasMatcher()
+
+def get_alias_matcher():
+    """获取与当前目录别名同步的匹配器"""
+    aliases = song_catalog.aliases
+    if _alias_matcher.version != song_catalog.version:
+        _alias_matcher.sync(aliases)
+        _alias_matcher.version = song_catalog.version
+    return _alias_matcher
+
 def get_alias_name(name, item_dict, alias_dict):
     """智能别名匹配"""
     if name in item_dict:
         return name
     
-    for std_name in alias_dict.keys():
-        if std_name in name:
-            return None
-    
-    max_len = max(len(alias) for aliases in alias_dict.values() for alias in aliases) if alias_dict else 0
-    best_match = None
-    best_len = 0
+    if alias_dict is song_catalog.aliases:
+        matcher = get_alias_matcher()
+    else:
+        matcher = AliasMatcher(alias_dict)
     
-    for i in range(len(name)):
-        for l in range(min(max_len, len(name) - i), 0, -1):
-            substring = name[i:i+l]
-            
-            for std_name, aliases in alias_dict.items():
-                if substring in aliases and l > best_len:
-                    best_match = (i, l, std_name)
-                    best_len = l
+    if matcher.contains_name(name):
+        return None
     
+    best_match = matcher.longest_alias(name)
     if best_match:
         i, l, std_name = best_match
         return name[:i] + std_name + name[i+l:]
     
     return None
 
-def open_data(file):
-    data = {}
-    with lock:
-        with open(file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-    return data
-
-def save_data(file, data):
-    with lock:
-        with open(file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=4)
-            
 def save_alias_data(alias_data):
     try:
         with open(lanota_alias_full_path, 'w', encoding='utf-8') as f:
             json.dump(alias_data, f, indent=4, ensure_ascii=False)
+        song_catalog.set_aliases(alias_data)
+        get_alias_matcher()
     except Exception as e:
         print(f"保存别名数据失败: {str(e)}")
 
@@ -110,13 +106,8 @@ def get_today_seed():
     return int(today.strftime("%Y%m%d"))
 
 def get_user_today_song(user_id: str):
-    user_data = open_data(full_path)
     today_seed = get_today_seed()
-    
-    if str(user_id) not in user_data:
-        user_data[str(user_id)] = {}
-    
-    user_info = user_data[str(user_id)]
+    user_info = user_store.ensure_user(user_id)
     
     # 检查是否有今日曲目且日期匹配
     if "today_chapter" in user_info and "today_date" in user_info:
@@ -142,18 +133,13 @@ def get_user_today_song(user_id: str):
     # 只存储chapter和日期
     user_info["today_chapter"] = today_song['chapter']
     user_info["today_date"] = today_seed
-    save_data(full_path, user_data)
+    user_store.mark_dirty(user_id)
     
     return today_song
 
 def load_table_data():
-    """加载定数表数据"""
-    try:
-        with open(lanota_table_full_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"加载定数表数据失败: {str(e)}")
-        return {}
+    """加载定数表数据（来自内存目录，返回值只读）"""
+    return song_catalog.table
 
 def format_song_info(song):
     """处理乐曲格式"""
@@ -258,37 +244,70 @@ def format_song_info(song):
     return "\n".join(info_lines)
 
 async def get_random_number_from_org(min_num, max_num):
-    """获取真随机数"""
-    try:
-        import requests
-        url = f"https://www.random.org/integers/?num=1&min={min_num}&max={max_num}&col=1&base=10&format=plain&rnd=new"
-        response = requests.get(url)
-        if response.status_code == 200:
-            return int(response.text.strip())
-    except:
-        pass
-    return random.randint(min_num, max_num)
+    """获取真随机数（取自后台预取的 random.org 随机数池，不足时使用 secrets）"""
+    return random_source.randint(min_num, max_num)
 
 def load_song_data():
-    """加载乐曲数据"""
-    try:
-        with open(lanota_full_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"加载乐曲数据失败: {str(e)}")
-        return []
+    """加载乐曲数据（来自内存目录，返回值只读）"""
+    return song_catalog.songs
 
 def load_alias_data():
-    """加载别名数据"""
-    try:
-        if not lanota_alias_full_path.exists():
-            return {}
-        
-        with open(lanota_alias_full_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"加载别名数据失败: {str(e)}")
-        return {}
+    """加载别名数据（来自内存目录，修改后需调用save_alias_data）"""
+    return song_catalog.aliases
+
+# ---------- 异步数据访问 ----------
+# 供事件循环中的命令处理使用：数据已在内存中时直接返回，
+# 需要检查/解析文件、读写用户后端或重建索引时放到线程中执行，磁盘慢时不阻塞其他群的命令。
+
+async def reload_catalog_async():
+    """在线程中强制重新解析全部数据文件"""
+    await asyncio.to_thread(song_catalog.reload)
+
+async def load_song_data_async():
+    await song_catalog.refresh_async()
+    return song_catalog.songs
+
+async def load_alias_data_async():
+    await song_catalog.refresh_async()
+    return song_catalog.aliases
+
+async def load_table_data_async():
+    await song_catalog.refresh_async()
+    return song_catalog.table
+
+async def save_alias_data_async(alias_data):
+    """在线程中写入别名文件并重建别名匹配器"""
+    await asyncio.to_thread(save_alias_data, alias_data)
+
+async def _derived_async(key, build):
+    await song_catalog.refresh_async()
+    if song_catalog.has_derived(key):
+        return build()
+    return await asyncio.to_thread(build)
+
+async def get_chart_store_async():
+    """当前版本的谱面列存储，需要重建时在线程中构建"""
+    return await _derived_async('chart_store', get_chart_store)
+
+async def get_search_index_async():
+    """当前版本的搜索索引，需要重建时在线程中构建"""
+    return await _derived_async('search_index', get_search_index)
+
+async def find_song_by_search_term_async(search_term, song_data, alias_data=None, max_display=10):
+    """find_song_by_search_term 的异步版本（先确保索引已建好）"""
+    if song_data is song_catalog.songs:
+        await get_search_index_async()
+    return find_song_by_search_term(search_term, song_data, alias_data, max_display)
+
+async def get_user_async(user_id):
+    """获取用户记录，不在内存中时在线程中从存储后端读取"""
+    return await user_store.get_user_async(user_id)
+
+async def get_user_today_song_async(user_id: str):
+    """get_user_today_song 的异步版本"""
+    await user_store.get_user_async(user_id)
+    await song_catalog.refresh_async()
+    return get_user_today_song(user_id)
 
 def get_songs_by_category(song_data, category):
     """按分类获取乐曲"""
@@ -296,17 +315,47 @@ def get_songs_by_category(song_data, category):
 
 def get_songs_by_level(song_data, level):
     """按难度获取乐曲"""
+    if song_data is song_catalog.songs:
+        return get_chart_store().songs_with_level(level)
     return [song for song in song_data 
             if (song['difficulty']['whisper'] == level or
                 song['difficulty']['acoustic'] == level or
                 song['difficulty']['ultra'] == level or
                 song['difficulty']['master'] == level)]
 
+def get_chart_store():
+    """获取当前目录版本的谱面列存储"""
+    return song_catalog.derived(
+        'chart_store',
+        lambda: ChartStore(song_catalog.songs, song_catalog.table)
+    )
+
+def get_search_index():
+    """获取当前目录版本的乐曲搜索索引"""
+    return song_catalog.derived(
+        'search_index',
+        lambda: SongSearchIndex(song_catalog.songs, song_catalog.aliases)
+    )
+
 def find_song_by_search_term(search_term, song_data, alias_data=None, max_display=10):
     """按照优先级查找乐曲 """
     if alias_data is None:
         alias_data = load_alias_data()
     
+    # 传入的是目录数据时直接走索引
+    index = get_search_index()
+    if song_data is index.songs and alias_data is song_catalog.aliases:
+        matched_songs, match_type = index.search(search_term)
+        total_count = len(matched_songs)
+        return matched_songs[:max_display], match_type, total_count
+    
+    return _find_song_linear(search_term, song_data, alias_data, max_display)
+
+def _find_song_linear(search_term, song_data, alias_data, max_display):
+    """线性扫描查找乐曲（用于非目录数据）"""
+    if alias_data is None:
+        alias_data = load_alias_data()
+    
     matched_songs = []
     match_type = None
     
@@ -371,6 +420,296 @@ def find_song_by_search_term(search_term, song_data, alias_data=None, max_displa
     
     return matched_songs, match_type, total_count
 
+def build_time_message(song_data):
+    """构建时长统计文本"""
+    def parse_time(time_str):
+        try:
+            m, s = map(int, time_str.split(':'))
+            return m * 60 + s
+        except:
+            return 0
+    
+    processed_songs = []
+    for song in song_data:
+        try:
+            time_str = song['time']
+            seconds = parse_time(time_str)
+            if seconds > 0:
+                processed_songs.append({
+                    'song': song,
+                    'seconds': seconds,
+                    'time_str': time_str
+                })
+        except:
+            continue
+    
+    long_songs = [s for s in processed_songs if s['seconds'] > 180]
+    short_songs = [s for s in processed_songs if s['seconds'] < 120]
+    
+    long_songs.sort(key=lambda x: -x['seconds'])
+    short_songs.sort(key=lambda x: x['seconds'])
+    
+    message = "时长统计:\n\n"
+    
+    if long_songs:
+        message += f"长于3分钟的乐曲(共{len(long_songs)}首，时长降序):\n"
+        for i, song_info in enumerate(long_songs, 1):
+            message += f"\n{i}. {song_info['song']['title']} -|- {song_info['time_str']} (Chapter: {song_info['song']['chapter']})"
+        message += '\n'
+    else:
+        message += "没有长于3分钟的乐曲\n"
+    
+    if short_songs:
+        message += f"\n短于2分钟的乐曲(共{len(short_songs)}首，时长升序):"
+        for i, song_info in enumerate(short_songs, 1):
+            message += f"\n{i}. {song_info['song']['title']} -|- {song_info['time_str']} (Chapter: {song_info['song']['chapter']})"
+    else:
+        message += "没有短于2分钟的乐曲"
+    
+    return message
+
+def build_all_message(song_data):
+    """构建曲库统计文本"""
+    category_counts = {}
+    for song in song_data:
+        category = song['category']
+        category_counts[category] = category_counts.get(category, 0) + 1
+    
+    total_songs = len(song_data)
+    
+    category_name_map = {
+        'main': '主线',
+        'side': '支线',
+        'expansion': '曲包',
+        'event': '活动',
+        'subscription': '书房'
+    }
+    
+    category_info = []
+    for category, count in category_counts.items():
+        name = category_name_map.get(category, category)
+        category_info.append(f"{name}: {count}首")
+    
+    message = (
+        f"Lanota曲库统计（Fandom已收录）:\n"
+        f"总乐曲数量: {total_songs}首\n\n"
+        f"按分类统计:\n"
+        + "\n".join(category_info)
+    )
+    
+    return message
+
+def build_notes_message(song_data):
+    """构建物量排行文本，没有有效谱面时返回空字符串"""
+    # 只取前50个
+    store = get_chart_store() if song_data is song_catalog.songs else ChartStore(song_data)
+    top_charts = [store.row(i) for i in store.top_by_notes(50)]
+    
+    if not top_charts:
+        return ""
+    
+    # 构建消息
+    message = "物量最高的前50个谱面:\n"
+    for i, chart in enumerate(top_charts, 1):
+        message += f"\n{i}. {chart['song']['title']} -|- 物量{chart['notes']} (难度: {chart['difficulty_type'].capitalize()} {chart['difficulty_value']}, Chapter: {chart['song']['chapter']})"
+    
+    return message
+
+def get_rating_level_groups(song_data, min_level=15):
+    """
+    按难度字符串分组的高难度 Master/Ultra 谱面
+
+    返回 {难度: [谱面, ...]}，每个谱面附带满分rating
+    """
+    store = get_chart_store() if song_data is song_catalog.songs else ChartStore(song_data)
+    rows = store.select(diff_types=('master', 'ultra'), min_level=min_level, with_notes=True)
+    level_groups = {}
+    for i, rating in zip(rows, store.max_ratings(rows)):
+        chart = store.row(i)
+        level_groups.setdefault(chart['difficulty_value'], []).append({
+            'song': chart['song'],
+            'difficulty_type': chart['difficulty_type'].capitalize(),
+            'difficulty_value': chart['difficulty_value'],
+            'notes': chart['notes'],
+            'base_level': chart['level_base'],
+            'has_plus': chart['has_plus'],
+            'level_str': chart['difficulty_value'],
+            'rating': rating
+        })
+    return level_groups
+
+def build_chart_table(song_data, table_data):
+    """
+    把定数表展开为谱面列表
+
+    返回 (charts, plus_levels)：charts 已按定数从高到低排序，
+    plus_levels 为存在加号难度的标级集合
+    """
+    # 章节号 -> 乐曲（同章节取第一首）
+    songs_by_chapter = {}
+    for song in song_data:
+        songs_by_chapter.setdefault(song['chapter'], song)
+
+    # 收集所有谱面数据
+    charts = []
+    
+    # 从精确定数表获取数据，然后在歌曲数据中找对应的歌曲信息
+    for chapter, difficulties in table_data.items():
+        # 在歌曲数据中查找对应的歌曲
+        matching_song = songs_by_chapter.get(chapter)
+        if not matching_song:
+            # 如果找不到对应歌曲，创建一个简化的条目
+            matching_song = {
+                'chapter': chapter,
+                'title': f"未找到歌曲 ({chapter})",
+                'id': 'Unknown'
+            }
+
+        for difficulty_name, rating_str in difficulties.items():
+            # 标准化难度名称
+            diff_type = difficulty_name.lower()
+            if diff_type not in ['whisper', 'acoustic', 'ultra', 'master']:
+                continue
+            
+            level_str = str(rating_str)
+            
+            # 检查是否是范围定数 (如 15.7~15.8 或 15.7~15.9)
+            if '~' in level_str:
+                try:
+                    # 分割范围
+                    start_str, end_str = level_str.split('~', 1)
+                    start_val = float(start_str)
+                    end_val = float(end_str)
+                    
+                    # 生成范围内的所有定数 (按0.1递增)
+                    current = start_val
+                    while current <= end_val + 0.05:  # 加一点余量避免浮点精度问题
+                        # 只在最高定数处标记为范围定数
+                        is_highest_in_range = (current >= end_val - 0.05)  # 是否是范围内最高定数
+                        
+                        charts.append({
+                            'song': matching_song,
+                            'difficulty_type': diff_type.capitalize(),
+                            'difficulty_value': rating_str,  # 保留原始精确定数
+                            'sort_value': current,
+                            'display_level': f"{current:.1f}",
+                            'base_level': int(current) if current == int(current) else current,
+                            'is_range': is_highest_in_range,  # 只有最高定数标记为范围
+                            'original_range': level_str
+                        })
+                        current = round(current + 0.1, 1)  # 避免浮点精度问题
+                    continue
+                except ValueError:
+                    # 如果解析失败，按原来的方式处理
+                    pass
+            
+            # 处理普通定数
+            try:
+                if level_str.endswith('+'):
+                    base_level = float(level_str[:-1])
+                    sort_value = base_level + 0.5  # 加号版本排在前面
+                    display_level = level_str  # 保留原格式显示
+                else:
+                    base_level = float(level_str)
+                    sort_value = base_level
+                    display_level = level_str
+                
+                charts.append({
+                    'song': matching_song,
+                    'difficulty_type': diff_type.capitalize(),
+                    'difficulty_value': rating_str,  # 保留原始精确定数
+                    'sort_value': sort_value,
+                    'display_level': display_level,
+                    'base_level': int(base_level) if base_level == int(base_level) else base_level,
+                    'is_range': False,
+                    'original_range': None
+                })
+            except ValueError:
+                continue
+    
+    # 按定数从高到低排序，范围定数排在同定数的最后
+    charts.sort(key=lambda x: (-x['sort_value'], x['original_range'] is not None))
+    
+
+    # 一次遍历标记每个标级是否有加号版本（按歌曲数据中的实际难度值）
+    plus_levels = set()
+    for chart in charts:
+        song_difficulty = chart['song'].get('difficulty', {}).get(chart['difficulty_type'].lower(), '')
+        if str(song_difficulty).endswith('+'):
+            plus_levels.add(int(chart['base_level']))
+
+    return charts, plus_levels
+
+def build_table_message(song_data, table_data):
+    """构建定数表文本，没有有效谱面时返回空字符串"""
+    # 目录数据按版本缓存，定数表或乐曲数据变化后重新生成
+    if song_data is song_catalog.songs and table_data is song_catalog.table:
+        return song_catalog.derived(
+            'table_message',
+            lambda: _format_table_message(*build_chart_table(song_data, table_data))
+        )
+    return _format_table_message(*build_chart_table(song_data, table_data))
+
+def _format_table_message(charts, plus_levels):
+    if not charts:
+        return ""
+    
+    # 构建消息
+    message = "Lanota 民间定数表\n\n"
+    
+    current_level_group = None  # 当前等级组 (如 16+, 16, 15+ 等)
+    current_exact_level = None   # 当前精确定数 (如 16.5, 16.4 等)
+    
+    for chart in charts:
+        set_huanhang = False
+        # 判断等级组 (16+统一为16，15+统一为15等)
+        base_level = int(chart['base_level'])
+        
+        # 检查该等级是否有加号版本
+        has_plus_in_group = base_level in plus_levels
+        
+        # 构建等级组标题
+        if has_plus_in_group:
+            level_group = f"标级：{base_level}（+）"
+        else:
+            level_group = f"标级：{base_level}"
+        
+        # 判断精确定数
+        exact_level = chart['sort_value']
+        
+        # 如果等级组变化，添加大分隔线
+        if current_level_group != level_group:
+            if current_level_group is not None:  # 不是第一个
+                message += "\n"
+            message += f"══════════════\n{level_group}\n══════════════\n"
+            current_level_group = level_group
+            current_exact_level = None  # 重置精确定数
+            set_huanhang = True
+        
+        # 如果精确定数变化，添加定数标题和换行
+        if current_exact_level != exact_level:
+            if current_exact_level is not None:  # 不是该等级组的第一个定数
+                message += "\n"
+            if set_huanhang:
+                message += "\n"
+                set_huanhang = False
+            message += f"定数 {exact_level}：\n"
+            current_exact_level = exact_level
+        
+        # 获取歌曲信息表里的难度 (大定数)
+        song_difficulty = chart['song'].get('difficulty', {}).get(chart['difficulty_type'].lower(), '未知')
+        song_id = chart['song'].get('id', 'Unknown')
+        
+        # 添加歌曲信息
+        if chart['is_range']:
+            # 范围定数的特殊标签
+            range_tag = f"[范围定数: {chart['original_range']}]"
+            message += f"{chart['song']['chapter']} -|- {chart['song']['title']} (ID: {song_id}) [{chart['difficulty_type']} {song_difficulty}] {range_tag}\n"
+        else:
+            message += f"{chart['song']['chapter']} -|- {chart['song']['title']} (ID: {song_id}) [{chart['difficulty_type']} {song_difficulty}]\n"
+    
+    return message.strip()
+
 def calculate_rating(harmony: int, tune: int, fail: int, notes: int, level: str) -> tuple:
     """计算单曲 rating"""
     try:
@@ -435,4 +774,27 @@ def calculate_rating(harmony: int, tune: int, fail: int, notes: int, level: str)
     
     # 计算 rating
     rating = (harmony + tune / 3) / notes * (base_level + 1 + bonus)
-    return (round(rating, 5), adjusted_fail, adjustment, False, False, bonus, base_level)
\ No newline at end of file
+    return (round(rating, 5), adjusted_fail, adjustment, False, False, bonus, base_level)
+
+def calculate_ratings(harmony, tune, fail, notes, levels):
+    """
+    批量计算rating（每个参数为等长序列，等级相同的谱面只解析一次）
+
+    返回字典：rating / adjusted_fail / adjustment / exceeded / negative，
+    各项与 calculate_rating 逐个计算的结果一致。
+    """
+    factors = {level: rating_factor(level) for level in set(map(str, levels))}
+    return batch_ratings(harmony, tune, fail, notes, [factors[str(level)] for level in levels])
+
+def calculate_chart_ratings(charts, harmony, tune, fail):
+    """
+    按谱面批量计算rating，charts 为 (章节号, 难度类型) 序列
+
+    物量和等级取自当前目录的谱面列存储，不存在的谱面rating为0。
+    返回值同 calculate_ratings，另含 'rows'（谱面行号，不存在为-1）。
+    """
+    store = get_chart_store()
+    rows = [store.find(chapter, diff_type) for chapter, diff_type in charts]
+    result = store.rate(rows, harmony, tune, fail)
+    result['rows'] = rows
+    return result
@@ -1,12 +1,15 @@
 import requests
 import mwparserfromhell
+import copy
 import json
 import re
 import time
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from bs4 import BeautifulSoup
 from pathlib import Path
-from urllib.parse import unquote, quote
+from urllib.parse import unquote, quote, urlsplit
 from typing import Optional
 
 # Selenium imports
@@ -26,10 +29,21 @@ except ImportError:
     SELENIUM_AVAILABLE = False
     print("警告: 未安装 selenium 或 webdriver-manager,将无法绕过 JavaScript 验证")
 
-BASE_URL = "https://lanota.fandom.com"
+# 可用 LANOTA_FANDOM_BASE_URL 指向本地模拟 wiki 做测试
+BASE_URL = (os.environ.get("LANOTA_FANDOM_BASE_URL") or "https://lanota.fandom.com").rstrip("/")
 API_URL = f"{BASE_URL}/api.php"
 
+# 并发抓取参数：工作线程数 / 每个主机每秒最多请求数 / 每次批量查询的页面数（MediaWiki 上限 50）
+FETCH_WORKERS = int(os.environ.get("LANOTA_FETCH_WORKERS") or 4)
+RATE_LIMIT = float(os.environ.get("LANOTA_RATE_LIMIT") or 5)
+BATCH_SIZE = 50
+
+# 用于 /wiki/{title} 路径时不转义的字符
+_TITLE_SAFE = ":()'!-._~"
+
 FANDOM_COOKIES_PATH = Path("Data") / "fandom_cookies.json"
+# 页面修订号与 Songs 列表页缓存，用于跳过未变化的页面
+FANDOM_REVISIONS_PATH = Path("Data") / "fandom_revisions.json"
 
 _CHROMEDRIVER_PATH = None
 _EDGEDRIVER_PATH = None
@@ -151,6 +165,40 @@ def _is_client_challenge(text: str) -> bool:
     )
 
 
+class RateLimiter:
+    """按主机限速：同一主机相邻两次请求至少间隔 1/rate 秒（线程安全）"""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next = {}
+
+    def wait(self, host: str) -> None:
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next.get(host, now))
+            self._next[host] = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+class RateLimitedSession(requests.Session):
+    """每次请求前先经过限速器；连接池大小与工作线程数一致"""
+
+    def __init__(self, limiter: RateLimiter, pool_size: int = FETCH_WORKERS):
+        super().__init__()
+        self.limiter = limiter
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.mount("http://", adapter)
+        self.mount("https://", adapter)
+
+    def request(self, method, url, *args, **kwargs):
+        self.limiter.wait(urlsplit(url).netloc)
+        return super().request(method, url, *args, **kwargs)
+
+
 def _load_cookies_to_session(session: requests.Session, cookies_path: Path = FANDOM_COOKIES_PATH) -> bool:
     try:
         if not cookies_path.exists():
@@ -454,6 +502,38 @@ def get_page_with_selenium(url, wait_time=30, *, headless=None, save_cookies=Tru
     raise last_exc
 
 
+# Selenium 兜底需要人工过验证，多个线程同时回退时排队进行
+_SELENIUM_LOCK = threading.Lock()
+
+
+def _looks_like_html(text: str) -> bool:
+    if not text:
+        return False
+    t = text.lstrip().lower()
+    return t.startswith("<!doctype") or t.startswith("<html") or t.startswith("<div")
+
+
+def _sanitize_wikitext(text: str) -> str:
+    if not text:
+        return ""
+    # 避免把挑战页/HTML 当成 wikitext
+    if _is_client_challenge(text) or _looks_like_html(text):
+        return ""
+    return text
+
+
+def _page_name_from_url(url: str) -> str:
+    """从 /wiki/ 链接中取出页面名（去掉 ?/#，避免 API 查不到）"""
+    raw_page = (url or "").rsplit('/wiki/', 1)[-1]
+    return unquote(raw_page).split("#", 1)[0].split("?", 1)[0].strip()
+
+
+def _title_path(page_name: str) -> str:
+    # 用于 /wiki/{title} 路径的标题必须 URL 编码（尤其是包含 '/' 的页面名）
+    # 同时把空格转为 '_' 更贴近 MediaWiki 默认形式
+    return quote(page_name.replace(" ", "_"), safe=_TITLE_SAFE)
+
+
 def fetch_wikitext(session: requests.Session, page_name: str) -> str:
     """获取页面 wikitext：API(query revisions) -> API(parse) -> action=raw -> action=edit -> Selenium 兜底。"""
     debug = True
@@ -463,23 +543,7 @@ def fetch_wikitext(session: requests.Session, page_name: str) -> str:
     if not page_name:
         return ""
 
-    # 用于 /wiki/{title} 路径的标题必须 URL 编码（尤其是包含 '/' 的页面名）
-    # 同时把空格转为 '_' 更贴近 MediaWiki 默认形式
-    page_name_path = quote(page_name.replace(" ", "_"), safe=":()'!-._~")
-
-    def _looks_like_html(text: str) -> bool:
-        if not text:
-            return False
-        t = text.lstrip().lower()
-        return t.startswith("<!doctype") or t.startswith("<html") or t.startswith("<div")
-
-    def _sanitize_wikitext(text: str) -> str:
-        if not text:
-            return ""
-        # 避免把挑战页/HTML 当成 wikitext
-        if _is_client_challenge(text) or _looks_like_html(text):
-            return ""
-        return text
+    page_name_path = _title_path(page_name)
 
     # 1) API: action=query + revisions（通常比 parse 更稳）
     try:
@@ -564,34 +628,187 @@ def fetch_wikitext(session: requests.Session, page_name: str) -> str:
     if use_selenium is None:
         use_selenium = True  # 默认启用 Selenium 兜底
     if SELENIUM_AVAILABLE and use_selenium:
-        if debug:
-            print(f"  [wikitext] selenium fallback: {page_name}")
-        # 优先抓 edit 页面里的 textarea (强制交互模式让用户手动过验证)
-        html = get_page_with_selenium(edit_url, wait_time=10, debug_name="fandom_edit", session=session, headless=False)
-        soup = BeautifulSoup(html, "html.parser")
-        ta = soup.find("textarea", {"name": "wpTextbox1"}) or soup.find("textarea", {"id": "wpTextbox1"})
-        if ta is not None:
-            content = _sanitize_wikitext(ta.get_text("", strip=False) or "")
-            if content:
-                return content
-
-        # 再退回 raw 页面（有时会把内容渲染进 <pre>）
-        html = get_page_with_selenium(raw_url, wait_time=10, debug_name="fandom_raw", session=session)
-        soup = BeautifulSoup(html, "html.parser")
-        pre = soup.find("pre")
-        if pre and pre.get_text(strip=False):
-            content = _sanitize_wikitext(pre.get_text(strip=False) or "")
-            if content:
-                return content
-
-        # 最后兜底：纯文本（不保证是 wikitext）
-        return ""
+        with _SELENIUM_LOCK:
+            return _fetch_wikitext_with_selenium(session, page_name, edit_url, raw_url, debug)
 
     if debug:
         print(f"  [wikitext] failed: {page_name}")
 
     return ""
 
+
+def _fetch_wikitext_with_selenium(session, page_name, edit_url, raw_url, debug) -> str:
+    if debug:
+        print(f"  [wikitext] selenium fallback: {page_name}")
+    # 优先抓 edit 页面里的 textarea (强制交互模式让用户手动过验证)
+    html = get_page_with_selenium(edit_url, wait_time=10, debug_name="fandom_edit", session=session, headless=False)
+    soup = BeautifulSoup(html, "html.parser")
+    ta = soup.find("textarea", {"name": "wpTextbox1"}) or soup.find("textarea", {"id": "wpTextbox1"})
+    if ta is not None:
+        content = _sanitize_wikitext(ta.get_text("", strip=False) or "")
+        if content:
+            return content
+
+    # 再退回 raw 页面（有时会把内容渲染进 <pre>）
+    html = get_page_with_selenium(raw_url, wait_time=10, debug_name="fandom_raw", session=session)
+    soup = BeautifulSoup(html, "html.parser")
+    pre = soup.find("pre")
+    if pre and pre.get_text(strip=False):
+        content = _sanitize_wikitext(pre.get_text(strip=False) or "")
+        if content:
+            return content
+
+    # 最后兜底：纯文本（不保证是 wikitext）
+    return ""
+
+
+def _query_batch(session: requests.Session, page_names: list, extra_params: dict) -> dict:
+    """对一组标题发一次 action=query（自动跟随 continue），返回 {页面名: (最终标题, page)}"""
+    params = {
+        "action": "query",
+        "titles": "|".join(page_names),
+        "redirects": 1,
+        "format": "json",
+        "formatversion": 2,
+        **extra_params,
+    }
+    normalized = {}
+    redirects = {}
+    pages = {}
+    cont = {}
+    try:
+        while True:
+            r = session.get(API_URL, params={**params, **cont}, timeout=30)
+            if r.status_code != 200:
+                break
+            try:
+                json_data = r.json()
+            except ValueError:
+                break
+            query = json_data.get("query") or {}
+            for item in query.get("normalized") or []:
+                normalized[item.get("from")] = item.get("to")
+            for item in query.get("redirects") or []:
+                redirects[item.get("from")] = item.get("to")
+            for page in query.get("pages") or []:
+                if page.get("missing") or page.get("invalid"):
+                    continue
+                # 内容过大时 API 会分多次返回，同一页面的字段合并
+                pages.setdefault(page.get("title"), {}).update(page)
+            if "continue" not in json_data:
+                break
+            cont = json_data["continue"]
+    except requests.exceptions.RequestException:
+        pass
+
+    result = {}
+    for name in page_names:
+        title = normalized.get(name, name)
+        seen = set()
+        while title in redirects and title not in seen:
+            seen.add(title)
+            title = redirects[title]
+        if title in pages:
+            result[name] = (title, pages[title])
+    return result
+
+
+def _query_wikitext_batch(session: requests.Session, page_names: list) -> dict:
+    """一次 query+revisions 请求获取多个页面，返回 {页面名: (最终标题, wikitext)}"""
+    batch = _query_batch(session, page_names, {"prop": "revisions", "rvprop": "content", "rvslots": "main"})
+    result = {}
+    for name, (title, page) in batch.items():
+        revs = page.get("revisions") or []
+        if revs and isinstance(revs, list):
+            slots = (revs[0].get("slots") or {}).get("main") or {}
+            content = _sanitize_wikitext(slots.get("content") or "")
+            if content:
+                result[name] = (title, content)
+    return result
+
+
+def _query_revision_batch(session: requests.Session, page_names: list) -> dict:
+    """一次 info|revisions(ids) 请求获取多个页面的最新修订号，返回 {页面名: (最终标题, 修订号)}"""
+    batch = _query_batch(session, page_names, {"prop": "info|revisions", "rvprop": "ids"})
+    result = {}
+    for name, (title, page) in batch.items():
+        revid = page.get("lastrevid")
+        if not revid:
+            revs = page.get("revisions") or []
+            revid = revs[0].get("revid") if revs and isinstance(revs, list) else None
+        if revid:
+            result[name] = (title, revid)
+    return result
+
+
+def fetch_revisions(session: requests.Session, page_names: list, workers: int = FETCH_WORKERS) -> dict:
+    """并发批量查询页面的最新修订号，返回 {页面名: (最终标题, 修订号)}，查询失败的页面不在结果中"""
+    unique_names = list(dict.fromkeys(n for n in page_names if n))
+    chunks = [unique_names[i:i + BATCH_SIZE] for i in range(0, len(unique_names), BATCH_SIZE)]
+    result = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for batch in pool.map(lambda chunk: _query_revision_batch(session, chunk), chunks):
+            result.update(batch)
+    return result
+
+
+def _load_revision_cache(path: Path = FANDOM_REVISIONS_PATH) -> dict:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+        if isinstance(cache, dict):
+            cache.setdefault("pages", {})
+            cache.setdefault("songs_page", {})
+            return cache
+    except (OSError, ValueError):
+        pass
+    return {"pages": {}, "songs_page": {}}
+
+
+def _save_revision_cache(cache: dict, path: Path = FANDOM_REVISIONS_PATH) -> None:
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(cache, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"警告: 保存修订号缓存失败: {e}")
+
+
+def fetch_wikitexts(session: requests.Session, urls: list, workers: int = FETCH_WORKERS) -> dict:
+    """并发获取多个乐曲页面的 wikitext。
+
+    先按每组 BATCH_SIZE 个页面走批量 query 接口，批量接口没有取到的页面
+    再逐个走 fetch_wikitext 的回退链。返回 {url: (最终页面名, wikitext)}，
+    获取失败的 url 不在结果中。
+    """
+    names = {}
+    for url in urls:
+        name = _page_name_from_url(url)
+        if name:
+            names.setdefault(url, name)
+    unique_names = list(dict.fromkeys(names.values()))
+    chunks = [unique_names[i:i + BATCH_SIZE] for i in range(0, len(unique_names), BATCH_SIZE)]
+
+    def _fallback(url):
+        final_url = get_final_url(session, url)
+        page_name = _page_name_from_url(final_url)
+        return url, page_name, fetch_wikitext(session, page_name)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        by_name = {}
+        for batch in pool.map(lambda chunk: _query_wikitext_batch(session, chunk), chunks):
+            by_name.update(batch)
+        print(f"  [wikitext] 批量获取 {len(by_name)}/{len(unique_names)} 个页面（{len(chunks)} 次请求）")
+
+        results = {url: by_name[name] for url, name in names.items() if name in by_name}
+        missing = [url for url in names if url not in results]
+        for url, page_name, wikitext in pool.map(_fallback, missing):
+            if wikitext:
+                results[url] = (page_name, wikitext)
+    return results
+
 # ---------- 工具函数 ----------
 
 def clean_ref(text):
@@ -633,6 +850,33 @@ def get_final_url(session, url, max_retries=3):
             time.sleep(1)
     return url
 
+def parse_song_page(wikitext):
+    """解析乐曲页面，返回 (wikicode, get_field)，get_field 读取 Song 模板中的字段"""
+    wikicode = mwparserfromhell.parse(wikitext)
+    tmpl = next((t for t in wikicode.filter_templates() if t.name.strip().lower() == 'song'), None)
+
+    def get_field(field):
+        if not tmpl or not tmpl.has(field):
+            return ''
+        val = str(tmpl.get(field).value)
+        val = clean_ref(val)
+        val = clean_wiki_links(val)
+        return replace_br(val).strip()
+
+    return wikicode, get_field
+
+def parse_trivia(wikitext):
+    return [clean_wiki_links(clean_ref(item.strip())) for item in re.findall(r"\*([^\n]+)", wikitext.split('==Trivia==')[1])]
+
+def iter_legacy_params(wikicode):
+    """遍历 LegacyTable 模板的 (字段, 值)"""
+    for t in wikicode.filter_templates():
+        if t.name.strip().lower() == 'legacytable':
+            for param in t.params:
+                key = clean_wiki_links(str(param.name).strip())
+                val = replace_br(clean_ref(str(param.value).strip()))
+                yield key, val
+
 def check_missing_fields(song):
     """检查歌曲的缺失字段，返回缺失字段列表"""
     missing = []
@@ -668,30 +912,19 @@ def check_missing_fields(song):
     
     return missing
 
-def update_song_from_wiki(session, song):
-    """从 wiki 全量更新歌曲信息"""
+def update_song_from_wiki(session, song, wikitext=None):
+    """从 wiki 全量更新歌曲信息（wikitext 为 None 时自行抓取）"""
     if 'source_url' not in song:
         return None, []
     
     try:
-        final_url = get_final_url(session, song['source_url'])
-        raw_page = final_url.rsplit('/wiki/', 1)[-1]
-        page_name = unquote(raw_page)
-
-        wikitext = fetch_wikitext(session, page_name)
+        if wikitext is None:
+            final_url = get_final_url(session, song['source_url'])
+            wikitext = fetch_wikitext(session, _page_name_from_url(final_url))
         if not wikitext:
             print("  无法获取 wikitext（可能被挑战页拦截），跳过")
             return None, []
-        wikicode = mwparserfromhell.parse(wikitext)
-        tmpl = next((t for t in wikicode.filter_templates() if t.name.strip().lower() == 'song'), None)
-
-        def get_field(field):
-            if not tmpl or not tmpl.has(field):
-                return ''
-            val = str(tmpl.get(field).value)
-            val = clean_ref(val)
-            val = clean_wiki_links(val)
-            return replace_br(val).strip()
+        wikicode, get_field = parse_song_page(wikitext)
 
         # 记录原始的关键字段状态
         original_bpm_missing = not song.get('bpm') or song.get('bpm', '').strip() == ''
@@ -767,19 +1000,15 @@ def update_song_from_wiki(session, song):
         
         # 更新 Trivia
         if '==Trivia==' in wikitext:
-            trivia = [clean_wiki_links(clean_ref(item.strip())) for item in re.findall(r"\*([^\n]+)", wikitext.split('==Trivia==')[1])]
+            trivia = parse_trivia(wikitext)
             if trivia:
                 song['Trivia'] = trivia
         
         # 更新 Legacy（只有当 Legacy 存在且非空时才更新）
         if 'Legacy' in song and isinstance(song['Legacy'], dict) and song['Legacy']:
-            for t in wikicode.filter_templates():
-                if t.name.strip().lower() == 'legacytable':
-                    for param in t.params:
-                        key = clean_wiki_links(str(param.name).strip())
-                        val = replace_br(clean_ref(str(param.value).strip()))
-                        if val:
-                            song['Legacy'][key] = val
+            for key, val in iter_legacy_params(wikicode):
+                if val:
+                    song['Legacy'][key] = val
         
         # === 只返回关键字段的更新状态 ===
         updated_fields = []
@@ -831,12 +1060,95 @@ def update_song_from_wiki(session, song):
         print(f"  更新失败: {e}")
         return None, []
 
+# ---------- 变更集 ----------
+
+def build_changeset(before, after):
+    """按章节号比较更新前后的乐曲列表，返回变更集
+
+    {'added': [新乐曲, ...], 'modified': {章节号: {字段: 新值}}, 'dropped': {章节号: [被删除的字段, ...]},
+     'removed': [章节号, ...]}
+    """
+    before_by_chapter = {song['chapter']: song for song in before}
+    after_chapters = set()
+    added = []
+    modified = {}
+    dropped = {}
+    for song in after:
+        chapter = song['chapter']
+        after_chapters.add(chapter)
+        old = before_by_chapter.get(chapter)
+        if old is None:
+            added.append(song)
+            continue
+        fields = {key: value for key, value in song.items() if old.get(key) != value}
+        if fields:
+            modified[chapter] = fields
+        keys = [key for key in old if key not in song]
+        if keys:
+            dropped[chapter] = keys
+    removed = [chapter for chapter in before_by_chapter if chapter not in after_chapters]
+    return {'added': added, 'modified': modified, 'dropped': dropped, 'removed': removed}
+
+def changeset_is_empty(changeset):
+    return not (changeset['added'] or changeset['modified'] or changeset.get('dropped') or changeset['removed'])
+
+def write_json_atomic(path, data):
+    """先写临时文件再替换，读取方不会读到写了一半的文件"""
+    path = Path(path)
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
 # ---------- 主程序 ----------
 
-def main():
+def _fetch_songs_page_html(session, cached):
+    """获取 Songs 列表页 HTML，返回 (html, ETag, Last-Modified)
+
+    普通请求时带上缓存的 ETag/Last-Modified，服务器返回 304 则直接使用缓存。
+    """
+    # 尝试使用 Selenium 获取页面(因为 Fandom 现在可能需要 JavaScript)
+    if SELENIUM_AVAILABLE:
+        # 先用 action=render，通常更轻量、也更容易出现表格
+        page_html = get_page_with_selenium(
+            f"{BASE_URL}/wiki/Songs?action=render",
+            debug_name="songs",
+            session=session,
+        )
+        if _is_client_challenge(page_html) or "<table" not in page_html.lower():
+            page_html = get_page_with_selenium(
+                f"{BASE_URL}/wiki/Songs",
+                debug_name="songs",
+                session=session,
+            )
+        # selenium 可能刚写入 cookies（同一轮运行也要立刻加载到 session）
+        _load_cookies_to_session(session)
+        return page_html, None, None
+
+    # 回退到普通请求(可能会失败)
+    print("警告: 未安装 selenium,尝试使用普通请求(可能失败)...")
+    headers = {}
+    if cached.get("html"):
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+    resp = session.get(f"{BASE_URL}/wiki/Songs?action=render", headers=headers, timeout=30)
+    if resp.status_code == 304 and cached.get("html"):
+        print("Songs 页面未变化（304），使用本地缓存")
+        return cached["html"], cached.get("etag"), cached.get("last_modified")
+    resp.raise_for_status()
+    if _is_client_challenge(resp.text):
+        resp = session.get(f"{BASE_URL}/wiki/Songs", timeout=30)
+        resp.raise_for_status()
+    return resp.text, resp.headers.get("ETag"), resp.headers.get("Last-Modified")
+
+def main(progress=None):
+    """更新乐曲数据；progress 为可选的进度回调，接收一条文本"""
+    report = progress or (lambda message: None)
     SONGS_JSON = get_output_path()
     SONGS_JSON.parent.mkdir(parents=True, exist_ok=True)
-    session = requests.Session()
+    session = RateLimitedSession(RateLimiter(RATE_LIMIT))
     session.headers.update({
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
         'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
@@ -851,8 +1163,9 @@ def main():
     except FileNotFoundError:
         data = []
 
-    # 记录原始数据长度
+    # 记录原始数据长度，保留一份原始数据用于生成变更集
     original_count = len(data)
+    original_data = copy.deepcopy(data)
     
     print("=" * 60)
     print("开始检查和更新乐曲数据")
@@ -883,34 +1196,31 @@ def main():
     existing_chapters_lower = {item['chapter'].lower() for item in data}
 
     print("\n正在搜索乐曲列表……")
-    
-    # 尝试使用 Selenium 获取页面(因为 Fandom 现在可能需要 JavaScript)
+
+    # 先批量查询 Songs 页面与缺失信息歌曲页面的修订号（一次轻量请求）
+    revision_cache = _load_revision_cache()
+    if _env_flag("LANOTA_IGNORE_REVISION_CACHE") is True:
+        revision_cache = {"pages": {}, "songs_page": {}}
+    missing_urls = [item['song']['source_url'] for item in songs_with_missing if 'source_url' in item['song']]
+    revisions = fetch_revisions(session, ["Songs"] + [_page_name_from_url(url) for url in missing_urls])
+
+    songs_cached = revision_cache["songs_page"]
+    songs_revid = revisions.get("Songs", (None, None))[1]
     try:
-        if SELENIUM_AVAILABLE:
-            # 先用 action=render，通常更轻量、也更容易出现表格
-            page_html = get_page_with_selenium(
-                f"{BASE_URL}/wiki/Songs?action=render",
-                debug_name="songs",
-                session=session,
-            )
-            if _is_client_challenge(page_html) or "<table" not in page_html.lower():
-                page_html = get_page_with_selenium(
-                    f"{BASE_URL}/wiki/Songs",
-                    debug_name="songs",
-                    session=session,
-                )
-            # selenium 可能刚写入 cookies（同一轮运行也要立刻加载到 session）
-            _load_cookies_to_session(session)
-            soup = BeautifulSoup(page_html, 'html.parser')
+        if songs_revid is not None and songs_cached.get("revid") == songs_revid and songs_cached.get("html"):
+            print(f"Songs 页面未更新（修订号 {songs_revid}），使用本地缓存")
+            page_html = songs_cached["html"]
         else:
-            # 回退到普通请求(可能会失败)
-            print("警告: 未安装 selenium,尝试使用普通请求(可能失败)...")
-            resp = session.get(f"{BASE_URL}/wiki/Songs?action=render", timeout=30)
-            resp.raise_for_status()
-            if _is_client_challenge(resp.text):
-                resp = session.get(f"{BASE_URL}/wiki/Songs", timeout=30)
-                resp.raise_for_status()
-            soup = BeautifulSoup(resp.text, 'html.parser')
+            page_html, etag, last_modified = _fetch_songs_page_html(session, songs_cached)
+            if not _is_client_challenge(page_html):
+                revision_cache["songs_page"] = {
+                    "revid": songs_revid,
+                    "etag": etag,
+                    "last_modified": last_modified,
+                    "html": page_html,
+                }
+                _save_revision_cache(revision_cache)
+        soup = BeautifulSoup(page_html, 'html.parser')
     except Exception as e:
         raise Exception(f"无法访问 Fandom Wiki: {e}")
     
@@ -983,6 +1293,7 @@ def main():
     songs_info = songs_info_dedup
 
     print(f"共找到 {len(songs_info)} 首乐曲")
+    report(f"已获取乐曲列表，共 {len(songs_info)} 首")
 
     # 第一轮：按 title 初步匹配，包括外部title
     candidates = [info for info in songs_info
@@ -1000,7 +1311,8 @@ def main():
             'missing_results': [],
             'added': 0,
             'added_titles': [],
-            'total': len(data)
+            'total': len(data),
+            'changeset': build_changeset(original_data, data)
         }
 
     # 收集所有需要处理的任务：缺失信息的歌曲 + 新歌曲候选
@@ -1011,6 +1323,25 @@ def main():
     update_results = []  # 缺失信息更新结果
     new_count = 0        # 新增歌曲计数
     new_titles = []      # 新增歌曲标题
+    merged_urls = set()  # 已成功解析并合并到乐曲数据的页面（只记录这些页面的修订号）
+
+    # 新候选页面的修订号
+    if candidates:
+        revisions.update(fetch_revisions(session, [_page_name_from_url(info['href']) for info in candidates]))
+
+    def _unchanged(url):
+        """页面修订号与上次处理时相同（重新解析也不会得到新数据）"""
+        title, revid = revisions.get(_page_name_from_url(url), (None, None))
+        return revid is not None and revision_cache["pages"].get(title) == revid
+
+    # 并发批量获取修订号有变化的页面的 wikitext，之后按原顺序逐个解析合并
+    urls = [url for url in missing_urls + [info['href'] for info in candidates] if not _unchanged(url)]
+    unchanged_count = len(missing_urls) + len(candidates) - len(urls)
+    if unchanged_count:
+        print(f"  {unchanged_count} 个页面自上次更新后没有新修订，跳过")
+    if urls:
+        report(f"正在获取 {len(urls)} 个有更新的乐曲页面……")
+    wikitexts = fetch_wikitexts(session, urls) if urls else {}
     
     # ========== 处理缺失信息的歌曲 ==========
     if songs_with_missing:
@@ -1024,7 +1355,15 @@ def main():
             print(f"\n[更新 {idx}/{len(songs_with_missing)}] {song['title']}")
             print(f"  缺失项: {', '.join(missing)}")
             
-            updated_song, updated_fields = update_song_from_wiki(session, song)
+            if 'source_url' in song and _unchanged(song['source_url']):
+                updated_song, updated_fields = None, []
+                print("  页面没有新修订，跳过")
+            else:
+                _, wikitext = wikitexts.get(song.get('source_url'), (None, ""))
+                updated_song, updated_fields = update_song_from_wiki(session, song, wikitext)
+                if updated_song is not None:
+                    # 页面解析成功（即使没有新数据，页面不变时重新解析结果也一样）
+                    merged_urls.add(song['source_url'])
             
             if updated_song and updated_fields:
                 # 在原数据中找到并更新
@@ -1050,8 +1389,6 @@ def main():
                     'success': False
                 })
                 print(f"  ✗ 更新失败或无新数据")
-            
-            time.sleep(0.5)
     
     # ========== 处理新歌曲候选 ==========
     if candidates:
@@ -1060,24 +1397,15 @@ def main():
         print("-" * 60)
 
     for info in candidates:
-        final_url = get_final_url(session, info['href'])
-        raw_page = final_url.rsplit('/wiki/', 1)[-1]
-        page_name = unquote(raw_page)
-
-        wikitext = fetch_wikitext(session, page_name)
-        if not wikitext:
-            print(f"  无法获取 wikitext ({page_name})，跳过")
+        if _unchanged(info['href']):
             continue
-        wikicode = mwparserfromhell.parse(wikitext)
-        tmpl = next((t for t in wikicode.filter_templates() if t.name.strip().lower() == 'song'), None)
-
-        def get_field(field):
-            if not tmpl or not tmpl.has(field):
-                return ''
-            val = str(tmpl.get(field).value)
-            val = clean_ref(val)
-            val = clean_wiki_links(val)
-            return replace_br(val).strip()
+        fetched = wikitexts.get(info['href'])
+        if not fetched:
+            print(f"  无法获取 wikitext ({_page_name_from_url(info['href'])})，跳过")
+            continue
+        page_name, wikitext = fetched
+        final_url = f"{BASE_URL}/wiki/{_title_path(page_name)}"
+        wikicode, get_field = parse_song_page(wikitext)
 
         # 处理章节：time limited 转 Event
         raw_chap_left = get_field('Chapter')
@@ -1101,6 +1429,7 @@ def main():
                     if 'title_outside' not in item:
                         item['title_outside'] = info['display_title']
                     break
+            merged_urls.add(info['href'])
             continue
 
         # 解析标题：取更长的那个
@@ -1146,30 +1475,30 @@ def main():
 
         # 附加 Trivia
         if '==Trivia==' in wikitext:
-            trivia = [clean_wiki_links(clean_ref(item.strip())) for item in re.findall(r"\*([^\n]+)", wikitext.split('==Trivia==')[1])]
-            song['Trivia'] = trivia
+            song['Trivia'] = parse_trivia(wikitext)
 
         # 附加 Legacy Table
-        legacy = {}
-        for t in wikicode.filter_templates():
-            if t.name.strip().lower() == 'legacytable':
-                for param in t.params:
-                    key = clean_wiki_links(str(param.name).strip())
-                    val = replace_br(clean_ref(str(param.value).strip()))
-                    legacy[key] = val
-        song['Legacy'] = legacy
+        song['Legacy'] = dict(iter_legacy_params(wikicode))
 
         # 写入并更新去重集合
         data.append(song)
         existing_chapters_lower.add(real_chapter.lower())
         existing_titles.add(real_title.lower())
         existing_outside.add(info['display_title'].lower())
-        
-        time.sleep(0.5)
+        merged_urls.add(info['href'])
 
-    # 统一保存所有更新
-    with open(SONGS_JSON, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    # 只在有变更时原子地写回文件
+    changeset = build_changeset(original_data, data)
+    if not changeset_is_empty(changeset):
+        write_json_atomic(SONGS_JSON, data)
+
+    # 数据保存后再记录已合并页面的修订号；获取了但没有合并的页面（wikitext为空、解析出错等）
+    # 不记录，下次更新时重试
+    for url in merged_urls:
+        title, revid = revisions.get(_page_name_from_url(url), (None, None))
+        if revid is not None:
+            revision_cache["pages"][title] = revid
+    _save_revision_cache(revision_cache)
 
     # ========== 输出最终报告 ==========
     print("\n" + "=" * 60)
@@ -1214,7 +1543,8 @@ def main():
         'missing_results': update_results,
         'added': new_count,
         'added_titles': new_titles,
-        'total': len(data)
+        'total': len(data),
+        'changeset': changeset
     }
 
 
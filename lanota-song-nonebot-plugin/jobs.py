@@ -0,0 +1,162 @@
+import asyncio
+import functools
+import multiprocessing
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from nonebot.log import logger
+from .config import job_io_workers, job_cpu_workers, render_queue_limit
+from .perf import perf, call_with_samples
+
+class Job:
+    """一个正在运行的具名后台任务"""
+
+    def __init__(self, name, kind, loop):
+        self.name = name
+        self.kind = kind
+        self.status = "排队中"
+        self.started = time.monotonic()
+        self.future = None
+        self._loop = loop
+        self._listeners = []
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def done(self):
+        return self.future is not None and self.future.done()
+
+    def subscribe(self, callback):
+        """订阅进度消息，callback 为接收一个字符串的协程函数"""
+        self._listeners.append(callback)
+
+    def report(self, message):
+        """报告进度（可在工作线程中调用）"""
+        self.status = message
+        self._loop.call_soon_threadsafe(self._dispatch, message)
+
+    def _dispatch(self, message):
+        for callback in self._listeners:
+            task = self._loop.create_task(callback(message))
+            task.add_done_callback(_log_listener_error)
+
+    async def wait(self):
+        """等待任务完成并返回结果（任务异常会在此抛出）"""
+        return await asyncio.shield(self.future)
+
+def _log_listener_error(task):
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning(f"发送任务进度失败: {task.exception()}")
+
+class JobScheduler:
+    """
+    后台任务调度
+
+    io 池运行爬虫等网络任务，cpu 池运行其他计算任务，render 默认与 cpu
+    共用线程池，可通过 use_process_pool 换成进程池。具名任务运行期间
+    再次提交同名任务不会重复启动，而是返回正在运行的那一个。
+    """
+
+    def __init__(self, io_workers=job_io_workers, cpu_workers=job_cpu_workers, render_limit=render_queue_limit):
+        self.pools = {
+            'io': ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix="lanota-io"),
+            'cpu': ThreadPoolExecutor(max_workers=cpu_workers, thread_name_prefix="lanota-cpu"),
+        }
+        self.pools['render'] = self.pools['cpu']
+        # 限制排队深度：超出上限的任务在事件循环中等待，不堆积在线程池/进程池队列里
+        self._limit_sizes = {'render': render_limit}
+        self._limits = {}
+        self._process_args = {}
+        self._jobs = {}
+
+    def use_process_pool(self, kind, workers, initializer=None):
+        """
+        把某类任务换成进程池执行（绕开GIL，多核并行），返回是否成功
+
+        工作进程通过fork创建，继承已加载的模块和字体；创建后立即启动全部进程，
+        initializer 在每个进程启动时执行一次。不支持fork的平台上保持原线程池。
+        """
+        try:
+            context = multiprocessing.get_context("fork")
+        except ValueError:
+            logger.warning("当前系统不支持fork，继续使用线程池执行任务")
+            return False
+        self._process_args[kind] = (workers, context, initializer)
+        self.pools[kind] = self._new_process_pool(kind)
+        return True
+
+    def _new_process_pool(self, kind):
+        workers, context, initializer = self._process_args[kind]
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=initializer)
+        # fork方式会在第一次提交时启动全部进程，这里提前触发
+        pool.submit(int)
+        return pool
+
+    def get(self, name):
+        """返回正在运行的同名任务，没有则返回None"""
+        job = self._jobs.get(name)
+        if job is not None and not job.done():
+            return job
+        return None
+
+    def submit(self, name, kind, func, *args, report_progress=False, **kwargs):
+        """
+        提交具名任务，返回 (job, 是否新建)
+
+        report_progress 为True时以 progress=job.report 调用func，
+        任务可以借此把进度发回聊天。
+        """
+        running = self.get(name)
+        if running is not None:
+            return running, False
+        loop = asyncio.get_running_loop()
+        job = Job(name, kind, loop)
+        if report_progress:
+            kwargs['progress'] = job.report
+        job.status = "运行中"
+        job.future = loop.run_in_executor(self.pools[kind], functools.partial(func, *args, **kwargs))
+        job.future.add_done_callback(lambda _: self._forget(name, job))
+        self._jobs[name] = job
+        return job, True
+
+    def _forget(self, name, job):
+        """任务结束后移除记录（同名的新任务已替换它时保留）"""
+        if self._jobs.get(name) is job:
+            del self._jobs[name]
+
+    async def run(self, kind, func, *args, **kwargs):
+        """在指定池中运行一次匿名任务并等待结果（进程池要求func与参数可pickle）"""
+        limit = self._limits.get(kind)
+        if limit is None:
+            size = self._limit_sizes.get(kind, 0)
+            if size <= 0:
+                return await self._run(kind, func, *args, **kwargs)
+            # 在事件循环中创建，避免绑定到别的循环
+            limit = self._limits[kind] = asyncio.Semaphore(size)
+        async with limit:
+            return await self._run(kind, func, *args, **kwargs)
+
+    async def _run(self, kind, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        pool = self.pools[kind]
+        try:
+            if isinstance(pool, ProcessPoolExecutor):
+                # 工作进程中记录的耗时随结果带回主进程
+                result, samples = await loop.run_in_executor(pool, call_with_samples, func, args, kwargs)
+                perf.merge(samples)
+                return result
+            return await loop.run_in_executor(pool, functools.partial(func, *args, **kwargs))
+        except BrokenProcessPool:
+            # 工作进程异常退出后整个池不可用，换一个新池，本次任务按失败处理
+            if self.pools.get(kind) is pool:
+                logger.warning(f"{kind} 进程池已损坏，重新创建")
+                self.pools[kind] = self._new_process_pool(kind)
+            raise
+
+    def shutdown(self):
+        for pool in set(self.pools.values()):
+            pool.shutdown(wait=False, cancel_futures=True)
+
+# 全局任务调度器
+job_scheduler = JobScheduler()
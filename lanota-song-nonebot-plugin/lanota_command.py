@@ -1,15 +1,21 @@
 from nonebot import on_command
+from nonebot.message import run_preprocessor, run_postprocessor
+from nonebot.matcher import Matcher
 from nonebot.adapters.onebot.v11 import Bot, MessageEvent, Message
 from nonebot.params import CommandArg
 from nonebot.typing import T_State
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
+import time
 from datetime import datetime, date
 from .config import *
 from .function import *
+from .catalog import song_catalog
 from .whitelist import whitelist_rule
-from .text_image_text import send_image_or_text
-from .jiaoben.fandom_pachong import main as update_songs
+from .text_image_text import send_image_or_text, send_cached_image_or_text, send_paged_image_or_text
+from .render_cache import render_cache
+from .jobs import job_scheduler
+from .perf import perf
+from .jiaoben.fandom_pachong import main as update_songs, changeset_is_empty
 
 # 初始化命令
 # 命令配置：(命令名, 中文别名, 是否需要白名单规则)
@@ -28,6 +34,7 @@ command_configs = [
     ("category", "cate", True),
     ("table", "定数表", True),
     ("ritmo", "里莫", True),
+    ("stats", "统计", False),  # 仅超级用户
 ]
 
 # 批量创建命令
@@ -72,6 +79,21 @@ la_rating = commands["la_rating"]
 la_category = commands["la_category"]
 la_table = commands["la_table"]
 la_ritmo = commands["la_ritmo"]
+la_stats = commands["la_stats"]
+
+# 命令耗时统计：按matcher类型记录每条la命令从开始处理到结束的耗时
+_command_names = {matcher: name for name, matcher in commands.items()}
+
+@run_preprocessor
+async def _perf_start(matcher: Matcher, state: T_State):
+    if type(matcher) in _command_names:
+        state["_perf_start"] = time.perf_counter()
+
+@run_postprocessor
+async def _perf_stop(matcher: Matcher, state: T_State):
+    start = state.get("_perf_start")
+    if start is not None:
+        perf.observe(f"command.{_command_names[type(matcher)]}", time.perf_counter() - start)
 
 category_map = {
     "main": "main",
@@ -92,14 +114,6 @@ category_map = {
     "无限": "subscription"
 }
 
-# 创建线程池执行器
-executor = ThreadPoolExecutor(max_workers=1)
-
-async def run_in_threadpool(func, *args):
-    """将同步函数放入线程池执行"""
-    loop = asyncio.get_running_loop()
-    return await loop.run_in_executor(executor, func, *args)
-
 # 处理手动更新命令
 @la_update.handle()
 async def handle_update(bot: Bot, event: MessageEvent):
@@ -111,11 +125,26 @@ async def handle_update(bot: Bot, event: MessageEvent):
         return
     
     try:
-        # 执行爬虫脚本（异步方式）
-        await la_update.send("开始更新乐曲数据，请稍候...")
+        # 爬虫作为具名任务在io池中运行，同一时间只会有一个更新任务
+        job, created = job_scheduler.submit("update_songs", "io", update_songs, report_progress=True)
+        if not created:
+            await la_update.finish(f"乐曲数据正在更新中（{job.status}，已运行{int(job.elapsed)}秒），请稍候")
+            return
         
-        # 在单独的线程中运行同步爬虫函数
-        result = await run_in_threadpool(update_songs)
+        async def send_progress(message):
+            await bot.send(event, message)
+        job.subscribe(send_progress)
+        
+        await la_update.send("开始更新乐曲数据，请稍候...")
+        result = await job.wait()
+        # 按变更集更新内存中的乐曲目录，没有变更集时整体重新加载
+        changeset = result.get('changeset') if isinstance(result, dict) else None
+        if changeset is None:
+            await reload_catalog_async()
+            render_cache.clear()
+        elif not changeset_is_empty(changeset):
+            song_catalog.apply_changeset(changeset)
+            render_cache.clear()
         
         # 解析结果并发送
         if isinstance(result, dict):
@@ -174,7 +203,7 @@ async def handle_update(bot: Bot, event: MessageEvent):
 @la_today.handle()
 async def handle_today(bot: Bot, event: MessageEvent):
     user_id = event.get_user_id()
-    today_song = get_user_today_song(user_id)
+    today_song = await get_user_today_song_async(user_id)
     
     if not today_song:
         await send_image_or_text(user_id, la_today, "今日乐曲获取失败，可能是乐曲数据未加载")
@@ -190,7 +219,7 @@ async def handle_random(bot: Bot, event: MessageEvent, state: T_State, args: Mes
     user_id = event.get_user_id()
     arg = args.extract_plain_text().strip().lower()
     
-    song_data = load_song_data()
+    song_data = await load_song_data_async()
     
     if not song_data:
         await send_image_or_text(user_id, la_random, "没有可用的乐曲数据")
@@ -321,8 +350,8 @@ async def handle_alias(bot: Bot, event: MessageEvent, state: T_State, args: Mess
         return
     
     action = parts[0].lower()
-    alias_data = load_alias_data()
-    song_data = load_song_data()
+    alias_data = await load_alias_data_async()
+    song_data = await load_song_data_async()
     all_titles = {song['title'].lower() for song in song_data}
     
     if action == "add":
@@ -339,7 +368,7 @@ async def handle_alias(bot: Bot, event: MessageEvent, state: T_State, args: Mess
         alias = split_result[0].strip()
         search_term = split_result[1].strip()
         
-        matched_songs, _, total_count = find_song_by_search_term(search_term, song_data, alias_data)
+        matched_songs, _, total_count = await find_song_by_search_term_async(search_term, song_data, alias_data)
         
         if not matched_songs:
             await send_image_or_text(user_id, la_alias, f"没有找到章节号、ID或原名为[{search_term}]的乐曲")
@@ -370,7 +399,7 @@ async def handle_alias(bot: Bot, event: MessageEvent, state: T_State, args: Mess
         
         if alias not in alias_data[std_name]:
             alias_data[std_name].append(alias)
-            save_alias_data(alias_data)
+            await save_alias_data_async(alias_data)
             await send_image_or_text(user_id, la_alias, f"成功为[{std_name}]添加别名[{alias}]")
         else:
             await send_image_or_text(user_id, la_alias, f"[{alias}]已经是[{std_name}]的别名")
@@ -386,7 +415,7 @@ async def handle_alias(bot: Bot, event: MessageEvent, state: T_State, args: Mess
                 break
         
         if deld:
-            save_alias_data(alias_data)
+            await save_alias_data_async(alias_data)
             await send_image_or_text(user_id, la_alias, f"成功删除别名[{alias}]")
         else:
             await send_image_or_text(user_id, la_alias, f"未找到别名[{alias}]")
@@ -397,7 +426,7 @@ async def handle_alias(bot: Bot, event: MessageEvent, state: T_State, args: Mess
             return
         
         search_term = parts[1].strip()
-        matched_songs, _, total_count = find_song_by_search_term(search_term, song_data, alias_data)
+        matched_songs, _, total_count = await find_song_by_search_term_async(search_term, song_data, alias_data)
         
         if not matched_songs:
             await send_image_or_text(user_id, la_alias, f"没有找到章节号、ID、别名或原名为[{search_term}]的乐曲")
@@ -442,10 +471,10 @@ async def handle_find(bot: Bot, event: MessageEvent, state: T_State, args: Messa
                               "5. 模糊匹配曲名或别名")
         return
     
-    song_data = load_song_data()
-    alias_data = load_alias_data()
+    song_data = await load_song_data_async()
+    alias_data = await load_alias_data_async()
     
-    matched_songs, match_type, total_count = find_song_by_search_term(search_term, song_data, alias_data)
+    matched_songs, match_type, total_count = await find_song_by_search_term_async(search_term, song_data, alias_data)
     
     if not matched_songs:
         await send_image_or_text(user_id, la_find, f"没有找到与[{search_term}]相关的乐曲")
@@ -466,129 +495,46 @@ async def handle_find(bot: Bot, event: MessageEvent, state: T_State, args: Messa
 @la_time.handle()
 async def handle_time(bot: Bot, event: MessageEvent):
     user_id = event.get_user_id()
-    song_data = load_song_data()
+    song_data = await load_song_data_async()
     
     if not song_data:
         await send_image_or_text(user_id, la_time, "没有可用的乐曲数据")
         return
     
-    def parse_time(time_str):
-        try:
-            m, s = map(int, time_str.split(':'))
-            return m * 60 + s
-        except:
-            return 0
-    
-    processed_songs = []
-    for song in song_data:
-        try:
-            time_str = song['time']
-            seconds = parse_time(time_str)
-            if seconds > 0:
-                processed_songs.append({
-                    'song': song,
-                    'seconds': seconds,
-                    'time_str': time_str
-                })
-        except:
-            continue
-    
-    long_songs = [s for s in processed_songs if s['seconds'] > 180]
-    short_songs = [s for s in processed_songs if s['seconds'] < 120]
-    
-    long_songs.sort(key=lambda x: -x['seconds'])
-    short_songs.sort(key=lambda x: x['seconds'])
-    
-    message = "时长统计:\n\n"
-    
-    if long_songs:
-        message += f"长于3分钟的乐曲(共{len(long_songs)}首，时长降序):\n"
-        for i, song_info in enumerate(long_songs, 1):
-            message += f"\n{i}. {song_info['song']['title']} -|- {song_info['time_str']} (Chapter: {song_info['song']['chapter']})"
-        message += '\n'
-    else:
-        message += "没有长于3分钟的乐曲\n"
-    
-    if short_songs:
-        message += f"\n短于2分钟的乐曲(共{len(short_songs)}首，时长升序):"
-        for i, song_info in enumerate(short_songs, 1):
-            message += f"\n{i}. {song_info['song']['title']} -|- {song_info['time_str']} (Chapter: {song_info['song']['chapter']})"
-    else:
-        message += "没有短于2分钟的乐曲"
-    
-    await send_image_or_text(user_id, la_time, message)
+    await send_cached_image_or_text(user_id, la_time, ("time",), lambda: build_time_message(song_data))
 
 # 全部乐曲统计
 @la_all.handle()
 async def handle_all(bot: Bot, event: MessageEvent):
     user_id = event.get_user_id()
-    song_data = load_song_data()
-    
-    category_counts = {}
-    for song in song_data:
-        category = song['category']
-        category_counts[category] = category_counts.get(category, 0) + 1
-    
-    total_songs = len(song_data)
-    
-    category_name_map = {
-        'main': '主线',
-        'side': '支线',
-        'expansion': '曲包',
-        'event': '活动',
-        'subscription': '书房'
-    }
+    song_data = await load_song_data_async()
     
-    category_info = []
-    for category, count in category_counts.items():
-        name = category_name_map.get(category, category)
-        category_info.append(f"{name}: {count}首")
-    
-    message = (
-        f"Lanota曲库统计（Fandom已收录）:\n"
-        f"总乐曲数量: {total_songs}首\n\n"
-        f"按分类统计:\n"
-        + "\n".join(category_info)
-    )
-    
-    await send_image_or_text(user_id, la_all, message)
+    await send_cached_image_or_text(user_id, la_all, ("all",), lambda: build_all_message(song_data))
 
-@la_cal.handle()
-async def handle_cal(bot: Bot, event: MessageEvent, args: Message = CommandArg()):
-    user_id = event.get_user_id()
-    arg = args.extract_plain_text().strip()
-    
-    if not arg:
-        await send_image_or_text(user_id, la_cal, 
-            "用法:\n"
-            "1. 根据曲目计算:\n"
-            "   /la cal harmony数目/tune数目/fail数目/难度/曲目\n"
-            "   示例: /la cal 900/300/50/Master/7-5\n"
-            "2. 直接计算:\n"
-            "   /la cal harmony数目/tune数目/fail数目/物量/等级\n"
-            "   示例: /la cal 900/300/50/1250/16\n"
-            "注意: 如果输入物量总和与总物量不同，会自动调整fail数目\n"
-            "注意: 输入的数字不能为负数")
-        return
-    
+async def _parse_cal_line(line):
+    """
+    解析一行 la cal 参数
+
+    返回 (错误信息, 成绩)，成绩为包含 harmony/tune/fail/notes/level/song/difficulty_type 的字典，
+    直接计算时 song 与 difficulty_type 为None。
+    """
     # 解析参数 - 只取前五个斜杠分割的部分
-    parts = arg.split('/', 4)  # 最多分割4次，得到5个部分
+    parts = line.split('/', 4)  # 最多分割4次，得到5个部分
     if len(parts) < 5:
-        await send_image_or_text(user_id, la_cal, "参数格式错误，需要5个参数用/分隔")
-        return
+        return "参数格式错误，需要5个参数用/分隔", None
     
     try:
         harmony = int(parts[0])
         tune = int(parts[1])
         fail = int(parts[2])
     except ValueError:
-        await send_image_or_text(user_id, la_cal, "前三个参数必须是数字")
-        return
+        return "前三个参数必须是数字", None
     
     # 检查是否为负数
     if harmony < 0 or tune < 0 or fail < 0:
-        await send_image_or_text(user_id, la_cal, "输入的判定/物量不能为负数！")
-        return
+        return "输入的判定/物量不能为负数！", None
+    
+    score = {'harmony': harmony, 'tune': tune, 'fail': fail, 'song': None, 'difficulty_type': None}
     
     # 判断是哪种计算方式
     if parts[3].lower() in ['whisper', 'acoustic', 'ultra', 'master']:
@@ -596,14 +542,13 @@ async def handle_cal(bot: Bot, event: MessageEvent, args: Message = CommandArg()
         difficulty_type = parts[3].lower()
         search_term = parts[4]
         
-        song_data = load_song_data()
-        alias_data = load_alias_data()
+        song_data = await load_song_data_async()
+        alias_data = await load_alias_data_async()
         
-        matched_songs, match_type, total_count = find_song_by_search_term(search_term, song_data, alias_data)
+        matched_songs, match_type, total_count = await find_song_by_search_term_async(search_term, song_data, alias_data)
         
         if not matched_songs:
-            await send_image_or_text(user_id, la_cal, f"没有找到与[{search_term}]相关的乐曲")
-            return
+            return f"没有找到与[{search_term}]相关的乐曲", None
         
         if total_count > 1:
             message = f"找到多个匹配的乐曲({total_count}首)，请使用更精确的搜索词:\n"
@@ -611,211 +556,181 @@ async def handle_cal(bot: Bot, event: MessageEvent, args: Message = CommandArg()
                 message += f"{i}. {song['title']} (Chapter: {song['chapter']}, ID: {song['id']})\n"
             if total_count > 10:
                 message += f"……共{total_count}首"
-            await send_image_or_text(user_id, la_cal, message.strip())
-            return
+            return message.strip(), None
         
         song = matched_songs[0]
         
         # 获取难度和物量
         difficulty_value = song['difficulty'].get(difficulty_type, "未知")
-        notes_value = song['notes'].get(difficulty_type, 0)
+        try:
+            notes_value = int(song['notes'].get(difficulty_type, 0) or 0)
+        except (ValueError, TypeError):
+            notes_value = 0
         
         if difficulty_value == "未知" or notes_value == 0:
-            await send_image_or_text(user_id, la_cal, f"乐曲[{song['title']}]没有{difficulty_type}难度的数据")
-            return
-        
-        # 计算 rating
-        rating, adjusted_fail, adjustment, is_exceeded, is_negative, bonus, base_level = calculate_rating(harmony, tune, fail, notes_value, str(difficulty_value))
-        
-        if is_negative:
-            message = "输入的判定/物量不能为负数！"
-        elif is_exceeded:
-            message = (
-                f"乐曲: {song['title']}\n"
-                f"难度: {difficulty_type.capitalize()} {difficulty_value}\n"
-                f"当前输入总物量为：{harmony + tune + fail}，已经高于本乐曲的物量：{notes_value}，无法计算"
-            )
-        else:
-            message = (
-                f"乐曲: {song['title']}\n"
-                f"难度: {difficulty_type.capitalize()} {difficulty_value}\n"
-                f"总物量: {notes_value}\n"
-                f"输入判定: {harmony + tune + fail} (Harmony: {harmony}, Tune: {tune}, Fail: {fail})\n"
-            )
-            
-            if adjustment != 0:
-                message += (
-                    f"自动调整: Fail {fail} → {adjusted_fail} ({adjustment:+})\n"
-                    f"最终结果: {harmony + tune + adjusted_fail} (Harmony: {harmony}, Tune: {tune}, Fail: {adjusted_fail})\n"
-                )
-            
-            message += (
-                f"单曲Rating: {rating}\n"
-                f"计算方式: ({harmony} + {tune}/3) / {notes_value} * ({base_level} + 1 + 难度加成({bonus}))"
-            )
+            return f"乐曲[{song['title']}]没有{difficulty_type}难度的数据", None
         
+        score.update(song=song, difficulty_type=difficulty_type, notes=notes_value, level=str(difficulty_value))
     else:
         # 方式2: 直接计算
         try:
             notes = int(parts[3])
         except ValueError:
-            await send_image_or_text(user_id, la_cal, "物量参数必须是数字")
-            return
+            return "物量参数必须是数字", None
         
         level = parts[4]
         
         # 验证等级格式
         valid_levels = [str(i) for i in range(1, 17)] + ['13+', '14+', '15+', '16+']
         if level not in valid_levels:
-            await send_image_or_text(user_id, la_cal, "等级必须是1-16或13+,14+,15+,16+")
-            return
+            return "等级必须是1-16或13+,14+,15+,16+", None
         
-        # 计算 rating
-        rating, adjusted_fail, adjustment, is_exceeded, is_negative, bonus, base_level = calculate_rating(harmony, tune, fail, notes, level)
-        
-        if is_negative:
-            message = "输入的判定/物量不能为负数！"
-        elif is_exceeded:
-            message = (
-                f"总物量: {notes}\n"
-                f"等级: {level}\n"
-                f"当前输入总物量为：{harmony + tune + fail}，已经高于输入的物量：{notes}，无法计算"
-            )
+        score.update(notes=notes, level=level)
+    
+    return None, score
+
+def _format_cal_result(score):
+    """单条成绩的详细计算结果"""
+    harmony, tune, fail = score['harmony'], score['tune'], score['fail']
+    notes, level, song = score['notes'], score['level'], score['song']
+    
+    # 计算 rating
+    rating, adjusted_fail, adjustment, is_exceeded, is_negative, bonus, base_level = calculate_rating(harmony, tune, fail, notes, level)
+    
+    if is_negative:
+        return "输入的判定/物量不能为负数！"
+    
+    if song is not None:
+        header = (
+            f"乐曲: {song['title']}\n"
+            f"难度: {score['difficulty_type'].capitalize()} {level}\n"
+        )
+    else:
+        header = (
+            f"总物量: {notes}\n"
+            f"等级: {level}\n"
+        )
+    
+    if is_exceeded:
+        target = "本乐曲的物量" if song is not None else "输入的物量"
+        return header + f"当前输入总物量为：{harmony + tune + fail}，已经高于{target}：{notes}，无法计算"
+    
+    message = header
+    if song is not None:
+        message += f"总物量: {notes}\n"
+    message += f"输入判定: {harmony + tune + fail} (Harmony: {harmony}, Tune: {tune}, Fail: {fail})\n"
+    
+    if adjustment != 0:
+        message += (
+            f"自动调整: Fail {fail} → {adjusted_fail} ({adjustment:+})\n"
+            f"最终结果: {harmony + tune + adjusted_fail} (Harmony: {harmony}, Tune: {tune}, Fail: {adjusted_fail})\n"
+        )
+    
+    message += (
+        f"单曲Rating: {rating}\n"
+        f"计算方式: ({harmony} + {tune}/3) / {notes} * ({base_level} + 1 + 难度加成({bonus}))"
+    )
+    return message
+
+async def _format_cal_batch(lines):
+    """多行成绩：解析后一次批量计算，每行输出一条简要结果"""
+    parsed = [await _parse_cal_line(line) for line in lines]
+    scores = [score for error, score in parsed if score is not None]
+    result = calculate_ratings(
+        [s['harmony'] for s in scores], [s['tune'] for s in scores], [s['fail'] for s in scores],
+        [s['notes'] for s in scores], [s['level'] for s in scores]
+    )
+    
+    message = f"共{len(lines)}条成绩:\n"
+    k = 0
+    for i, (line, (error, score)) in enumerate(zip(lines, parsed), 1):
+        if score is None:
+            message += f"{i}. {line}: {error.splitlines()[0]}\n"
+            continue
+        if score['song'] is not None:
+            name = f"{score['song']['title']} {score['difficulty_type'].capitalize()} {score['level']}"
         else:
-            message = (
-                f"总物量: {notes}\n"
-                f"等级: {level}\n"
-                f"输入判定: {harmony + tune + fail} (Harmony: {harmony}, Tune: {tune}, Fail: {fail})\n"
-            )
-            
+            name = f"物量{score['notes']} 等级{score['level']}"
+        total = score['harmony'] + score['tune'] + score['fail']
+        if result['exceeded'][k]:
+            message += f"{i}. {name}: 输入总物量{total}高于物量{score['notes']}，无法计算\n"
+        else:
+            message += f"{i}. {name}: Rating {float(result['rating'][k])}"
+            adjustment = int(result['adjustment'][k])
             if adjustment != 0:
-                message += (
-                    f"自动调整: Fail {fail} → {adjusted_fail} ({adjustment:+})\n"
-                    f"最终结果: {harmony + tune + adjusted_fail} (Harmony: {harmony}, Tune: {tune}, Fail: {adjusted_fail})\n"
-                )
-            
-            message += (
-                f"单曲Rating: {rating}\n"
-                f"计算方式: ({harmony} + {tune}/3) / {notes} * ({base_level} + 1 + 难度加成({bonus}))"
-            )
+                message += f" (Fail {score['fail']} → {int(result['adjusted_fail'][k])})"
+            message += "\n"
+        k += 1
+    return message.strip()
+
+@la_cal.handle()
+async def handle_cal(bot: Bot, event: MessageEvent, args: Message = CommandArg()):
+    user_id = event.get_user_id()
+    arg = args.extract_plain_text().strip()
     
-    await send_image_or_text(user_id, la_cal, message)
+    if not arg:
+        await send_image_or_text(user_id, la_cal, 
+            "用法:\n"
+            "1. 根据曲目计算:\n"
+            "   /la cal harmony数目/tune数目/fail数目/难度/曲目\n"
+            "   示例: /la cal 900/300/50/Master/7-5\n"
+            "2. 直接计算:\n"
+            "   /la cal harmony数目/tune数目/fail数目/物量/等级\n"
+            "   示例: /la cal 900/300/50/1250/16\n"
+            "多条成绩可以分行写在同一条消息里，一次算出全部结果\n"
+            "注意: 如果输入物量总和与总物量不同，会自动调整fail数目\n"
+            "注意: 输入的数字不能为负数")
+        return
+    
+    lines = [line.strip() for line in arg.splitlines() if line.strip()]
+    if len(lines) > 1:
+        await send_image_or_text(user_id, la_cal, await _format_cal_batch(lines))
+        return
+    
+    error, score = await _parse_cal_line(lines[0])
+    if error:
+        await send_image_or_text(user_id, la_cal, error)
+        return
+    
+    await send_image_or_text(user_id, la_cal, _format_cal_result(score))
 
 # 物量统计
 @la_notes.handle()
 async def handle_notes(bot: Bot, event: MessageEvent):
     user_id = event.get_user_id()
-    song_data = load_song_data()
+    song_data = await load_song_data_async()
     
     if not song_data:
         await send_image_or_text(user_id, la_notes, "没有可用的乐曲数据")
         return
     
-    # 收集所有谱面数据
-    charts = []
-    for song in song_data:
-        for diff_type in ['whisper', 'acoustic', 'ultra', 'master']:
-            notes_value = song['notes'].get(diff_type, 0)
-            difficulty_value = song['difficulty'].get(diff_type, "未知")
-            
-            if notes_value and difficulty_value != "未知":
-                charts.append({
-                    'title': song['title'],
-                    'notes': int(notes_value),
-                    'difficulty': diff_type.capitalize(),
-                    'difficulty_value': difficulty_value,
-                    'chapter': song['chapter']
-                })
-    
-    # 按物量降序排序
-    charts.sort(key=lambda x: -x['notes'])
-    
-    # 只取前50个
-    top_charts = charts[:50]
-    
-    if not top_charts:
-        await send_image_or_text(user_id, la_notes, "没有找到有效的谱面数据")
-        return
-    
-    # 构建消息
-    message = "物量最高的前50个谱面:\n"
-    for i, chart in enumerate(top_charts, 1):
-        message += f"\n{i}. {chart['title']} -|- 物量{chart['notes']} (难度: {chart['difficulty']} {chart['difficulty_value']}, Chapter: {chart['chapter']})"
-    
-    await send_image_or_text(user_id, la_notes, message)
+    await send_cached_image_or_text(user_id, la_notes, ("notes",), lambda: build_notes_message(song_data),
+                                    empty_text="没有找到有效的谱面数据")
 
 @la_rating.handle()
 async def handle_rating(bot: Bot, event: MessageEvent):
     user_id = event.get_user_id()
-    song_data = load_song_data()
+    song_data = await load_song_data_async()
     
     if not song_data:
         await send_image_or_text(user_id, la_rating, "没有可用的乐曲数据")
         return
     
-    # 1. 获取所有15级以上的Master和Ultra难度谱面
-    high_level_charts = []
-    for song in song_data:
-        for diff_type in ['master', 'ultra']:
-            difficulty_value = song['difficulty'].get(diff_type, "未知")
-            notes_value = song['notes'].get(diff_type, 0)
-            
-            if difficulty_value == "未知" or not notes_value:
-                continue
-            
-            # 确保notes是整数
-            try:
-                notes_value = int(notes_value)
-            except (ValueError, TypeError):
-                continue
-            
-            # 解析难度等级
-            level_str = str(difficulty_value)
-            base_level = 0
-            has_plus = False
-            
-            if level_str.endswith('+'):
-                try:
-                    base_level = float(level_str[:-1])
-                    has_plus = True
-                except ValueError:
-                    continue
-            else:
-                try:
-                    base_level = float(level_str)
-                except ValueError:
-                    continue
-            
-            if base_level >= 15:
-                high_level_charts.append({
-                    'song': song,
-                    'difficulty_type': diff_type.capitalize(),
-                    'difficulty_value': difficulty_value,
-                    'notes': notes_value,
-                    'base_level': base_level,
-                    'has_plus': has_plus,
-                    'level_str': level_str
-                })
-    
-    if not high_level_charts:
+    # 1. 获取所有15级以上的Master和Ultra难度谱面，按等级分组（目录更新后谱面列存储在线程中重建）
+    await get_chart_store_async()
+    level_groups = get_rating_level_groups(song_data)
+    
+    if not level_groups:
         await send_image_or_text(user_id, la_rating, "没有找到15级以上的Master或Ultra难度谱面")
         return
     
-    # 2. 按等级分组
-    level_groups = {}
-    for chart in high_level_charts:
-        level = chart['level_str']
-        if level not in level_groups:
-            level_groups[level] = []
-        level_groups[level].append(chart)
-    
-    # 3. 按等级排序 (16+ > 16 > 15+ > 15)
+    # 2. 按等级排序 (16+ > 16 > 15+ > 15)
     sorted_levels = sorted(level_groups.keys(), key=lambda x: (
         -float(x[:-1] if x.endswith('+') else x),
         -x.endswith('+')
     ))
     
-    # 4. 从每个等级组随机抽取谱面构建B30 (不放回)
+    # 3. 从每个等级组随机抽取谱面构建B30 (不放回)
     b30 = []
     remaining_slots = 30
     
@@ -826,16 +741,8 @@ async def handle_rating(bot: Bot, event: MessageEvent):
         charts_in_level = level_groups[level]
         random.shuffle(charts_in_level)
         
-        # 计算这个等级的最大rating
-        harmony = charts_in_level[0]['notes']
-        tune = 0
-        fail = 0
-        notes = charts_in_level[0]['notes']
-        level_value = charts_in_level[0]['difficulty_value']
-        
-        level_rating, _, _, _, _, _, _ = calculate_rating(
-            harmony, tune, fail, notes, level_value
-        )
+        # 这个等级的最大rating
+        level_rating = charts_in_level[0]['rating']
         
         # 确定这个等级可以取多少谱面
         take = min(len(charts_in_level), remaining_slots)
@@ -863,7 +770,7 @@ async def handle_rating(bot: Bot, event: MessageEvent):
                 'level_str': 'N/A'
             })
     
-    # 5. 计算R5 (从最高rating的谱面中重复选择，直到凑满5个)
+    # 4. 计算R5 (从最高rating的谱面中重复选择，直到凑满5个)
     r5 = []
     if b30:
         # 找出最高rating
@@ -881,12 +788,12 @@ async def handle_rating(bot: Bot, event: MessageEvent):
             # 如果足够就直接随机选择5个
             r5 = random.sample(top_rated, 5)
     
-    # 6. 计算总rating
+    # 5. 计算总rating
     b30_sum = sum(item['rating'] for item in b30)
     r5_sum = sum(item['rating'] for item in r5)
     total_rating = (b30_sum + r5_sum) / 35
     
-    # 7. 构建消息 - 显示完整的30个B30谱面
+    # 6. 构建消息 - 显示完整的30个B30谱面
     message = "════════════ Rating计算 ══════════════\n"
     message += f"▪ 理论Max Rating: {total_rating:.2f}\n"
     message += f"▪ B30平均: {b30_sum/30:.2f}\n"
@@ -904,7 +811,7 @@ async def handle_rating(bot: Bot, event: MessageEvent):
         song_name = item['song']['title'] if item['song'] else "N/A"
         message += f"{i}. {song_name} -|- {item['difficulty_type']} {item['difficulty_value']} (Rating: {item['rating']:.2f})\n"
     
-    await send_image_or_text(user_id, la_rating, message.strip())
+    await send_paged_image_or_text(user_id, la_rating, bot, event, message.strip())
 
 # 处理category命令
 @la_category.handle()
@@ -953,7 +860,7 @@ async def handle_category(bot: Bot, event: MessageEvent, args: Message = Command
         return
     
     # 获取歌曲数据
-    song_data = load_song_data()
+    song_data = await load_song_data_async()
     if not song_data:
         await send_image_or_text(user_id, la_category, "没有可用的乐曲数据")
         return
@@ -1001,7 +908,7 @@ async def handle_category(bot: Bot, event: MessageEvent, args: Message = Command
     if len(songs_to_show) < (max_val - min_val + 1):
         message += f"\n(仅显示前{len(songs_to_show)}首)"
     
-    await send_image_or_text(user_id, la_category, message.strip())
+    await send_paged_image_or_text(user_id, la_category, bot, event, message.strip())
 
 # 处理table命令
 @la_table.handle()
@@ -1009,170 +916,25 @@ async def handle_table(bot: Bot, event: MessageEvent):
     user_id = event.get_user_id()
     
     # 加载两个数据源
-    song_data = load_song_data()  # 歌曲详细信息（含大定数）
+    song_data = await load_song_data_async()  # 歌曲详细信息（含大定数）
     
     if not song_data:
         await send_image_or_text(user_id, la_table, "没有可用的乐曲数据")
         return
     
-    table_data = load_table_data()  # 精确定数表 {"章节号": {"难度": "15.7"}}
+    table_data = await load_table_data_async()  # 精确定数表 {"章节号": {"难度": "15.7"}}
     
     if not table_data:
         # 如果没有精确定数表，回退到使用歌曲数据中的定数
         await send_image_or_text(user_id, la_table, "未找到精确定数表，请检查定数表文件")
         return
     
-    # 收集所有谱面数据
-    charts = []
-    
-    # 从精确定数表获取数据，然后在歌曲数据中找对应的歌曲信息
-    for chapter, difficulties in table_data.items():
-        for difficulty_name, rating_str in difficulties.items():
-            # 标准化难度名称
-            diff_type = difficulty_name.lower()
-            if diff_type not in ['whisper', 'acoustic', 'ultra', 'master']:
-                continue
-            
-            # 在歌曲数据中查找对应的歌曲
-            matching_song = None
-            for song in song_data:
-                if song['chapter'] == chapter:
-                    matching_song = song
-                    break
-            
-            if not matching_song:
-                # 如果找不到对应歌曲，创建一个简化的条目
-                matching_song = {
-                    'chapter': chapter,
-                    'title': f"未找到歌曲 ({chapter})",
-                    'id': 'Unknown'
-                }
-            
-            level_str = str(rating_str)
-            
-            # 检查是否是范围定数 (如 15.7~15.8 或 15.7~15.9)
-            if '~' in level_str:
-                try:
-                    # 分割范围
-                    start_str, end_str = level_str.split('~', 1)
-                    start_val = float(start_str)
-                    end_val = float(end_str)
-                    
-                    # 生成范围内的所有定数 (按0.1递增)
-                    current = start_val
-                    while current <= end_val + 0.05:  # 加一点余量避免浮点精度问题
-                        # 只在最高定数处标记为范围定数
-                        is_highest_in_range = (current >= end_val - 0.05)  # 是否是范围内最高定数
-                        
-                        charts.append({
-                            'song': matching_song,
-                            'difficulty_type': diff_type.capitalize(),
-                            'difficulty_value': rating_str,  # 保留原始精确定数
-                            'sort_value': current,
-                            'display_level': f"{current:.1f}",
-                            'base_level': int(current) if current == int(current) else current,
-                            'is_range': is_highest_in_range,  # 只有最高定数标记为范围
-                            'original_range': level_str
-                        })
-                        current = round(current + 0.1, 1)  # 避免浮点精度问题
-                    continue
-                except ValueError:
-                    # 如果解析失败，按原来的方式处理
-                    pass
-            
-            # 处理普通定数
-            try:
-                if level_str.endswith('+'):
-                    base_level = float(level_str[:-1])
-                    sort_value = base_level + 0.5  # 加号版本排在前面
-                    display_level = level_str  # 保留原格式显示
-                else:
-                    base_level = float(level_str)
-                    sort_value = base_level
-                    display_level = level_str
-                
-                charts.append({
-                    'song': matching_song,
-                    'difficulty_type': diff_type.capitalize(),
-                    'difficulty_value': rating_str,  # 保留原始精确定数
-                    'sort_value': sort_value,
-                    'display_level': display_level,
-                    'base_level': int(base_level) if base_level == int(base_level) else base_level,
-                    'is_range': False,
-                    'original_range': None
-                })
-            except ValueError:
-                continue
-    
-    # 按定数从高到低排序，范围定数排在同定数的最后
-    charts.sort(key=lambda x: (-x['sort_value'], x['original_range'] is not None))
-    
-    if not charts:
+    message = build_table_message(song_data, table_data)
+    if not message:
         await send_image_or_text(user_id, la_table, "没有找到有效的谱面数据")
         return
     
-    # 构建消息
-    message = "Lanota 民间定数表\n\n"
-    
-    current_level_group = None  # 当前等级组 (如 16+, 16, 15+ 等)
-    current_exact_level = None   # 当前精确定数 (如 16.5, 16.4 等)
-    
-    for chart in charts:
-        set_huanhang = False
-        # 判断等级组 (16+统一为16，15+统一为15等)
-        base_level = int(chart['base_level'])
-        
-        # 检查该等级是否有加号版本 - 检查歌曲数据中的实际难度值
-        has_plus_in_group = False
-        for c in charts:
-            if int(c['base_level']) == base_level:
-                # 获取歌曲的实际难度值
-                song_difficulty = c['song'].get('difficulty', {}).get(c['difficulty_type'].lower(), '')
-                if str(song_difficulty).endswith('+'):
-                    has_plus_in_group = True
-                    break
-        
-        # 构建等级组标题
-        if has_plus_in_group:
-            level_group = f"标级：{base_level}（+）"
-        else:
-            level_group = f"标级：{base_level}"
-        
-        # 判断精确定数
-        exact_level = chart['sort_value']
-        
-        # 如果等级组变化，添加大分隔线
-        if current_level_group != level_group:
-            if current_level_group is not None:  # 不是第一个
-                message += "\n"
-            message += f"══════════════\n{level_group}\n══════════════\n"
-            current_level_group = level_group
-            current_exact_level = None  # 重置精确定数
-            set_huanhang = True
-        
-        # 如果精确定数变化，添加定数标题和换行
-        if current_exact_level != exact_level:
-            if current_exact_level is not None:  # 不是该等级组的第一个定数
-                message += "\n"
-            if set_huanhang:
-                message += "\n"
-                set_huanhang = False
-            message += f"定数 {exact_level}：\n"
-            current_exact_level = exact_level
-        
-        # 获取歌曲信息表里的难度 (大定数)
-        song_difficulty = chart['song'].get('difficulty', {}).get(chart['difficulty_type'].lower(), '未知')
-        song_id = chart['song'].get('id', 'Unknown')
-        
-        # 添加歌曲信息
-        if chart['is_range']:
-            # 范围定数的特殊标签
-            range_tag = f"[范围定数: {chart['original_range']}]"
-            message += f"{chart['song']['chapter']} -|- {chart['song']['title']} (ID: {song_id}) [{chart['difficulty_type']} {song_difficulty}] {range_tag}\n"
-        else:
-            message += f"{chart['song']['chapter']} -|- {chart['song']['title']} (ID: {song_id}) [{chart['difficulty_type']} {song_difficulty}]\n"
-    
-    await send_image_or_text(user_id, la_table, message.strip())
+    await send_paged_image_or_text(user_id, la_table, bot, event, message, cache_key=("table",))
 
 # 处理help命令
 help_categories = {
@@ -1238,7 +1000,8 @@ help_categories = {
         "aliases": ["cal", "计算", "定数"],
         "commands": [
             "/la cal harmony数目/tune数目/fail数目/难度/曲目 - 根据曲目计算rating",
-            "/la cal harmony数目/tune数目/fail数目/物量/等级 - 直接计算rating"
+            "/la cal harmony数目/tune数目/fail数目/物量/等级 - 直接计算rating",
+            "多条成绩分行输入可一次计算全部rating"
         ],
         "priority": [
             "1. 前三个参数必须是数字",
@@ -1329,7 +1092,7 @@ async def handle_help(bot: Bot, event: MessageEvent, args: Message = CommandArg(
             "示例: /la help random"
         )
         
-        await send_image_or_text(user_id, la_help, main_help)
+        await send_cached_image_or_text(user_id, la_help, ("help",), lambda: main_help)
         return
     
     # 查找匹配的分类
@@ -1365,7 +1128,7 @@ async def handle_help(bot: Bot, event: MessageEvent, args: Message = CommandArg(
         help_text += "══════════════\n"
         help_text += "输入 /la help 查看主菜单"
         
-        await send_image_or_text(user_id, la_help, help_text)
+        await send_cached_image_or_text(user_id, la_help, ("help", matched_category['name']), lambda: help_text)
     else:
         await send_image_or_text(user_id, la_help, "未找到该分类，\n请输入 /la help\n查看所有分类")
 
@@ -1438,4 +1201,26 @@ async def handle_ritmo(bot: Bot, event: MessageEvent):
     message += f"总共: {total_days}天\n"
     message += f"让我们看看可爱的小里莫\n什么时候才能睡醒吧~"
     
-    await send_image_or_text(user_id, la_ritmo, message)
\ No newline at end of file
+    await send_image_or_text(user_id, la_ritmo, message)
+
+# 处理stats命令
+@la_stats.handle()
+async def handle_stats(bot: Bot, event: MessageEvent, args: Message = CommandArg()):
+    user_id = event.get_user_id()
+    
+    # 检查是否为超级用户
+    if user_id not in bot.config.superusers:
+        await la_stats.finish("权限不足，只有超级用户可以使用此命令")
+        return
+    
+    sub_command = args.extract_plain_text().strip().lower()
+    if sub_command != "perf":
+        await la_stats.finish("用法：la stats perf")
+        return
+    
+    # 顺便写一次Prometheus文本文件
+    try:
+        await asyncio.to_thread(perf.dump, perf_dump_path)
+    except OSError as e:
+        print(f"写入耗时统计失败: {e}")
+    await send_image_or_text(user_id, la_stats, perf.format_report())
@@ -0,0 +1,154 @@
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Prometheus 直方图的桶上界（秒）
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, math.inf)
+# 计算分位数时保留的最近样本数
+RECENT_SAMPLES = 1024
+
+class Histogram:
+    """单个阶段的耗时统计：累计桶计数（给Prometheus）+ 最近样本（算分位数）"""
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=RECENT_SAMPLES)
+
+    def observe(self, seconds):
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+        self.recent.append(seconds)
+
+    def quantile(self, q):
+        if not self.recent:
+            return 0.0
+        samples = sorted(self.recent)
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+class PerfRecorder:
+    """
+    进程内耗时统计
+
+    按阶段名记录耗时直方图，可输出 p50/p95/p99 文本报告或
+    Prometheus 文本格式（可定时写入文件供 textfile collector 采集）。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hists = {}
+        self._task = None
+        self._captured = None
+
+    def observe(self, name, seconds):
+        if self._captured is not None:
+            # 工作进程中：只收集样本，由主进程计入
+            self._captured.append((name, seconds))
+            return
+        with self._lock:
+            hist = self._hists.get(name)
+            if hist is None:
+                hist = self._hists[name] = Histogram()
+            hist.observe(seconds)
+
+    def merge(self, samples):
+        """计入工作进程返回的 [(阶段, 耗时)] 样本"""
+        for name, seconds in samples:
+            self.observe(name, seconds)
+
+    @contextmanager
+    def timer(self, name):
+        """统计 with 块的耗时"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def snapshot(self):
+        """返回 {阶段: (次数, p50, p95, p99, 最大值)}，单位秒"""
+        with self._lock:
+            return {
+                name: (h.count, h.quantile(0.5), h.quantile(0.95), h.quantile(0.99), h.max)
+                for name, h in sorted(self._hists.items())
+            }
+
+    def format_report(self):
+        """耗时报告文本（毫秒）"""
+        snapshot = self.snapshot()
+        if not snapshot:
+            return "暂无耗时数据"
+        lines = ["阶段耗时（ms）：次数 | p50 | p95 | p99 | max"]
+        for name, (count, p50, p95, p99, peak) in snapshot.items():
+            lines.append(f"{name}: {count} | {p50 * 1000:.1f} | {p95 * 1000:.1f} | {p99 * 1000:.1f} | {peak * 1000:.1f}")
+        return "\n".join(lines)
+
+    def prometheus_text(self):
+        """Prometheus 文本格式"""
+        lines = [
+            "# HELP lanota_stage_seconds Time spent in each command/render stage.",
+            "# TYPE lanota_stage_seconds histogram",
+        ]
+        with self._lock:
+            for name, h in sorted(self._hists.items()):
+                cumulative = 0
+                for bound, count in zip(BUCKETS, h.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == math.inf else repr(bound)
+                    lines.append(f'lanota_stage_seconds_bucket{{stage="{name}",le="{le}"}} {cumulative}')
+                lines.append(f'lanota_stage_seconds_sum{{stage="{name}"}} {h.sum}')
+                lines.append(f'lanota_stage_seconds_count{{stage="{name}"}} {h.count}')
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path):
+        """写入 Prometheus 文本文件（先写临时文件再替换）"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+
+    async def _dump_loop(self, path, interval):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.dump, path)
+            except OSError as e:
+                print(f"写入耗时统计失败: {e}")
+
+    def start_dump(self, path, interval):
+        """启动定时写文件任务，interval<=0 时不启动"""
+        if interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._dump_loop(path, interval))
+
+    def stop_dump(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+# 全局耗时统计
+perf = PerfRecorder()
+
+def call_with_samples(func, args, kwargs):
+    """
+    在工作进程中执行func，返回 (结果, 期间记录的耗时样本)
+
+    进程池中的任务经此调用，主进程用 perf.merge 计入样本，
+    否则工作进程里记录的耗时不会出现在 la stats perf 中。
+    """
+    perf._captured = []
+    try:
+        return func(*args, **kwargs), perf._captured
+    finally:
+        perf._captured = None
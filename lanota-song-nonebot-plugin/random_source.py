@@ -0,0 +1,127 @@
+import asyncio
+import secrets
+import time
+from collections import deque
+from nonebot.log import logger
+from .config import (random_org_timeout, random_pool_batch, random_pool_low,
+                     random_breaker_failures, random_breaker_cooldown)
+
+# 预取的原始随机数范围 [0, RANDOM_SPAN)，使用时再映射到所需区间
+RANDOM_SPAN = 1_000_000_000
+
+class RandomOrgFetcher:
+    """从 random.org 批量获取整数（同步，放在线程中调用）"""
+
+    URL = "https://www.random.org/integers/"
+
+    def __init__(self, timeout=random_org_timeout):
+        self.timeout = timeout
+
+    def fetch(self, count):
+        import requests
+        params = {
+            'num': count, 'min': 0, 'max': RANDOM_SPAN - 1,
+            'col': 1, 'base': 10, 'format': 'plain', 'rnd': 'new',
+        }
+        response = requests.get(self.URL, params=params, timeout=self.timeout)
+        response.raise_for_status()
+        return [int(line) for line in response.text.split()]
+
+class CircuitBreaker:
+    """连续失败达到阈值后断开，冷却时间过后再放行一次试探"""
+
+    def __init__(self, max_failures=random_breaker_failures, cooldown=random_breaker_cooldown):
+        self.max_failures = max_failures
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+
+    def allow(self):
+        if self.opened_at is None:
+            return True
+        return time.monotonic() - self.opened_at >= self.cooldown
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.max_failures:
+            self.opened_at = time.monotonic()
+
+class TrueRandomSource:
+    """
+    真随机数来源
+
+    后台成批预取 random.org 的整数放进本地池，取数只从池中拿，
+    池空时立即退回 secrets，不会在命令处理中等待网络。
+    池低于水位时触发一次后台补充；请求超时或连续失败时由熔断器暂停访问。
+    """
+
+    def __init__(self, fetcher=None, batch=random_pool_batch, low_water=random_pool_low,
+                 timeout=random_org_timeout, breaker=None):
+        self.fetcher = fetcher or RandomOrgFetcher(timeout)
+        self.batch = batch
+        self.low_water = low_water
+        self.timeout = timeout
+        self.breaker = breaker or CircuitBreaker()
+        self._pool = deque()
+        self._refill_task = None
+
+    def __len__(self):
+        return len(self._pool)
+
+    async def refill(self):
+        """获取一批随机数放入池中，成功返回True"""
+        if not self.breaker.allow():
+            return False
+        try:
+            values = await asyncio.wait_for(
+                asyncio.to_thread(self.fetcher.fetch, self.batch), self.timeout
+            )
+        except Exception as e:
+            self.breaker.record_failure()
+            logger.warning(f"获取真随机数失败，暂用本地随机数: {e!r}")
+            return False
+        self.breaker.record_success()
+        self._pool.extend(v for v in values if 0 <= v < RANDOM_SPAN)
+        return True
+
+    def _schedule_refill(self):
+        if self._refill_task is not None and not self._refill_task.done():
+            return
+        if not self.breaker.allow():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._refill_task = loop.create_task(self.refill())
+
+    def start(self):
+        """启动时预热随机数池"""
+        self._schedule_refill()
+
+    def _draw(self):
+        if self._pool:
+            return self._pool.popleft()
+        return secrets.randbelow(RANDOM_SPAN)
+
+    def randint(self, min_num, max_num):
+        """返回 [min_num, max_num] 内的随机整数（拒绝采样，无取模偏差）"""
+        if len(self._pool) <= self.low_water:
+            self._schedule_refill()
+        n = max_num - min_num + 1
+        if n <= 1:
+            return min_num
+        if n > RANDOM_SPAN:
+            return min_num + secrets.randbelow(n)
+        limit = RANDOM_SPAN - RANDOM_SPAN % n
+        while True:
+            value = self._draw()
+            if value < limit:
+                return min_num + value % n
+
+# 全局随机数来源
+random_source = TrueRandomSource()
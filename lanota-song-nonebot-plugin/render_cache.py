@@ -0,0 +1,50 @@
+import threading
+from collections import OrderedDict
+from .config import render_cache_bytes
+
+def _size(data):
+    if isinstance(data, tuple):
+        return sum(len(page) for page in data)
+    return len(data)
+
+class RenderCache:
+    """
+    渲染结果缓存
+
+    以 (命令, 参数, 目录版本, 背景色) 为键保存编码后的图片bytes
+    （分页渲染时为各页bytes组成的元组），总大小超过上限时按最久未使用淘汰。
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            data = self._items.get(key)
+            if data is not None:
+                self._items.move_to_end(key)
+            return data
+
+    def put(self, key, data):
+        size = _size(data)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= _size(old)
+            self._items[key] = data
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self._bytes -= _size(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+render_cache = RenderCache(render_cache_bytes)
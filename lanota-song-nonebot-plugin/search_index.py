@@ -0,0 +1,105 @@
+def _grams(text, n):
+    """文本的全部n元子串"""
+    return {text[i:i+n] for i in range(len(text) - n + 1)}
+
+class _SubstringIndex:
+    """
+    子串倒排索引（单字+二元组）
+
+    每个文档可以有多段文本；查询时先用查询词的二元组求交集得到候选，
+    再逐个校验真实的子串关系。
+    """
+
+    def __init__(self):
+        self._postings = {}
+        self._texts = {}
+        self._doc_count = 0
+
+    def add(self, doc, texts):
+        self._texts[doc] = texts
+        self._doc_count = max(self._doc_count, doc + 1)
+        for text in texts:
+            keys = _grams(text, 1) | _grams(text, 2)
+            for key in keys:
+                self._postings.setdefault(key, set()).add(doc)
+
+    def search(self, query):
+        """返回包含query的文档编号（升序）"""
+        if not query:
+            return sorted(self._texts)
+        keys = _grams(query, 2) if len(query) >= 2 else {query}
+        postings = sorted((self._postings.get(key, set()) for key in keys), key=len)
+        if not postings or not postings[0]:
+            return []
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates &= posting
+            if not candidates:
+                return []
+        return sorted(doc for doc in candidates
+                      if any(query in text for text in self._texts[doc]))
+
+class SongSearchIndex:
+    """
+    乐曲搜索索引
+
+    按章节号/ID/别名/曲名建立精确匹配字典，并为曲名和别名建立子串索引，
+    查询顺序与匹配类型与 find_song_by_search_term 的线性版本一致。
+    """
+
+    def __init__(self, song_data, alias_data):
+        self.songs = song_data
+        self.by_chapter = {}
+        self.by_id = {}
+        self.by_alias = {}
+        self.by_title = {}
+        self.title_fuzzy = _SubstringIndex()
+        self.alias_fuzzy = _SubstringIndex()
+
+        alias_data = alias_data or {}
+        for pos, song in enumerate(song_data):
+            self.by_chapter.setdefault(song['chapter'].lower(), []).append(pos)
+            self.by_id.setdefault(song['id'], []).append(pos)
+            title_lower = song['title'].lower()
+            self.by_title.setdefault(title_lower, []).append(pos)
+            self.title_fuzzy.add(pos, [title_lower])
+
+            aliases = [a.lower() for a in alias_data.get(song['title'], [])]
+            for alias in set(aliases):
+                self.by_alias.setdefault(alias, []).append(pos)
+            if aliases:
+                self.alias_fuzzy.add(pos, aliases)
+
+    def _songs(self, positions):
+        return [self.songs[pos] for pos in positions]
+
+    def search(self, search_term):
+        """返回 (匹配乐曲列表, 匹配类型)"""
+        term = search_term.lower()
+
+        # 1. 完全匹配章节号
+        if term in self.by_chapter:
+            return self._songs(self.by_chapter[term]), "章节号匹配"
+
+        # 2. 完全匹配ID
+        try:
+            song_id = int(search_term)
+            if song_id in self.by_id:
+                return self._songs(self.by_id[song_id]), "ID匹配"
+        except ValueError:
+            pass
+
+        # 3. 完全匹配别名
+        if term in self.by_alias:
+            return self._songs(self.by_alias[term]), "别名匹配"
+
+        # 4. 完全匹配曲名
+        if term in self.by_title:
+            return self._songs(self.by_title[term]), "曲名匹配"
+
+        # 5. 模糊匹配曲名或别名（合并去重）
+        fuzzy = self._songs(self.title_fuzzy.search(term)) + self._songs(self.alias_fuzzy.search(term))
+        matched_songs = list({song['id']: song for song in fuzzy}.values())
+        if matched_songs:
+            return matched_songs, "模糊搜索"
+        return [], None
@@ -1,12 +1,26 @@
-from PIL import Image, ImageDraw, ImageFont, ImageSequence, ImageFilter
+from PIL import Image, ImageDraw, ImageFont, ImageSequence, ImageFilter, ImageChops, GifImagePlugin
 from pathlib import Path
-import re
-import math
 import asyncio
+import math
+import re
+import time
 import uuid
-from .config import save_dir, font_path, full_path
-from .function import open_data
-from nonebot.adapters.onebot.v11 import MessageSegment
+import io
+import threading
+from collections import OrderedDict
+from .config import save_dir, font_path, image_delivery
+from .user_store import user_store
+from .text_layout import GlyphMetrics, layout_text
+from .catalog import song_catalog
+from .render_cache import render_cache
+from .jobs import job_scheduler
+from .perf import perf
+from nonebot.adapters.onebot.v11 import MessageSegment, Message, GroupMessageEvent
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 # 字体设置
 font_size = 24  # 基础字体大小
@@ -20,6 +34,9 @@ except IOError:
     # 调整默认字体大小使其更合适
     font.size = font_size
 
+# 字形度量缓存
+glyph_metrics = GlyphMetrics(font)
+
 # 画布参数
 MAX_WIDTH = 800                          # 画布最大宽度（像素）
 MAX_IMAGE_HEIGHT = 600                   # 图片最大高度（像素）
@@ -27,6 +44,15 @@ PADDING = 30                             # 四周留白（像素）
 LINE_SPACING = 5                         # 行间距（像素）
 CACHE_LIMIT = 40                         # 缓存文件保留数量
 DEFAULT_BG_COLOR = (247, 219, 255, 255)  # 默认淡紫色
+GRADIENT_BUCKET = 16                     # 背景缓存的尺寸分桶（像素）
+GRADIENT_CACHE_BYTES = 64 * 1024 * 1024  # 背景缓存内存上限（字节）
+PAGE_HEIGHT = 2000                       # 分页渲染时每页内容的最大高度（像素）
+SPRITE_CACHE_LIMIT = 512                 # 固定文字贴图缓存的条目上限
+
+# 乐曲卡片等回复中的固定部分：整行的 ══ 标题 ══ 分隔行，以及 "▪ 曲名: "、"    ├ Ultra: " 这样的行首标签
+STATIC_FRAGMENT = re.compile(r"^═+[^═]*═+$|^\s*[▪┌├└] [^:：]{1,20}[:：] ?")
+# 渲染进程启动时预热的字符
+PRELOAD_GLYPHS = "".join(chr(c) for c in range(32, 127)) + "乐曲难度物量等级章节定数别名曲师谱面作者：，（）【】"
 
 # 在文件顶部添加颜色亮度计算函数
 def get_color_brightness(color):
@@ -41,14 +67,8 @@ def is_dark_color(color, threshold=128):
 def get_user_bg_color(user_id: str):
     """从用户数据中获取背景颜色"""
     try:
-        # 确保文件存在
-        if not full_path.exists():
-            return DEFAULT_BG_COLOR
-
-        data = open_data(full_path)
-
         # 获取用户颜色，如果不存在则返回默认
-        color_str = data.get(str(user_id), {}).get("bg_color")
+        color_str = (user_store.get_user(user_id) or {}).get("bg_color")
         if not color_str:
             return DEFAULT_BG_COLOR
 
@@ -64,37 +84,31 @@ def get_user_bg_color(user_id: str):
     except Exception:
         return DEFAULT_BG_COLOR
 
-def create_gradient_background(width, height, user_id=None):
-    """创建带用户自定义颜色的渐变背景"""
-    # 获取用户颜色
-    if user_id:
-        start_color = get_user_bg_color(user_id)
-    else:
-        start_color = DEFAULT_BG_COLOR
+async def get_user_bg_color_async(user_id):
+    """get_user_bg_color 的异步版本：用户记录不在内存中时在线程中读取"""
+    if not user_id:
+        return DEFAULT_BG_COLOR
+    await user_store.get_user_async(user_id)
+    return get_user_bg_color(user_id)
 
-    # 根据起始颜色决定深色模式
-    dark_mode = is_dark_color(start_color)
+def _cubic_bezier(t, p0, p1, p2, p3):
+    """三次贝塞尔缓动函数"""
+    u = 1 - t
+    return u**3*p0 + 3*u**2*t*p1 + 3*u*t**2*p2 + t**3*p3
 
-    bg = Image.new('RGBA', (width, height), (0, 0, 0, 255) if dark_mode else (255, 255, 255, 255))
+def _render_gradient_ellipses(width, height, start_color, end_color):
+    """逐圈绘制径向渐变（无NumPy时使用）"""
+    bg = Image.new('RGBA', (width, height), end_color)
     draw = ImageDraw.Draw(bg)
 
     center_x, center_y = width // 2, height // 2
     max_radius = math.sqrt(center_x**2 + center_y**2)
 
-    # 渐变颜色配置（深色模式终点为纯黑，浅色模式为白色）
-    end_color = (0, 0, 0, 255) if dark_mode else (255, 255, 255, 255)
-
-    # 使用三次贝塞尔缓动函数控制渐变速度
-    def cubic_bezier(t, p0, p1, p2, p3):
-        """三次贝塞尔缓动函数"""
-        u = 1 - t
-        return u**3*p0 + 3*u**2*t*p1 + 3*u*t**2*p2 + t**3*p3
-
     steps = 256  # 增加采样点使过渡更平滑
     for i in range(steps, 0, -1):
         # 使用贝塞尔曲线控制渐变进度（参数可调整）
         t = i / steps
-        progress = cubic_bezier(t, 0, 0.2, 0.8, 1.0)  # 自定义缓动曲线
+        progress = _cubic_bezier(t, 0, 0.2, 0.8, 1.0)  # 自定义缓动曲线
 
         radius = int(max_radius * progress)
 
@@ -111,88 +125,177 @@ def create_gradient_background(width, height, user_id=None):
                 fill=(r, g, b, 255),
                 outline=None
             )
+    return bg
+
+def _render_gradient_numpy(width, height, start_color, end_color):
+    """
+    向量化径向渐变
+
+    与逐圈绘制等价：每个像素取半径不小于其到中心距离的最小一圈的颜色，
+    通过距离场 + searchsorted 一次查表完成。
+    """
+    center_x, center_y = width // 2, height // 2
+    max_radius = math.sqrt(center_x**2 + center_y**2)
+
+    steps = 256
+    progress = _cubic_bezier(np.arange(1, steps + 1) / steps, 0, 0.2, 0.8, 1.0)
+    radii = (max_radius * progress).astype(np.int64).astype(np.float64)
+    radii[radii <= 0] = -1  # 半径为0的圈不绘制
+
+    start = np.array(start_color[:3], dtype=np.float64)
+    end = np.array(end_color[:3], dtype=np.float64)
+    palette = (start + (end - start) * progress[:, None]).astype(np.uint8)
+    # 最后一行是所有圈之外的底色
+    palette = np.vstack([palette, np.array(end_color[:3], dtype=np.uint8)])
+
+    ys = (np.arange(height) - center_y).astype(np.float64)
+    xs = (np.arange(width) - center_x).astype(np.float64)
+    dist = np.sqrt(ys[:, None] ** 2 + xs[None, :] ** 2)
+    rgb = palette[np.searchsorted(radii, dist, side='left')]
+
+    alpha = np.full((height, width, 1), 255, dtype=np.uint8)
+    return Image.fromarray(np.concatenate([rgb, alpha], axis=2), 'RGBA')
+
+def _render_gradient(width, height, start_color):
+    """渲染一张完整的渐变背景（含模糊）"""
+    # 根据起始颜色决定深色模式（深色模式终点为纯黑，浅色模式为白色）
+    end_color = (0, 0, 0, 255) if is_dark_color(start_color) else (255, 255, 255, 255)
+
+    if np is not None:
+        bg = _render_gradient_numpy(width, height, start_color, end_color)
+    else:
+        bg = _render_gradient_ellipses(width, height, start_color, end_color)
 
     # 应用精细的高斯模糊（半径减小但多次应用效果更好）
     for _ in range(3):
         bg = bg.filter(ImageFilter.GaussianBlur(radius=1))
-
     return bg
 
+class GradientCache:
+    """
+    渐变背景LRU缓存
+
+    以 (分桶宽, 分桶高, 起始颜色) 为键缓存渲染好的背景，
+    取用时从分桶尺寸中心裁剪到实际尺寸；总像素内存超过上限时淘汰最久未用的背景。
+    """
+
+    def __init__(self, max_bytes=GRADIENT_CACHE_BYTES, bucket=GRADIENT_BUCKET):
+        self.max_bytes = max_bytes
+        self.bucket = bucket
+        self._items = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _bucket_size(self, size):
+        return max(self.bucket, -(-size // self.bucket) * self.bucket)
+
+    def get(self, width, height, start_color):
+        key = (self._bucket_size(width), self._bucket_size(height), tuple(start_color[:3]))
+        with self._lock:
+            bg = self._items.get(key)
+            if bg is not None:
+                self._items.move_to_end(key)
+        if bg is None:
+            bg = _render_gradient(key[0], key[1], start_color)
+            self._put(key, bg)
+
+        if bg.size == (width, height):
+            return bg
+        left = (bg.width - width) // 2
+        top = (bg.height - height) // 2
+        return bg.crop((left, top, left + width, top + height))
+
+    def _put(self, key, bg):
+        size = bg.width * bg.height * 4
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._items:
+                return
+            self._items[key] = bg
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, old = self._items.popitem(last=False)
+                self._bytes -= old.width * old.height * 4
+
+gradient_cache = GradientCache()
+
+class SpriteAtlas:
+    """
+    固定文字贴图缓存
+
+    按 (文字, 文字颜色, 描边颜色) 缓存带描边渲染好的RGBA贴图，
+    绘制时直接贴到内容层上，只有可变部分才逐字绘制；超过 limit 个时淘汰最久未用的贴图。
+    """
+
+    def __init__(self, limit=SPRITE_CACHE_LIMIT):
+        self.limit = limit
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, text, text_color, outline_color):
+        """返回 (贴图, 贴图相对绘制起点的偏移, 文字步进宽度)"""
+        key = (text, text_color, outline_color)
+        with self._lock:
+            sprite = self._items.get(key)
+            if sprite is not None:
+                self._items.move_to_end(key)
+        if sprite is None:
+            sprite = self._render(text, text_color, outline_color)
+            with self._lock:
+                self._items[key] = sprite
+                self._items.move_to_end(key)
+                while len(self._items) > self.limit:
+                    self._items.popitem(last=False)
+        return sprite
+
+    @staticmethod
+    def _render(text, text_color, outline_color):
+        draw = ImageDraw.Draw(Image.new("RGBA", (1, 1)))
+        left, top, right, bottom = draw.textbbox((0, 0), text, font=font, stroke_width=1)
+        image = Image.new("RGBA", (max(1, right - left), max(1, bottom - top)), (0, 0, 0, 0))
+        ImageDraw.Draw(image).text((-left, -top), text, font=font, fill=text_color,
+                                   stroke_width=1, stroke_fill=outline_color)
+        return image, (left, top), font.getlength(text)
+
+sprite_atlas = SpriteAtlas()
+
+def create_gradient_background(width, height, bg_color=None):
+    """创建以bg_color为起始颜色的渐变背景（返回的图像只读）"""
+    return gradient_cache.get(width, height, bg_color or DEFAULT_BG_COLOR)
+
 def wrap_text(text, max_chars=20):
     """
     智能换行函数（支持中英文混合、特殊符号处理）
     
     参数：
     - text: 输入文本
-    - max_chars: 每行最大字符单位数
+    - max_chars: 每行最大字符单位数（按一个中文字宽换算为像素宽度）
     
     返回：
-    - 按语义分块的文本行列表
-    
-    处理规则：
-    1. 数学表达式（如1+2）视为1单元
-    2. 英文单词（含下划线）视为1单元
-    3. 单个中文字符视为1单元
-    4. 未匹配到的字符也显示，每个算1单位
+    - 按实际像素宽度换行后的文本行列表
     """
-    lines = []
-    paragraphs = text.split("\n")
-
-    # 改进后的正则表达式模式
-    token_pattern = re.compile(
-        r"($$\d+[\+\-\*/=]+\d+$$|"   # 数学表达式
-        r"[a-zA-Z_]+(?:'[a-zA-Z_]+)*|"  # 英文单词（含下划线）
-        r"\d+|"          # 连续数字
-        r"[^\w\s\u4e00-\u9fff]|"  # 单个符号
-        r"[\u4e00-\u9fff\u3000-\u303f\uff00-\uffef]|"  # 中文字符
-        r"\s)"           # 空白字符
-    )
+    return layout_text(text, max_chars * font_size, glyph_metrics)[0]
 
-    for paragraph in paragraphs:
-        if not paragraph.strip():
-            lines.append("\n")  # 保留空行
+def measure_lines(draw, lines):
+    """
+    测量每行文本尺寸（只测量一次，供计算尺寸和绘制两个阶段共用）
+    
+    返回：
+    - 与lines等长的列表，元素为(宽, 高)，空行为None
+    """
+    metrics = []
+    for line in lines:
+        if line == "\n":
+            metrics.append(None)
             continue
+        bbox = draw.textbbox((0, 0), line, font=font)
+        metrics.append((bbox[2] - bbox[0], bbox[3] - bbox[1]))
+    return metrics
 
-        # 获取所有匹配项及其位置
-        matches = []
-        last_end = 0
-        for match in token_pattern.finditer(paragraph):
-            # 添加未匹配到的字符
-            if match.start() > last_end:
-                unmatched = paragraph[last_end:match.start()]
-                matches.extend(list(unmatched))  # 将未匹配的字符拆分为单个字符
-            matches.append(match.group())
-            last_end = match.end()
-        
-        # 添加最后未匹配的部分
-        if last_end < len(paragraph):
-            unmatched = paragraph[last_end:]
-            matches.extend(list(unmatched))
-
-        current_line = []
-        current_length = 0
-
-        for token in matches:
-            # 每个token视为1个字符单位
-            token_length = 1
-
-            if current_length + token_length <= max_chars:
-                current_line.append(token)
-                current_length += token_length
-            else:
-                if current_line:
-                    lines.append("".join(current_line))
-                current_line = [token]
-                current_length = token_length
-
-        if current_line:
-            lines.append("".join(current_line))
-
-    return lines
-
-def draw_text(draw, lines, y, canvas_width, center=True, user_id=None):
+def draw_text(draw, lines, y, canvas_width, center=True, bg_color=None, metrics=None, layer=None):
     """
-    在画布上绘制多行文本（自动处理溢出）
+    在画布上绘制多行文本（换行时已按像素宽度排版，不再截断）
     
     参数：
     - draw: ImageDraw对象
@@ -200,55 +303,52 @@ def draw_text(draw, lines, y, canvas_width, center=True, user_id=None):
     - y: 起始Y坐标
     - canvas_width: 画布可用宽度
     - center: 是否居中
+    - bg_color: 背景起始颜色，用于判断深色模式
+    - metrics: measure_lines的结果，可选
+    - layer: draw所绘制的RGBA图像，提供时固定部分直接贴预渲染的贴图
     
     返回：
     - 绘制结束后的Y坐标
     """
-    # 获取当前背景色判断深色模式
-    if user_id:
-        bg_color = get_user_bg_color(user_id)
-    else:
-        bg_color = DEFAULT_BG_COLOR
-    dark_mode = is_dark_color(bg_color)
+    dark_mode = is_dark_color(bg_color or DEFAULT_BG_COLOR)
 
-    for line in lines:
-        if line == "\n":  # 处理空行
+    # 描边设置
+    outline_width = 1
+    text_color = (255, 255, 255, 255) if dark_mode else (0, 0, 0, 255)
+    outline_color = (0, 0, 0, 255) if dark_mode else (255, 255, 255, 255)
+
+    if metrics is None:
+        metrics = measure_lines(draw, lines)
+
+    for line, size in zip(lines, metrics):
+        if size is None:  # 处理空行
             y += font_size + LINE_SPACING
             continue
 
-        # 获取文本实际尺寸
-        bbox = draw.textbbox((0, 0), line, font=font)
-        w, h = bbox[2] - bbox[0], bbox[3] - bbox[1]
-
-        # 非居中时的溢出处理
-        if not center and w > canvas_width - 2 * PADDING:
-            max_len = int(len(line) * (canvas_width - 2 * PADDING) / w)
-            line = line[:max(max_len, 1)]
-            bbox = draw.textbbox((0, 0), line, font=font)
-            w = bbox[2] - bbox[0]
+        w, h = size
 
         # 计算X坐标
         x = (canvas_width - w) // 2 if center else PADDING
 
-        # 描边设置
-        outline_width = 1
-        text_color = (255, 255, 255, 255) if dark_mode else (0, 0, 0, 255)
-        outline_color = (0, 0, 0, 255) if dark_mode else (255, 255, 255, 255)
-
-        # 绘制描边
-        for dx in [-outline_width, 0, outline_width]:
-            for dy in [-outline_width, 0, outline_width]:
-                if dx != 0 or dy != 0:
-                    draw.text((x+dx, y+dy), line, font=font, fill=outline_color)
-
-        # 绘制主文字
-        draw.text((x, y), line, font=font, fill=text_color)
+        match = STATIC_FRAGMENT.match(line) if layer is not None else None
+        if match:
+            # 固定部分贴图，剩余的可变部分接在其步进宽度之后绘制
+            sprite, (dx, dy), advance = sprite_atlas.get(match.group(), text_color, outline_color)
+            layer.alpha_composite(sprite, (x + dx, y + dy))
+            rest = line[match.end():]
+            if rest:
+                draw.text((x + advance, y), rest, font=font, fill=text_color,
+                          stroke_width=outline_width, stroke_fill=outline_color)
+        else:
+            # 描边与主文字一次绘制
+            draw.text((x, y), line, font=font, fill=text_color,
+                      stroke_width=outline_width, stroke_fill=outline_color)
         y += h + LINE_SPACING
 
     return y
 
 
-def calculate_content_size(draw, lines, image_size=None):
+def calculate_content_size(draw, lines, image_size=None, metrics=None):
     """
     计算内容总尺寸（文本+图片）
     
@@ -256,6 +356,7 @@ def calculate_content_size(draw, lines, image_size=None):
     - draw: 用于测量的ImageDraw对象
     - lines: 文本行列表
     - image_size: 图片尺寸（宽,高），可选
+    - metrics: measure_lines的结果，可选
     
     返回：
     - (总宽度, 总高度)
@@ -263,14 +364,16 @@ def calculate_content_size(draw, lines, image_size=None):
     max_width = 0
     total_height = 0
 
-    # 测量文本尺寸
-    for line in lines:
-        if line == "\n":
+    if metrics is None:
+        metrics = measure_lines(draw, lines)
+
+    # 累加文本尺寸
+    for size in metrics:
+        if size is None:
             total_height += font_size + LINE_SPACING
             continue
 
-        bbox = draw.textbbox((0, 0), line, font=font)
-        w, h = bbox[2] - bbox[0], bbox[3] - bbox[1]
+        w, h = size
         max_width = max(max_width, w)
         total_height += h + LINE_SPACING
 
@@ -282,22 +385,29 @@ def calculate_content_size(draw, lines, image_size=None):
 
     return max_width, total_height
 
-def generate_frame(text1, text2, base_image=None, center=True, max_chars=20, canvas_size=None, user_id=None):
-    """生成带固定尺寸的单帧"""
+def _scaled_image_size(size):
+    """插图缩放后的尺寸（不放大，宽高都不超过限制）"""
+    max_img_width = min(MAX_WIDTH - 2 * PADDING, font_size * 20)
+    orig_w, orig_h = size
+    scale = min(MAX_IMAGE_HEIGHT / orig_h, max_img_width / orig_w, 1.0)
+    return (int(orig_w * scale), int(orig_h * scale))
+
+def _render_static_layer(text1, text2, img_size=None, center=True, max_chars=20, canvas_size=None, bg_color=None):
+    """
+    排版并绘制背景与文字（插图位置留空）
+    
+    返回：
+    - (画布, 插图左上角坐标)，没有插图时坐标为None
+    """
     dummy = Image.new("RGB", (1, 1))
     draw = ImageDraw.Draw(dummy)
 
-    lines1 = wrap_text(text1, max_chars) if text1 else []
-    lines2 = wrap_text(text2, max_chars) if text2 else []
-
-    img_size = None
-    if base_image:
-        max_img_width = min(MAX_WIDTH - 2 * PADDING, font_size * 20)
-        orig_w, orig_h = base_image.size
-        scale = min(MAX_IMAGE_HEIGHT / orig_h, max_img_width / orig_w, 1.0)
-        img_size = (int(orig_w * scale), int(orig_h * scale))
+    # 按像素宽度排版，同时得到每行尺寸
+    with perf.timer("render.layout"):
+        lines1, metrics1 = layout_text(text1, max_chars * font_size, glyph_metrics) if text1 else ([], [])
+        lines2, metrics2 = layout_text(text2, max_chars * font_size, glyph_metrics) if text2 else ([], [])
 
-    content_width, content_height = calculate_content_size(draw, lines1 + lines2, img_size)
+    content_width, content_height = calculate_content_size(draw, lines1 + lines2, img_size, metrics1 + metrics2)
 
     # 使用传入的固定尺寸或动态计算
     if canvas_size:
@@ -306,30 +416,109 @@ def generate_frame(text1, text2, base_image=None, center=True, max_chars=20, can
         canvas_width = content_width + 2 * PADDING
         canvas_height = content_height + 2 * PADDING
 
-    bg = create_gradient_background(canvas_width, canvas_height, user_id)
-    canvas = Image.new('RGBA', (canvas_width, canvas_height))
-    canvas.paste(bg, (0, 0), bg)
+    with perf.timer("render.background"):
+        bg = create_gradient_background(canvas_width, canvas_height, bg_color)
+        canvas = Image.new('RGBA', (canvas_width, canvas_height))
+        canvas.paste(bg, (0, 0), bg)
 
+    draw_start = time.perf_counter()
     content_layer = Image.new('RGBA', (canvas_width, canvas_height), (0, 0, 0, 0))
     draw = ImageDraw.Draw(content_layer)
     y = PADDING
 
-    y = draw_text(draw, lines1, y, canvas_width, center, user_id=user_id)
+    y = draw_text(draw, lines1, y, canvas_width, center, bg_color=bg_color, metrics=metrics1, layer=content_layer)
 
-    if base_image and img_size:
+    img_pos = None
+    if img_size:
         y += font_size
-        resized_img = base_image.resize(img_size, Image.LANCZOS).convert('RGBA')
-        img_layer = Image.new('RGBA', img_size, (0, 0, 0, 0))
-        img_layer.paste(resized_img, (0, 0), resized_img)
         img_x = (canvas_width - img_size[0]) // 2 if center else PADDING
-        content_layer.paste(img_layer, (img_x, y), img_layer)
+        img_pos = (img_x, y)
         y += img_size[1] + font_size
 
-    y = draw_text(draw, lines2, y, canvas_width, center, user_id=user_id)
+    y = draw_text(draw, lines2, y, canvas_width, center, bg_color=bg_color, metrics=metrics2, layer=content_layer)
 
     canvas = Image.alpha_composite(canvas, content_layer)
+    perf.observe("render.draw", time.perf_counter() - draw_start)
+    return canvas, img_pos
+
+def _image_patch(image, img_size, resample=Image.LANCZOS):
+    """缩放插图并生成可直接合成到画布上的图层"""
+    resized_img = image.resize(img_size, resample).convert('RGBA')
+    img_layer = Image.new('RGBA', img_size, (0, 0, 0, 0))
+    img_layer.paste(resized_img, (0, 0), resized_img)
+    # 与先贴到透明内容层再整体合成的结果一致
+    patch = Image.new('RGBA', img_size, (0, 0, 0, 0))
+    patch.paste(img_layer, (0, 0), img_layer)
+    return patch
+
+def generate_frame(text1, text2, base_image=None, center=True, max_chars=20, canvas_size=None, bg_color=None):
+    """生成带固定尺寸的单帧"""
+    img_size = _scaled_image_size(base_image.size) if base_image else None
+    canvas, img_pos = _render_static_layer(text1, text2, img_size, center, max_chars, canvas_size, bg_color)
+    if img_pos:
+        canvas.alpha_composite(_image_patch(base_image, img_size), img_pos)
     return canvas
 
+class GifCompositor:
+    """
+    GIF 合成器
+
+    背景与文字只排版、绘制一次得到底图，之后每帧只用同一个
+    重采样滤镜缩放原图，再合成到底图的副本上。
+    """
+
+    def __init__(self, text1, text2, frame_size, center=True, max_chars=20, bg_color=None, resample=Image.LANCZOS):
+        self.img_size = _scaled_image_size(frame_size)
+        self.resample = resample
+        self.canvas, self.img_pos = _render_static_layer(text1, text2, self.img_size, center, max_chars, None, bg_color)
+
+    def compose(self, frame):
+        """把一帧合成到底图上，返回RGBA画布"""
+        start = time.perf_counter()
+        canvas = self.canvas.copy()
+        canvas.alpha_composite(_image_patch(frame, self.img_size, self.resample), self.img_pos)
+        perf.observe("render.gif_frame", time.perf_counter() - start)
+        return canvas
+
+def write_gif_stream(output, frames, loop=0):
+    """
+    逐帧量化并写出GIF，不在内存中保留整段动画
+
+    参数：
+    - output: 可写的二进制文件对象
+    - frames: 产生 (RGB帧, 时长ms) 的可迭代对象，各帧尺寸相同
+
+    与上一帧相同的区域不再重复编码，只写出变化区域的最小矩形。
+    """
+    previous = None
+    for frame, duration in frames:
+        if previous is None:
+            bbox = (0, 0) + frame.size
+        else:
+            # 画面完全没变时仍写一个像素，保留这一帧的时长
+            bbox = ImageChops.difference(previous, frame).getbbox() or (0, 0, 1, 1)
+        quantized = frame.crop(bbox).convert("P", palette=Image.Palette.ADAPTIVE)
+        if previous is None:
+            # 第一帧是整帧，逻辑屏幕尺寸与全局调色板都取自它
+            header, _ = GifImagePlugin.getheader(quantized, info={'loop': loop})
+            output.write(b"".join(header))
+        for chunk in GifImagePlugin.getdata(quantized, offset=bbox[:2], duration=duration, include_color_table=True):
+            output.write(chunk)
+        previous = frame
+    output.write(b";")
+
+def init_render_worker():
+    """渲染进程启动时调用：预热常用字符的字形度量和默认背景"""
+    # fork时父进程的其他线程可能正持有这些锁，子进程里换成新锁
+    glyph_metrics._lock = threading.Lock()
+    gradient_cache._lock = threading.Lock()
+    sprite_atlas._lock = threading.Lock()
+    perf._lock = threading.Lock()
+    for ch in PRELOAD_GLYPHS:
+        glyph_metrics.glyph(ch)
+    font.getmask(PRELOAD_GLYPHS)
+    gradient_cache.get(MAX_WIDTH, MAX_IMAGE_HEIGHT, DEFAULT_BG_COLOR)
+
 def clean_cache():
     """清理过期缓存文件"""
     files = sorted(save_dir.glob("send_image*"), key=lambda f: f.stat().st_mtime)
@@ -339,6 +528,13 @@ def clean_cache():
         except:
             pass
 
+def _new_file_id():
+    """只有调试用的file模式才落盘，此时返回输出文件编号，否则返回None"""
+    if image_delivery != "file":
+        return None
+    clean_cache()
+    return uuid.uuid4().hex[:8]
+
 async def generate_image_with_text(text1, image_path, text2, max_chars=20, center=True, user_id=None):
     """
     主生成函数（支持静态图/GIF）
@@ -351,7 +547,7 @@ async def generate_image_with_text(text1, image_path, text2, max_chars=20, cente
     - center: 是否居中
     
     返回：
-    - 生成的文件Path对象
+    - 编码后的图片bytes（memory模式）或生成的文件Path对象（file模式）
     """
     # 参数检查
     if not text1 and not image_path and not text2:
@@ -360,68 +556,117 @@ async def generate_image_with_text(text1, image_path, text2, max_chars=20, cente
     image_path = str(image_path) if image_path else None
     is_gif = image_path and Path(image_path).exists() and image_path.lower().endswith(".gif")
 
-    # 清理缓存（同步操作，但很快）
-    clean_cache()  
-    file_id = uuid.uuid4().hex[:8]
+    file_id = _new_file_id()
+
+    # 渲染任务只接收文本和样式（背景色），可以交给渲染进程执行
+    bg_color = await get_user_bg_color_async(user_id)
 
     try:
         if is_gif:
-            # 将GIF处理放到线程池
-            return await asyncio.to_thread(
-                _process_gif_sync,
-                text1, image_path, text2, max_chars, center, user_id, file_id
-            )
+            with perf.timer("render.total_gif"):
+                return await job_scheduler.run(
+                    "render", _process_gif_sync,
+                    text1, image_path, text2, max_chars, center, bg_color, file_id
+                )
         else:
-            # 静态图片异步化
-            return await asyncio.to_thread(
-                _process_static_image_sync,
-                text1, image_path, text2, max_chars, center, user_id, file_id
-            )
+            with perf.timer("render.total"):
+                return await job_scheduler.run(
+                    "render", _process_static_image_sync,
+                    text1, image_path, text2, max_chars, center, bg_color, file_id
+                )
     except Exception as e:
         print(f"图像生成失败: {str(e)}")
         return None
 
-def _process_gif_sync(text1, image_path, text2, max_chars, center, user_id, file_id):
-    """同步处理GIF的函数"""
+def _process_gif_sync(text1, image_path, text2, max_chars, center, bg_color, file_id):
+    """同步处理GIF的函数（底图只绘制一次，帧按需读取、合成、编码）"""
     gif = Image.open(image_path)
-    gif_frames = [frame.copy() for frame in ImageSequence.Iterator(gif)]
-
-
-    max_size = (0, 0)
-    for frame in gif_frames:
-        temp = generate_frame(text1, text2, frame.convert("RGBA"), center, max_chars, None, user_id)
-        max_size = (max(max_size[0], temp.width), max(max_size[1], temp.height))
-        
-    processed_frames = []
-    durations = []
-
-    for frame in gif_frames:
-        result = generate_frame(text1, text2, frame.convert("RGBA"), 
-                              center, max_chars, max_size, user_id)
-        processed_frames.append(result.convert("RGB"))
-        durations.append(frame.info.get("duration", 100))
-        
-    output_path = save_dir / f"send_image{file_id}.gif"
-    processed_frames[0].save(
-        output_path,
-        save_all=True,
-        append_images=processed_frames[1:],
-        duration=durations,
-        loop=0,
-        optimize=False
+    compositor = GifCompositor(text1, text2, gif.size, center, max_chars, bg_color)
+    frames = (
+        (compositor.compose(frame.convert("RGBA")).convert("RGB"), frame.info.get("duration", 100))
+        for frame in ImageSequence.Iterator(gif)
     )
-    return output_path
+
+    with perf.timer("render.encode_gif"):
+        if file_id:
+            output = save_dir / f"send_image{file_id}.gif"
+            with open(output, "wb") as f:
+                write_gif_stream(f, frames)
+            return output
+        output = io.BytesIO()
+        write_gif_stream(output, frames)
+        return output.getvalue()
 
 
-def _process_static_image_sync(text1, image_path, text2, max_chars, center, user_id, file_id):
+def _process_static_image_sync(text1, image_path, text2, max_chars, center, bg_color, file_id, canvas_size=None):
     """同步处理静态图片的函数"""
     image = Image.open(image_path).convert("RGBA") if image_path else None
-    result = generate_frame(text1, text2, image, center, max_chars, None, user_id)
-    output_path = save_dir / f"send_image{file_id}.png"
-    result.save(output_path)
-    return output_path
+    result = generate_frame(text1, text2, image, center, max_chars, canvas_size, bg_color)
+    output = save_dir / f"send_image{file_id}.png" if file_id else io.BytesIO()
+    with perf.timer("render.encode"):
+        result.save(output, format="PNG")
+    return output if file_id else output.getvalue()
 
 
+def paginate_text(text, max_chars=100, page_height=PAGE_HEIGHT):
+    """
+    按段落把长文本分成内容高度不超过page_height的若干页（单个段落不拆分）
+    
+    返回：
+    - (pages, content_width)：pages 为 [(页文本, 内容高度)]，
+      content_width 为所有页中最宽一行的宽度，各页使用相同的画布宽度
+    """
+    pages = []
+    current, current_height = [], 0
+    content_width = 0
+    for paragraph in text.split("\n"):
+        if not paragraph.strip():
+            if not current and pages:
+                continue  # 新页开头的空行不保留
+            height = font_size + LINE_SPACING
+        else:
+            _, sizes = layout_text(paragraph, max_chars * font_size, glyph_metrics)
+            height = sum(h + LINE_SPACING for _, h in sizes)
+            content_width = max(content_width, max(w for w, _ in sizes))
+        if current and current_height + height > page_height:
+            pages.append(("\n".join(current), current_height))
+            current, current_height = [], 0
+            if not paragraph.strip():
+                continue
+        current.append(paragraph)
+        current_height += height
+    if current:
+        pages.append(("\n".join(current), current_height))
+    return pages, content_width
+
+async def render_pages(pages, content_width, max_chars=100, bg_color=None):
+    """
+    逐页渲染（异步生成器，按顺序产出每页的编码结果）
+    
+    参数为 paginate_text 的结果。每页单独分配画布，同一时间只有当前页和
+    预先开始渲染的下一页，调用方处理当前页（如发送）时下一页已在渲染。
+    """
+    canvas_width = content_width + 2 * PADDING
+
+    def start(index):
+        page_text, height = pages[index]
+        return asyncio.ensure_future(job_scheduler.run(
+            "render", _process_static_image_sync,
+            page_text, None, None, max_chars, False, bg_color, _new_file_id(),
+            (canvas_width, height + 2 * PADDING)
+        ))
+
+    pending = start(0) if pages else None
+    try:
+        for index in range(len(pages)):
+            with perf.timer("render.page"):
+                img = await pending
+            pending = start(index + 1) if index + 1 < len(pages) else None
+            yield img
+    finally:
+        if pending is not None:
+            pending.cancel()
+
 # 以下为消息发送相关函数
 async def send_image_or_text(user_id = None, handler = None, text = "", at_sender=False, forward_text=None, max_chars=100):
     """发送图文消息的便捷函数"""
@@ -436,6 +681,95 @@ async def send_image_or_text(user_id = None, handler = None, text = "", at_sende
     message = (forward_text or "") + (MessageSegment.image(img) if img else text)
     await handler.finish(message, at_sender=at_sender)
 
+async def send_cached_image_or_text(user_id, handler, cache_key, build_text, at_sender=False, max_chars=100, empty_text=None):
+    """
+    发送只依赖目录数据和背景色的图文消息（结果按目录版本缓存）
+    
+    参数：
+    - cache_key: (命令, 参数...) 元组
+    - build_text: 生成文本的函数，只在缓存未命中时调用
+    - empty_text: build_text返回空文本时改为发送的提示
+    """
+    bg_color = await get_user_bg_color_async(user_id)
+    await song_catalog.refresh_async()
+    key = (*cache_key, song_catalog.current_version(), bg_color)
+    img = render_cache.get(key)
+    if img is None:
+        with perf.timer(f"build.{cache_key[0]}"):
+            text = build_text()
+        if not text:
+            await send_image_or_text(user_id, handler, empty_text or "", at_sender)
+            return
+        img = await generate_image_with_text(
+            text1=text,
+            image_path=None,
+            text2=None,
+            max_chars=max_chars,
+            center=False,
+            user_id=user_id
+        )
+        if not img:
+            await handler.finish(text, at_sender=at_sender)
+        if isinstance(img, bytes):
+            render_cache.put(key, img)
+    await handler.finish(MessageSegment.image(img), at_sender=at_sender)
+
+async def send_forward_images(bot, event, images, name="LanotaBot"):
+    """把多张图片作为合并转发发送，不支持合并转发时逐张发送"""
+    nodes = Message(
+        MessageSegment.node_custom(int(bot.self_id), name, Message(MessageSegment.image(img)))
+        for img in images
+    )
+    try:
+        if isinstance(event, GroupMessageEvent):
+            await bot.send_group_forward_msg(group_id=event.group_id, messages=nodes)
+        else:
+            await bot.call_api("send_private_forward_msg", user_id=event.user_id, messages=nodes)
+    except Exception as e:
+        print(f"合并转发失败，改为逐张发送: {str(e)}")
+        for img in images:
+            await bot.send(event, MessageSegment.image(img))
+
+async def send_paged_image_or_text(user_id, handler, bot, event, text, at_sender=False, max_chars=100, cache_key=None):
+    """
+    发送可能很长的图文消息（分页渲染）
+    
+    文本按固定高度分页，第一页渲染完立即发送，其余页面渲染完后合并转发；
+    只有一页时与 send_image_or_text 的效果相同。
+    
+    参数：
+    - cache_key: (命令, 参数...) 元组，不为None时各页结果按目录版本缓存
+    """
+    bg_color = await get_user_bg_color_async(user_id)
+    key = None
+    pages = None
+    if cache_key:
+        await song_catalog.refresh_async()
+        key = (*cache_key, "pages", song_catalog.current_version(), bg_color)
+        pages = render_cache.get(key)
+
+    if pages is None:
+        page_texts, content_width = paginate_text(text, max_chars)
+        pages = []
+        try:
+            async for img in render_pages(page_texts, content_width, max_chars, bg_color):
+                if not pages:
+                    await handler.send(MessageSegment.image(img), at_sender=at_sender)
+                pages.append(img)
+        except Exception as e:
+            print(f"分页渲染失败: {str(e)}")
+            # 还没发出的页面改为发送文本
+            remaining = "\n".join(page_text for page_text, _ in page_texts[len(pages):])
+            await handler.finish(remaining, at_sender=at_sender and not pages)
+        if key and all(isinstance(img, bytes) for img in pages):
+            render_cache.put(key, tuple(pages))
+    elif pages:
+        await handler.send(MessageSegment.image(pages[0]), at_sender=at_sender)
+
+    if len(pages) > 1:
+        await send_forward_images(bot, event, pages[1:])
+    await handler.finish()
+
 async def not_finish_send_image_or_text(user_id = None, handler = None, text = "", at_sender=False, forward_text=None, max_chars=30):
     """发送图文消息的便捷函数(非finish)"""
     img = await generate_image_with_text(
@@ -0,0 +1,128 @@
+import re
+import threading
+
+# 分词规则：
+# 1. 数学表达式（如1+2）视为1单元
+# 2. 英文单词（含下划线）视为1单元
+# 3. 单个中文字符视为1单元
+# 4. 未匹配到的字符也显示，每个字符单独成单元
+TOKEN_PATTERN = re.compile(
+    r"($$\d+[\+\-\*/=]+\d+$$|"   # 数学表达式
+    r"[a-zA-Z_]+(?:'[a-zA-Z_]+)*|"  # 英文单词（含下划线）
+    r"\d+|"          # 连续数字
+    r"[^\w\s\u4e00-\u9fff]|"  # 单个符号
+    r"[\u4e00-\u9fff\u3000-\u303f\uff00-\uffef]|"  # 中文字符
+    r"\s)"           # 空白字符
+)
+
+def tokenize(paragraph):
+    """按分词规则拆分段落，未匹配的字符逐个保留"""
+    tokens = []
+    last_end = 0
+    for match in TOKEN_PATTERN.finditer(paragraph):
+        if match.start() > last_end:
+            tokens.extend(paragraph[last_end:match.start()])
+        tokens.append(match.group())
+        last_end = match.end()
+    if last_end < len(paragraph):
+        tokens.extend(paragraph[last_end:])
+    return tokens
+
+class GlyphMetrics:
+    """
+    单个字体的字形度量缓存
+
+    每个字符只向字体查询一次：(步进宽度, 字形顶部, 字形底部)，
+    之后行宽与行高都由缓存值累加得到，不再调用 textbbox。
+    """
+
+    def __init__(self, font):
+        self.font = font
+        self._glyphs = {}
+        self._lock = threading.Lock()
+
+    def glyph(self, ch):
+        metrics = self._glyphs.get(ch)
+        if metrics is None:
+            with self._lock:
+                advance = self.font.getlength(ch)
+                left, top, right, bottom = self.font.getbbox(ch)
+                # 空白字符没有墨迹，不参与行高
+                if right <= left or bottom <= top:
+                    top, bottom = None, None
+                metrics = (advance, top, bottom)
+                self._glyphs[ch] = metrics
+        return metrics
+
+    def width(self, text):
+        return sum(self.glyph(ch)[0] for ch in text)
+
+    def height(self, text):
+        tops = []
+        bottoms = []
+        for ch in text:
+            _, top, bottom = self.glyph(ch)
+            if top is not None:
+                tops.append(top)
+                bottoms.append(bottom)
+        if not tops:
+            return 0
+        return max(bottoms) - min(tops)
+
+def layout_text(text, max_width, metrics):
+    """
+    按实际像素宽度换行
+
+    参数：
+    - text: 输入文本
+    - max_width: 每行最大像素宽度
+    - metrics: GlyphMetrics
+
+    返回：
+    - (lines, sizes)：lines 为文本行（空行为 "\\n"），
+      sizes 为对应的 (宽, 高)，空行为None
+    """
+    lines = []
+    sizes = []
+
+    def push(line_tokens, line_width):
+        line = "".join(line_tokens)
+        lines.append(line)
+        sizes.append((int(round(line_width)), metrics.height(line)))
+
+    for paragraph in text.split("\n"):
+        if not paragraph.strip():
+            lines.append("\n")  # 保留空行
+            sizes.append(None)
+            continue
+
+        current = []
+        current_width = 0
+        for token in tokenize(paragraph):
+            token_width = metrics.width(token)
+            if current_width + token_width <= max_width:
+                current.append(token)
+                current_width += token_width
+                continue
+
+            if current:
+                push(current, current_width)
+                current, current_width = [], 0
+
+            # 单个单元就超过一行时按字符拆开
+            if token_width > max_width:
+                for ch in token:
+                    ch_width = metrics.glyph(ch)[0]
+                    if current and current_width + ch_width > max_width:
+                        push(current, current_width)
+                        current, current_width = [], 0
+                    current.append(ch)
+                    current_width += ch_width
+            else:
+                current = [token]
+                current_width = token_width
+
+        if current:
+            push(current, current_width)
+
+    return lines, sizes
@@ -4,39 +4,34 @@ from nonebot import on_command
 from .config import *
 from .whitelist import whitelist_rule
 from .function import *
+from .user_store import user_store
 from .text_image_text import generate_image_with_text, send_image_or_text_forward, send_image_or_text
 
 #确定一些事件
 confirm = on_command('confirm', permission=GROUP, priority=1, block=True, rule=whitelist_rule)
 @confirm.handle()
 async def confirm_handle(bot: Bot, event: GroupMessageEvent):
-    # 打开文件
-    data = open_data(full_path)
+    # 打开用户数据
     user_id = str(event.get_user_id())
-
-    #判断是否开辟event事件栏
-    if user_id not in data:
-        data[user_id] = {'event': 'nothing'}
-    elif 'event' not in data[user_id]:
-        data[user_id]['event'] = 'nothing'
+    user = await get_user_async(user_id) or {}
         
-    if data[user_id]['event'] == 'changing_bgcolor':
+    if user.get('event', 'nothing') == 'changing_bgcolor':
         # 处理设置默认颜色或自定义颜色
-        if data[user_id]['temp_bgcolor'] == 'default':
-            if 'bg_color' in data[user_id]:
-                del data[user_id]['bg_color']  # 删除自定义颜色即恢复默认
+        if user['temp_bgcolor'] == 'default':
+            if 'bg_color' in user:
+                del user['bg_color']  # 删除自定义颜色即恢复默认
             message = "背景色已重置为默认颜色"
         else:
-            data[user_id]['bg_color'] = data[user_id]['temp_bgcolor']
-            message = f"更改背景色成功！\n当前背景色号为：#{data[user_id]['bg_color']}"
+            user['bg_color'] = user['temp_bgcolor']
+            message = f"更改背景色成功！\n当前背景色号为：#{user['bg_color']}"
         
         # 清除临时数据
-        del data[user_id]['temp_bgcolor']
-        if 'previous_bgcolor' in data[user_id]:
-            del data[user_id]['previous_bgcolor']
+        del user['temp_bgcolor']
+        if 'previous_bgcolor' in user:
+            del user['previous_bgcolor']
         
-        data[user_id]['event'] = 'nothing'
-        save_data(full_path, data)
+        user['event'] = 'nothing'
+        user_store.mark_dirty(user_id)
         
         await send_image_or_text(user_id, confirm, 
                                f"{message}",
@@ -48,29 +43,24 @@ async def confirm_handle(bot: Bot, event: GroupMessageEvent):
 deny = on_command('deny', permission=GROUP, priority=1, block=True, rule=whitelist_rule)
 @deny.handle()
 async def deny_handle(bot: Bot, event: GroupMessageEvent):
-    # 打开文件
-    data = open_data(full_path)
+    # 打开用户数据
     user_id = str(event.get_user_id())
+    user = await get_user_async(user_id) or {}
     
-    if user_id not in data:
-        data[user_id] = {'event': 'nothing'}
-    else:
-        if 'event' not in data[user_id]:
-            data[user_id]['event'] = 'nothing'
-    if data[user_id]['event'] == 'changing_bgcolor':
+    if user.get('event', 'nothing') == 'changing_bgcolor':
         # 如果有之前设置过的颜色，则回退到那个颜色
-        if 'previous_bgcolor' in data[user_id]:
-            data[user_id]['bg_color'] = data[user_id]['previous_bgcolor']
-            del data[user_id]['previous_bgcolor']
+        if 'previous_bgcolor' in user:
+            user['bg_color'] = user['previous_bgcolor']
+            del user['previous_bgcolor']
             message = "已恢复之前的背景色设置"
         else:
             message = "你取消了更改背景色"
         
         # 清除临时数据
-        if 'temp_bgcolor' in data[user_id]:
-            del data[user_id]['temp_bgcolor']
-        data[user_id]['event'] = 'nothing'
-        save_data(full_path, data)
+        if 'temp_bgcolor' in user:
+            del user['temp_bgcolor']
+        user['event'] = 'nothing'
+        user_store.mark_dirty(user_id)
         
         await send_image_or_text(user_id, deny, message, True, None)
     else:
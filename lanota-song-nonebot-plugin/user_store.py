@@ -0,0 +1,264 @@
+import asyncio
+import copy
+import json
+import os
+import shutil
+import sqlite3
+import threading
+from nonebot.log import logger
+from .config import full_path, user_backend, user_db_path
+
+class JsonUserBackend:
+    """JSON文件后端：整个文件一次读入，写回时整体替换"""
+
+    def __init__(self, path):
+        self.path = path
+        self._disk = {}
+        self._lock = threading.Lock()
+
+    def open(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self._disk = json.load(f)
+        except FileNotFoundError:
+            self._disk = {}
+
+    def load_user(self, user_id):
+        with self._lock:
+            record = self._disk.get(user_id)
+        return copy.deepcopy(record) if record is not None else None
+
+    def save_users(self, records):
+        # 只在更新字典时持锁，写文件期间读取不受影响（写入的记录不会再被修改）
+        with self._lock:
+            self._disk.update(records)
+            snapshot = dict(self._disk)
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, indent=4)
+        os.replace(tmp_path, self.path)
+
+    def backup_to(self, directory):
+        """把数据文件复制到备份目录（文件总是整体替换，直接复制即可）"""
+        if self.path.exists():
+            shutil.copy2(self.path, directory / self.path.name)
+
+    def close(self):
+        pass
+
+class SqliteUserBackend:
+    """SQLite后端（WAL模式）：每个用户一行，按用户读写"""
+
+    def __init__(self, path, json_path=None):
+        self.path = path
+        self.json_path = json_path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def open(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # 首次创建数据库时从旧的JSON文件迁移
+        if not self.path.exists() and self.json_path and self.json_path.exists():
+            self._migrate()
+        self._conn = self._connect(self.path)
+
+    @staticmethod
+    def _connect(path):
+        conn = sqlite3.connect(str(path), check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS users (user_id TEXT PRIMARY KEY, data TEXT NOT NULL)"
+        )
+        conn.commit()
+        return conn
+
+    def _migrate(self):
+        """
+        先迁移到临时数据库，全部写完后再替换到正式路径
+
+        中途失败时正式数据库不存在，下次启动会重新迁移。
+        """
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        sidecars = [tmp_path.with_name(tmp_path.name + suffix) for suffix in ('-wal', '-shm')]
+        for path in [tmp_path, *sidecars]:
+            path.unlink(missing_ok=True)
+        self._conn = self._connect(tmp_path)
+        try:
+            count = migrate_json_to_sqlite(self.json_path, self)
+        finally:
+            self.close()
+        os.replace(tmp_path, self.path)
+        for path in sidecars:
+            path.unlink(missing_ok=True)
+        logger.info(f"已从 {self.json_path} 迁移 {count} 条用户数据到 {self.path}")
+
+    def load_user(self, user_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM users WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_users(self, records):
+        rows = [(user_id, json.dumps(record, ensure_ascii=False)) for user_id, record in records.items()]
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT INTO users (user_id, data) VALUES (?, ?) "
+                    "ON CONFLICT(user_id) DO UPDATE SET data = excluded.data",
+                    rows
+                )
+
+    def backup_to(self, directory):
+        """用SQLite在线备份接口把数据库写入备份目录（不直接复制正在写入的库和WAL文件）"""
+        target = sqlite3.connect(str(directory / self.path.name))
+        try:
+            with self._lock:
+                self._conn.backup(target)
+        finally:
+            target.close()
+
+    def close(self):
+        if self._conn is not None:
+            with self._lock:
+                self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                self._conn.close()
+                self._conn = None
+
+def migrate_json_to_sqlite(json_path, backend):
+    """把UserData.json中的全部用户一次性写入SQLite后端，返回迁移条数"""
+    with open(json_path, 'r', encoding='utf-8') as f:
+        users = json.load(f)
+    backend.save_users({str(user_id): record for user_id, record in users.items()})
+    return len(users)
+
+def create_user_backend(kind):
+    """按配置创建用户数据后端"""
+    if kind == "sqlite":
+        return SqliteUserBackend(user_db_path, json_path=full_path)
+    return JsonUserBackend(full_path)
+
+class UserStore:
+    """
+    用户数据写回缓存
+
+    用到的用户记录常驻内存，命令只修改内存中的记录并标记为脏，
+    由后台任务定时（以及关闭时）把脏记录交给存储后端写回。
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._opened = False
+        self._users = {}
+        self._missing = set()
+        self._dirty = set()
+        self._task = None
+
+    def _ensure_open(self):
+        if self._opened:
+            return
+        with self._lock:
+            if not self._opened:
+                self.backend.open()
+                self._opened = True
+
+    def load(self):
+        """启动时打开存储后端"""
+        self._ensure_open()
+
+    def get_user(self, user_id):
+        """获取用户记录，不存在返回None（返回的字典可直接修改，改完需mark_dirty）"""
+        self._ensure_open()
+        user_id = str(user_id)
+        user = self._users.get(user_id)
+        if user is not None or user_id in self._missing:
+            return user
+        # 不等待写回：脏记录一定还在内存中，不会从后端读到旧数据
+        user = self.backend.load_user(user_id)
+        with self._lock:
+            if user is None:
+                self._missing.add(user_id)
+                return None
+            return self._users.setdefault(user_id, user)
+
+    async def get_user_async(self, user_id):
+        """get_user 的异步版本：记录已在内存中时直接返回，否则在线程中从后端读取"""
+        user_id = str(user_id)
+        if self._opened and (user_id in self._users or user_id in self._missing):
+            return self._users.get(user_id)
+        return await asyncio.to_thread(self.get_user, user_id)
+
+    def ensure_user(self, user_id):
+        """获取用户记录，不存在时创建空记录"""
+        user = self.get_user(user_id)
+        if user is not None:
+            return user
+        with self._lock:
+            self._missing.discard(str(user_id))
+            return self._users.setdefault(str(user_id), {})
+
+    def backup_to(self, directory):
+        """把存储后端的数据写入备份目录（调用前先flush）"""
+        self._ensure_open()
+        self.backend.backup_to(directory)
+
+    def mark_dirty(self, user_id):
+        """标记用户记录已修改，等待写回"""
+        with self._lock:
+            self._dirty.add(str(user_id))
+
+    def _take_dirty(self):
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            return {uid: copy.deepcopy(self._users[uid]) for uid in dirty if uid in self._users}
+
+    def _commit(self, records):
+        try:
+            with self._write_lock:
+                self.backend.save_users(records)
+        except Exception as e:
+            logger.error(f"写回用户数据失败: {e}")
+            with self._lock:
+                self._dirty.update(records)
+
+    def flush(self):
+        """同步写回全部脏记录"""
+        if not self._opened:
+            return
+        records = self._take_dirty()
+        if records:
+            self._commit(records)
+
+    async def flush_async(self):
+        """在线程中写回全部脏记录"""
+        if not self._opened:
+            return
+        records = self._take_dirty()
+        if records:
+            await asyncio.to_thread(self._commit, records)
+
+    async def _flush_loop(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            await self.flush_async()
+
+    def start(self, interval):
+        """启动后台写回任务"""
+        self.load()
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop(interval))
+
+    async def stop(self):
+        """停止后台任务，写回剩余数据并关闭后端"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self.flush()
+        if self._opened:
+            self.backend.close()
+
+# 全局用户数据
+user_store = UserStore(create_user_backend(user_backend))
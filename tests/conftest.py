@@ -0,0 +1,36 @@
+"""
+测试公共设置
+
+插件目录名含连字符，不能直接import，这里把它注册为 lanota_plugin 包（不执行 __init__）。
+config 中的数据路径相对于仓库根目录，测试都在仓库根目录下运行。
+"""
+import importlib
+import importlib.util
+import os
+import sys
+from pathlib import Path
+
+import nonebot
+import pytest
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+PLUGIN_DIR = REPO_ROOT / "lanota-song-nonebot-plugin"
+PACKAGE_NAME = "lanota_plugin"
+
+os.chdir(REPO_ROOT)
+# 插件模块在导入时注册命令，需要先初始化 NoneBot
+nonebot.init(driver="~none")
+if PACKAGE_NAME not in sys.modules:
+    spec = importlib.util.spec_from_file_location(
+        PACKAGE_NAME, PLUGIN_DIR / "__init__.py",
+        submodule_search_locations=[str(PLUGIN_DIR)]
+    )
+    sys.modules[PACKAGE_NAME] = importlib.util.module_from_spec(spec)
+
+def load_module(module_name):
+    """导入插件子模块，如 load_module("function")"""
+    return importlib.import_module(f"{PACKAGE_NAME}.{module_name}")
+
+@pytest.fixture
+def plugin():
+    return load_module
@@ -0,0 +1,24 @@
+import asyncio
+
+def test_cal_batch_with_chart_without_notes(plugin):
+    command = plugin("lanota_command")
+    message = asyncio.run(command._format_cal_batch(["900/300/50/Master/7-5", "100/0/0/whisper/Z-1"]))
+    lines = message.splitlines()
+    assert lines[0] == "共2条成绩:"
+    assert lines[1].startswith("1. ") and "Rating" in lines[1]
+    assert lines[2].startswith("2. 100/0/0/whisper/Z-1: 乐曲[")
+    assert lines[2].endswith("没有whisper难度的数据")
+
+def test_cal_line_rejects_empty_notes(plugin):
+    command = plugin("lanota_command")
+    error, score = asyncio.run(command._parse_cal_line("100/0/0/whisper/Z-1"))
+    assert score is None
+    assert "没有whisper难度的数据" in error
+
+def test_cal_batch_matches_single_line(plugin):
+    command = plugin("lanota_command")
+    function = plugin("function")
+    _, score = asyncio.run(command._parse_cal_line("900/300/50/Master/7-5"))
+    rating = function.calculate_rating(900, 300, 50, score['notes'], score['level'])[0]
+    message = asyncio.run(command._format_cal_batch(["900/300/50/Master/7-5", "1/0/0/1000/16"]))
+    assert f"Rating {rating}" in message.splitlines()[1]
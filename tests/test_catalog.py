@@ -0,0 +1,56 @@
+import asyncio
+import json
+import threading
+
+def make_catalog(plugin, tmp_path):
+    catalog = plugin("catalog")
+    songs_path = tmp_path / "song_list.json"
+    songs_path.write_text(json.dumps([{"chapter": "1-1"}]), encoding="utf-8")
+    song_catalog = catalog.SongCatalog(check_interval=0.02)
+    song_catalog._files = {
+        'songs': (songs_path, list),
+        'aliases': (tmp_path / "song_alias.json", dict),
+        'table': (tmp_path / "song_table.json", dict),
+    }
+    song_catalog.load()
+    return catalog, song_catalog, songs_path
+
+def test_background_check_keeps_disk_off_the_loop(plugin, tmp_path, monkeypatch):
+    catalog, song_catalog, songs_path = make_catalog(plugin, tmp_path)
+    stamp = catalog._file_stamp
+    stat_threads = []
+
+    def record_stamp(path):
+        stat_threads.append(threading.current_thread())
+        return stamp(path)
+
+    monkeypatch.setattr(catalog, "_file_stamp", record_stamp)
+
+    async def scenario():
+        song_catalog.start()
+        try:
+            await asyncio.sleep(0.05)
+            # 事件循环中访问数据只读内存
+            for _ in range(10):
+                assert song_catalog.songs == [{"chapter": "1-1"}]
+                song_catalog.current_version()
+                await song_catalog.refresh_async()
+            version = song_catalog.version
+            songs_path.write_text(json.dumps([{"chapter": "1-1"}, {"chapter": "1-2"}]), encoding="utf-8")
+            for _ in range(50):
+                await asyncio.sleep(0.02)
+                if song_catalog.version != version:
+                    break
+            assert len(song_catalog.songs) == 2
+        finally:
+            song_catalog.stop()
+
+    asyncio.run(scenario())
+    assert stat_threads
+    assert all(t is not threading.main_thread() for t in stat_threads)
+
+def test_sync_access_checks_without_background_task(plugin, tmp_path):
+    _, song_catalog, songs_path = make_catalog(plugin, tmp_path)
+    song_catalog.check_interval = 0
+    songs_path.write_text(json.dumps([]), encoding="utf-8")
+    assert song_catalog.songs == []
@@ -0,0 +1,46 @@
+import copy
+import json
+
+def test_changeset_round_trip(plugin, tmp_path):
+    fandom = plugin("jiaoben.fandom_pachong")
+    catalog = plugin("catalog")
+    before = [
+        {"chapter": "1-1", "title": "A", "bpm": "120", "Trivia": ["x"]},
+        {"chapter": "1-2", "title": "B", "bpm": "150"},
+        {"chapter": "1-3", "title": "C"},
+    ]
+    after = [
+        {"chapter": "1-1", "title": "A", "bpm": "121"},
+        {"chapter": "1-2", "title": "B", "bpm": "150"},
+        {"chapter": "2-1", "title": "D"},
+    ]
+
+    changeset = fandom.build_changeset(before, after)
+    assert changeset["modified"] == {"1-1": {"bpm": "121"}}
+    assert changeset["dropped"] == {"1-1": ["Trivia"]}
+    assert changeset["removed"] == ["1-3"]
+    assert not fandom.changeset_is_empty(changeset)
+
+    songs_path = tmp_path / "song_list.json"
+    songs_path.write_text(json.dumps(before), encoding="utf-8")
+    song_catalog = catalog.SongCatalog()
+    song_catalog._files = {
+        'songs': (songs_path, list),
+        'aliases': (tmp_path / "song_alias.json", dict),
+        'table': (tmp_path / "song_table.json", dict),
+    }
+    song_catalog.load()
+    old_songs = song_catalog._data['songs']
+    old_copy = copy.deepcopy(old_songs)
+    fandom.write_json_atomic(songs_path, after)
+
+    assert song_catalog.apply_changeset(changeset)
+    assert song_catalog._data['songs'] == after
+    # 旧列表中的字典没有被原地修改
+    assert old_songs == old_copy
+
+def test_dropped_only_changeset_is_not_empty(plugin):
+    fandom = plugin("jiaoben.fandom_pachong")
+    changeset = fandom.build_changeset([{"chapter": "1-1", "bpm": "120"}], [{"chapter": "1-1"}])
+    assert changeset["modified"] == {}
+    assert not fandom.changeset_is_empty(changeset)
@@ -0,0 +1,181 @@
+import json
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+import requests
+
+class FakeWikiAdapter(requests.adapters.BaseAdapter):
+    """模拟 MediaWiki api.php：支持标题规范化、重定向，每次响应最多返回 per_response 个页面并给出 continue"""
+
+    def __init__(self, pages, redirects=None, per_response=50):
+        super().__init__()
+        self.pages = pages
+        self.redirects = redirects or {}
+        self.per_response = per_response
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def send(self, request, **kwargs):
+        url = urlsplit(request.url)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        with self._lock:
+            self.requests.append(params)
+        if not url.path.endswith("/api.php"):
+            return self._response(request, b"")
+
+        query = {"normalized": [], "redirects": [], "pages": []}
+        titles = []
+        for name in params["titles"].split("|"):
+            title = name.replace("_", " ")
+            if title != name:
+                query["normalized"].append({"from": name, "to": title})
+            if title in self.redirects:
+                query["redirects"].append({"from": title, "to": self.redirects[title]})
+                title = self.redirects[title]
+            titles.append(title)
+
+        offset = int(params.get("rvcontinue", 0))
+        for title in titles[offset:offset + self.per_response]:
+            if title not in self.pages:
+                query["pages"].append({"title": title, "missing": True})
+                continue
+            revid, content = self.pages[title]
+            page = {"title": title, "lastrevid": revid}
+            if params.get("rvprop") == "content":
+                page["revisions"] = [{"slots": {"main": {"content": content}}}]
+            query["pages"].append(page)
+        body = {"batchcomplete": True, "query": query}
+        if offset + self.per_response < len(titles):
+            body["continue"] = {"rvcontinue": str(offset + self.per_response), "continue": "||"}
+        return self._response(request, json.dumps(body).encode())
+
+    @staticmethod
+    def _response(request, content):
+        response = requests.Response()
+        response.status_code = 200
+        response._content = content
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+    def api_requests(self):
+        return [r for r in self.requests if "titles" in r]
+
+@pytest.fixture
+def fandom(plugin):
+    return plugin("jiaoben.fandom_pachong")
+
+def make_session(fandom, adapter, rate=0):
+    session = fandom.RateLimitedSession(fandom.RateLimiter(rate))
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def song_pages(count):
+    return {f"Song {i}": (1000 + i, f"{{{{Song|Song=Song {i}}}}}") for i in range(count)}
+
+def wiki_url(fandom, name):
+    return f"{fandom.BASE_URL}/wiki/{fandom._title_path(name)}"
+
+def test_fetch_wikitexts_batches_titles(fandom):
+    pages = song_pages(120)
+    adapter = FakeWikiAdapter(pages)
+    session = make_session(fandom, adapter)
+    urls = [wiki_url(fandom, name) for name in pages]
+
+    result = fandom.fetch_wikitexts(session, urls, workers=3)
+
+    batches = [r["titles"].split("|") for r in adapter.api_requests()]
+    assert sorted(len(b) for b in batches) == [20, 50, 50]
+    assert sorted(t for b in batches for t in b) == sorted(fandom._title_path(n) for n in pages)
+    assert len(result) == 120
+    for url, name in zip(urls, pages):
+        assert result[url] == (name, pages[name][1])
+
+def test_query_batch_follows_continue(fandom):
+    pages = song_pages(25)
+    adapter = FakeWikiAdapter(pages, per_response=10)
+    session = make_session(fandom, adapter)
+
+    result = fandom._query_wikitext_batch(session, list(pages))
+
+    requests_made = adapter.api_requests()
+    assert len(requests_made) == 3
+    assert [r.get("rvcontinue") for r in requests_made] == [None, "10", "20"]
+    assert all(r.get("continue") == "||" for r in requests_made[1:])
+    assert {name: content for name, (_, content) in result.items()} == {n: c for n, (_, c) in pages.items()}
+
+def test_query_batch_resolves_normalized_and_redirected_titles(fandom):
+    pages = {"New Title": (7, "{{Song|Song=New Title}}")}
+    adapter = FakeWikiAdapter(pages, redirects={"Old Title": "New Title"})
+    session = make_session(fandom, adapter)
+
+    result = fandom._query_revision_batch(session, ["Old_Title", "Gone"])
+
+    assert result == {"Old_Title": ("New Title", 7)}
+
+def test_fetch_wikitexts_falls_back_for_missing_pages(fandom, monkeypatch):
+    pages = song_pages(3)
+    adapter = FakeWikiAdapter(pages)
+    session = make_session(fandom, adapter)
+    fallback = []
+
+    def fake_fetch_wikitext(session, page_name):
+        fallback.append(page_name)
+        return "{{Song|Song=Elsewhere}}"
+
+    monkeypatch.setattr(fandom, "fetch_wikitext", fake_fetch_wikitext)
+    urls = [wiki_url(fandom, name) for name in [*pages, "Elsewhere"]]
+
+    result = fandom.fetch_wikitexts(session, urls, workers=2)
+
+    assert fallback == ["Elsewhere"]
+    assert result[urls[-1]] == ("Elsewhere", "{{Song|Song=Elsewhere}}")
+    assert len(result) == 4
+
+def test_fetch_revisions_chunks_and_dedupes(fandom):
+    pages = song_pages(60)
+    adapter = FakeWikiAdapter(pages)
+    session = make_session(fandom, adapter)
+
+    result = fandom.fetch_revisions(session, list(pages) + list(pages)[:10] + [""], workers=2)
+
+    assert sorted(len(r["titles"].split("|")) for r in adapter.api_requests()) == [10, 50]
+    assert result == {name: (name, revid) for name, (revid, _) in pages.items()}
+
+def test_rate_limiter_spaces_requests_per_host(fandom):
+    limiter = fandom.RateLimiter(20)
+    start = time.monotonic()
+    for _ in range(4):
+        limiter.wait("a.example")
+    same_host = time.monotonic() - start
+    assert same_host >= 3 * 0.05 - 0.01
+
+    start = time.monotonic()
+    limiter.wait("b.example")
+    assert time.monotonic() - start < 0.04
+
+def test_rate_limited_session_waits_between_requests(fandom):
+    adapter = FakeWikiAdapter(song_pages(1))
+    session = make_session(fandom, adapter, rate=20)
+    start = time.monotonic()
+    threads = [threading.Thread(target=session.get, args=(fandom.API_URL,),
+                                kwargs={"params": {"titles": "Song 0"}}) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(adapter.api_requests()) == 4
+    assert time.monotonic() - start >= 3 * 0.05 - 0.01
+
+def test_rate_limiter_disabled(fandom):
+    limiter = fandom.RateLimiter(0)
+    start = time.monotonic()
+    for _ in range(100):
+        limiter.wait("a.example")
+    assert time.monotonic() - start < 0.05
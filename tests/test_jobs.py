@@ -0,0 +1,19 @@
+import asyncio
+
+def test_named_job_is_forgotten_when_done(plugin):
+    jobs = plugin("jobs")
+    scheduler = jobs.JobScheduler(io_workers=1, cpu_workers=1)
+
+    async def scenario():
+        job, created = scheduler.submit("update", "io", lambda: 42)
+        again, created_again = scheduler.submit("update", "io", lambda: 0)
+        assert created and not created_again and again is job
+        assert await job.wait() == 42
+        await asyncio.sleep(0)
+        assert scheduler.get("update") is None
+        assert "update" not in scheduler._jobs
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        scheduler.shutdown()
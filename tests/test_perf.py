@@ -0,0 +1,43 @@
+import asyncio
+import os
+import threading
+
+def _record_in_worker(name):
+    import lanota_plugin.perf as perf_module
+    perf_module.perf.observe(name, 0.01)
+    return os.getpid()
+
+def test_process_pool_timings_reach_parent(plugin):
+    jobs = plugin("jobs")
+    perf = plugin("perf").perf
+    scheduler = jobs.JobScheduler(io_workers=1, cpu_workers=1, render_limit=2)
+    assert scheduler.use_process_pool("render", 1)
+    try:
+        pid = asyncio.run(scheduler.run("render", _record_in_worker, "test.worker_stage"))
+    finally:
+        scheduler.shutdown()
+    assert pid != os.getpid()
+    assert perf.snapshot()["test.worker_stage"][0] == 1
+
+def test_dump_runs_off_the_event_loop(plugin, tmp_path, monkeypatch):
+    perf_module = plugin("perf")
+    recorder = perf_module.PerfRecorder()
+    recorder.observe("test.stage", 0.002)
+    threads = []
+    dump = recorder.dump
+
+    def record_thread(path):
+        threads.append(threading.current_thread())
+        dump(path)
+
+    monkeypatch.setattr(recorder, "dump", record_thread)
+    path = tmp_path / "perf.prom"
+
+    async def scenario():
+        recorder.start_dump(path, 0.01)
+        await asyncio.sleep(0.05)
+        recorder.stop_dump()
+
+    asyncio.run(scenario())
+    assert threads and all(t is not threading.main_thread() for t in threads)
+    assert 'stage="test.stage"' in path.read_text(encoding="utf-8")
@@ -0,0 +1,136 @@
+import asyncio
+import random
+import time
+
+class FakeRandomFetcher:
+    """离线替身：不访问网络，可模拟延迟与失败"""
+
+    def __init__(self, span, seed=0, delay=0, fail=False):
+        self.span = span
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+        self._rng = random.Random(seed)
+
+    def fetch(self, count):
+        self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        if self.fail:
+            raise ConnectionError("fake random.org unavailable")
+        return [self._rng.randrange(self.span) for _ in range(count)]
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def make_source(plugin, **kwargs):
+    random_source = plugin("random_source")
+    fetcher = FakeRandomFetcher(random_source.RANDOM_SPAN, **kwargs)
+    breaker = random_source.CircuitBreaker(max_failures=2, cooldown=30)
+    source = random_source.TrueRandomSource(fetcher, batch=10, low_water=3, timeout=1, breaker=breaker)
+    return source, fetcher, breaker
+
+def test_breaker_opens_and_closes(plugin, monkeypatch):
+    random_source = plugin("random_source")
+    clock = FakeClock()
+    monkeypatch.setattr(random_source.time, "monotonic", clock)
+    source, fetcher, breaker = make_source(plugin, fail=True)
+
+    async def scenario():
+        assert not await source.refill()
+        assert breaker.allow()
+        assert not await source.refill()
+        # 连续失败达到阈值，熔断期间不再访问
+        assert not breaker.allow()
+        assert not await source.refill()
+        assert fetcher.calls == 2
+
+        # 冷却后放行一次试探，成功则恢复
+        clock.now += 30
+        assert breaker.allow()
+        fetcher.fail = False
+        assert await source.refill()
+        assert fetcher.calls == 3
+        assert breaker.failures == 0 and breaker.opened_at is None
+        assert len(source) == 10
+
+    asyncio.run(scenario())
+
+def test_failed_probe_reopens_breaker(plugin, monkeypatch):
+    random_source = plugin("random_source")
+    clock = FakeClock()
+    monkeypatch.setattr(random_source.time, "monotonic", clock)
+    source, fetcher, breaker = make_source(plugin, fail=True)
+
+    async def scenario():
+        await source.refill()
+        await source.refill()
+        clock.now += 30
+        assert not await source.refill()
+        assert not breaker.allow()
+
+    asyncio.run(scenario())
+
+def test_pool_drains_and_refills(plugin):
+    source, fetcher, _ = make_source(plugin)
+
+    async def scenario():
+        assert await source.refill()
+        assert fetcher.calls == 1
+        # 池高于水位时只从池中取，不触发补充
+        for _ in range(7):
+            assert 1 <= source.randint(1, 6) <= 6
+        assert len(source) == 3
+        assert source._refill_task is None
+        # 降到水位后取数时在后台补充一批
+        source.randint(1, 6)
+        await source._refill_task
+        assert fetcher.calls == 2
+        assert len(source) == 2 + 10
+
+    asyncio.run(scenario())
+
+def test_only_one_refill_in_flight(plugin):
+    source, fetcher, _ = make_source(plugin, delay=0.05)
+
+    async def scenario():
+        for _ in range(5):
+            source.randint(1, 100)
+        await source._refill_task
+        assert fetcher.calls == 1
+
+    asyncio.run(scenario())
+
+def test_falls_back_to_local_random(plugin, monkeypatch):
+    random_source = plugin("random_source")
+    clock = FakeClock()
+    monkeypatch.setattr(random_source.time, "monotonic", clock)
+    source, fetcher, breaker = make_source(plugin, fail=True)
+
+    async def scenario():
+        await source.refill()
+        await source.refill()
+        # 熔断中且池为空：直接用本地随机数，不排队访问网络
+        values = [source.randint(1, 6) for _ in range(50)]
+        assert all(1 <= v <= 6 for v in values)
+        assert source._refill_task is None
+        assert fetcher.calls == 2
+
+    asyncio.run(scenario())
+
+def test_slow_fetch_times_out(plugin):
+    random_source = plugin("random_source")
+    fetcher = FakeRandomFetcher(random_source.RANDOM_SPAN, delay=0.3)
+    breaker = random_source.CircuitBreaker(max_failures=1, cooldown=30)
+    source = random_source.TrueRandomSource(fetcher, batch=10, low_water=3, timeout=0.05, breaker=breaker)
+
+    async def scenario():
+        assert not await source.refill()
+        assert not breaker.allow()
+        assert len(source) == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,12 @@
+def test_sprite_atlas_evicts_least_recently_used(plugin):
+    tit = plugin("text_image_text")
+    atlas = tit.SpriteAtlas(limit=3)
+    color, outline = (255, 255, 255), (0, 0, 0)
+    first = atlas.get("a", color, outline)
+    atlas.get("b", color, outline)
+    atlas.get("c", color, outline)
+    # 命中后移到最近使用端，不会被淘汰
+    assert atlas.get("a", color, outline) is first
+    atlas.get("d", color, outline)
+    assert list(atlas._items) == [("c", color, outline), ("a", color, outline), ("d", color, outline)]
+    assert atlas.get("a", color, outline) is first
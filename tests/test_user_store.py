@@ -0,0 +1,100 @@
+import json
+import threading
+
+import pytest
+
+def test_get_user_does_not_wait_for_flush(plugin, tmp_path):
+    user_store = plugin("user_store")
+    backend = user_store.JsonUserBackend(tmp_path / "UserData.json")
+    store = user_store.UserStore(backend)
+    store.ensure_user("1")["bg_color"] = "#000000"
+    store.mark_dirty("1")
+    store.flush()
+
+    reader = user_store.UserStore(backend)
+    result = {}
+    # 模拟写回进行中
+    with store._write_lock, reader._write_lock:
+        thread = threading.Thread(target=lambda: result.update(user=reader.get_user("1")))
+        thread.start()
+        thread.join(timeout=2)
+        assert not thread.is_alive()
+    assert result["user"] == {"bg_color": "#000000"}
+
+def test_sqlite_migration_is_retried_after_failure(plugin, tmp_path, monkeypatch):
+    user_store = plugin("user_store")
+    json_path = tmp_path / "UserData.json"
+    db_path = tmp_path / "users.db"
+    json_path.write_text(json.dumps({"1": {"points": 1}, "2": {"points": 2}}), encoding="utf-8")
+
+    def fail(self, records):
+        raise OSError("disk full")
+
+    backend = user_store.SqliteUserBackend(db_path, json_path=json_path)
+    with monkeypatch.context() as m:
+        m.setattr(user_store.SqliteUserBackend, "save_users", fail)
+        with pytest.raises(OSError):
+            backend.open()
+    assert not db_path.exists()
+
+    backend = user_store.SqliteUserBackend(db_path, json_path=json_path)
+    backend.open()
+    try:
+        assert backend.load_user("1") == {"points": 1}
+        assert backend.load_user("2") == {"points": 2}
+    finally:
+        backend.close()
+    assert not (tmp_path / "users.db.tmp").exists()
+
+def test_sqlite_does_not_migrate_again(plugin, tmp_path):
+    user_store = plugin("user_store")
+    json_path = tmp_path / "UserData.json"
+    db_path = tmp_path / "users.db"
+    json_path.write_text(json.dumps({"1": {"points": 1}}), encoding="utf-8")
+
+    backend = user_store.SqliteUserBackend(db_path, json_path=json_path)
+    backend.open()
+    backend.save_users({"1": {"points": 5}})
+    backend.close()
+
+    backend = user_store.SqliteUserBackend(db_path, json_path=json_path)
+    backend.open()
+    try:
+        assert backend.load_user("1") == {"points": 5}
+    finally:
+        backend.close()
+
+def test_sqlite_backup_is_consistent(plugin, tmp_path):
+    user_store = plugin("user_store")
+    db_path = tmp_path / "UserData.db"
+    backend = user_store.SqliteUserBackend(db_path)
+    store = user_store.UserStore(backend)
+    for i in range(100):
+        store.ensure_user(str(i))["points"] = i
+        store.mark_dirty(str(i))
+    store.flush()
+    # 数据还在WAL中，未合并到主库文件
+    assert (tmp_path / "UserData.db-wal").stat().st_size > 0
+
+    backup_dir = tmp_path / "backup"
+    backup_dir.mkdir()
+    store.backup_to(backup_dir)
+    backend.close()
+
+    copy = user_store.SqliteUserBackend(backup_dir / "UserData.db")
+    copy.open()
+    try:
+        assert copy.load_user("99") == {"points": 99}
+    finally:
+        copy.close()
+
+def test_json_backup_copies_file(plugin, tmp_path):
+    user_store = plugin("user_store")
+    store = user_store.UserStore(user_store.JsonUserBackend(tmp_path / "UserData.json"))
+    store.ensure_user("1")["points"] = 1
+    store.mark_dirty("1")
+    store.flush()
+    backup_dir = tmp_path / "backup"
+    backup_dir.mkdir()
+    store.backup_to(backup_dir)
+    assert json.loads((backup_dir / "UserData.json").read_text(encoding="utf-8")) == {"1": {"points": 1}}